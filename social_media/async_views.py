@@ -0,0 +1,208 @@
+import abc
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.http import Http404, HttpResponseBase, HttpResponseRedirect
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from social_media import timeline
+from social_media.pagination import TimelinePagination
+from social_media.serializers import ViewerRelationMixin
+from social_media.views import PostViewSet, ProfileViewSet
+
+
+async def represent(serializer, items) -> list:
+    """
+    Serialize already loaded items, looking up the viewer's relations
+    with the async ORM first so that no query runs while serializing.
+    """
+    if isinstance(serializer, ViewerRelationMixin):
+        serializer.viewer_relations = await serializer.aget_viewer_relations(
+            items
+        )
+    return [serializer.to_representation(item) for item in items]
+
+
+class AsyncReadView(abc.ABC):
+    """
+    Serves GET requests of a viewset route natively under ASGI.
+
+    The viewset still authenticates and authorizes the request with its
+    own authentication and permission classes, builds the queryset,
+    serializer and paginator and renders the response, so behaviour and
+    output are the same as on the sync path; only the queries run
+    through the async ORM. Requests with other methods, or asking for
+    the browsable API, are handed to the regular viewset view.
+    """
+
+    viewset = None
+    action = None
+    # Router method mapping, used for requests that are not served here.
+    actions = None
+
+    @classmethod
+    def as_view(cls):
+        fallback = sync_to_async(cls.viewset.as_view(cls.actions))
+
+        async def view(request, *args, **kwargs):
+            if request.method == "GET":
+                response = await cls().dispatch(request, *args, **kwargs)
+                if response is not None:
+                    return response
+            return await fallback(request, *args, **kwargs)
+
+        # Not cls/actions: DRF and drf-spectacular would take the view for
+        # an APIView.
+        view.metrics_names = {
+            method: f"{cls.viewset.__name__}.{action}"
+            for method, action in cls.actions.items()
+        }
+        return csrf_exempt(view)
+
+    async def dispatch(self, request, *args, **kwargs):
+        """
+        Mirror APIView.dispatch with async authentication and handler.
+        Returns None if the request should go to the sync view instead.
+        """
+        view = self.viewset(
+            args=args,
+            kwargs=kwargs,
+            format_kwarg=None,
+            action=self.action,
+            action_map=self.actions,
+        )
+        request = view.initialize_request(request, *args, **kwargs)
+        view.request = request
+        view.headers = view.default_response_headers
+
+        try:
+            await self.authenticate(request)
+            view.initial(request, *args, **kwargs)
+            if not isinstance(request.accepted_renderer, JSONRenderer):
+                return None
+            response = await self.get(view, request)
+            if not isinstance(response, HttpResponseBase):
+                response = Response(response)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+
+        return view.finalize_response(request, response, *args, **kwargs)
+
+    @staticmethod
+    async def authenticate(request):
+        """
+        Mirror Request._authenticate with the viewset's authenticators.
+        Those with an aauthenticate method, returning (user, auth) or
+        None like authenticate, are awaited; the others run in a thread.
+        """
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, "aauthenticate"):
+                    result = await authenticator.aauthenticate(
+                        request._request
+                    )
+                else:
+                    result = await sync_to_async(authenticator.authenticate)(
+                        request
+                    )
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if result is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = result
+                return
+        request._not_authenticated()
+
+    @abc.abstractmethod
+    async def get(self, view, request):
+        """
+        Return the response data, or a response, for a GET request that
+        the viewset has authenticated and authorized.
+        """
+
+
+class AsyncListView(AsyncReadView):
+    action = "list"
+    actions = {"get": "list", "post": "create"}
+
+    async def get(self, view, request):
+        queryset = view.filter_queryset(view.get_queryset())
+        page = await view.paginator.apaginate_queryset(
+            queryset, request, view=view
+        )
+        serializer = view.get_serializer_class()(
+            context=view.get_serializer_context()
+        )
+        data = await represent(serializer, page)
+        return view.paginator.get_paginated_response(data).data
+
+
+class AsyncRetrieveView(AsyncReadView):
+    action = "retrieve"
+    actions = {
+        "get": "retrieve",
+        "put": "update",
+        "patch": "partial_update",
+        "delete": "destroy",
+    }
+
+    async def get(self, view, request):
+        queryset = view.filter_queryset(view.get_queryset())
+        lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+        try:
+            instance = await queryset.aget(
+                **{view.lookup_field: view.kwargs[lookup_url_kwarg]}
+            )
+        except (ObjectDoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404(
+                f"No {queryset.model._meta.object_name} matches the "
+                "given query."
+            )
+        view.check_object_permissions(request, instance)
+
+        serializer = view.get_serializer_class()(
+            context=view.get_serializer_context()
+        )
+        return (await represent(serializer, [instance]))[0]
+
+
+class PostListView(AsyncListView):
+    viewset = PostViewSet
+
+
+class PostDetailView(AsyncRetrieveView):
+    viewset = PostViewSet
+
+
+class ProfileListView(AsyncListView):
+    viewset = ProfileViewSet
+
+
+class ProfileDetailView(AsyncRetrieveView):
+    viewset = ProfileViewSet
+
+
+class FollowingPostsView(AsyncReadView):
+    viewset = PostViewSet
+    action = "following_posts"
+    actions = {"get": "following_posts", "post": "following_posts"}
+
+    async def get(self, view, request):
+        if not request.user.is_authenticated:
+            return HttpResponseRedirect(reverse("user:create_user"))
+
+        entries = view.get_serializer_class().setup_eager_loading(
+            await timeline.aget_feed(request.user.profile), prefix="post__"
+        )
+        paginator = TimelinePagination()
+        page = await paginator.apaginate_queryset(entries, request, view=view)
+        serializer = view.get_serializer_class()(
+            context=view.get_serializer_context()
+        )
+        data = await represent(serializer, [entry.post for entry in page])
+        return paginator.get_paginated_response(data).data
@@ -0,0 +1,224 @@
+"""
+Micro-benchmarks of the serializers and permissions on the hot paths.
+
+Fixtures are unsaved model instances whose relations are filled in the
+way select_related and prefetch_related would, so the benchmarks time
+Python work only and never touch the database.
+"""
+
+import datetime
+import statistics
+import subprocess
+import time
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from social_media.models import Comment, Like, Post, Profile, Tag
+from social_media.permissions import PostPermission, ProfilePermission
+from social_media.serializers import (
+    FollowSerializer,
+    PostListSerializer,
+    PostRetrieveSerializer,
+    ProfileListSerializer,
+)
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _prefetched(instance, name: str, rows: list) -> None:
+    """
+    Store rows as the prefetched result of the related manager name,
+    the way prefetch_related_objects does.
+    """
+    queryset = getattr(instance, name).get_queryset()
+    queryset._result_cache = rows
+    queryset._prefetch_done = True
+    instance.__dict__.setdefault("_prefetched_objects_cache", {})[
+        name
+    ] = queryset
+
+
+class Fixtures:
+    """
+    size profiles and as many posts, each post with tags tags, likes
+    likes and comments preview comments.
+    """
+
+    def __init__(
+        self, size: int, tags: int = 3, likes: int = 10, comments: int = 3
+    ):
+        user_model = get_user_model()
+        now = timezone.now()
+        self.profiles = []
+        for number in range(1, size + 1):
+            user = user_model(id=number, email=f"user{number}@example.com")
+            self.profiles.append(
+                Profile(
+                    id=number,
+                    user=user,
+                    username=f"user{number}",
+                    first_name="First",
+                    last_name="Last",
+                    followers_count=number,
+                    following_count=number,
+                    posts_count=1,
+                )
+            )
+        tag_rows = [
+            Tag(id=number, name=f"tag{number}") for number in range(tags)
+        ]
+
+        self.posts = []
+        for number, author in enumerate(self.profiles, start=1):
+            post = Post(
+                id=number,
+                author=author,
+                post_content="Lorem ipsum dolor sit amet " * 8,
+                created_at=now - datetime.timedelta(minutes=number),
+                likes_count=likes,
+                comments_count=comments,
+            )
+            _prefetched(post, "tags", tag_rows)
+            _prefetched(
+                post,
+                "likes",
+                [
+                    Like(
+                        id=number * likes + index,
+                        post=post,
+                        user=self.profiles[index % size],
+                    )
+                    for index in range(likes)
+                ],
+            )
+            post.comment_preview = [
+                Comment(
+                    id=number * comments + index,
+                    post=post,
+                    author=self.profiles[index % size],
+                    content="Nice post!",
+                    created_at=now,
+                )
+                for index in range(comments)
+            ]
+            self.posts.append(post)
+
+        self.viewer = self.profiles[0]
+        factory = APIRequestFactory()
+        self.request = Request(factory.get("/"))
+        self.write_request = Request(factory.patch("/"))
+        self.write_request.user = self.viewer.user
+
+
+def cases(fixtures: Fixtures) -> dict:
+    """
+    Return {name: (callable, number of items it handles)}.
+
+    Serializers see an anonymous viewer, as looking up the viewer's
+    likes and follows takes a query.
+    """
+    context = {"request": fixtures.request}
+    posts = fixtures.posts
+    profiles = fixtures.profiles
+    follow_attrs = [
+        {"follower": fixtures.viewer, "following": profile}
+        for profile in profiles
+        if profile is not fixtures.viewer
+    ]
+    follow = FollowSerializer(context=context)
+    post_permission = PostPermission()
+    profile_permission = ProfilePermission()
+    request = fixtures.write_request
+
+    def validate_follows():
+        for attrs in follow_attrs:
+            follow.validate(attrs)
+
+    def check_post_permissions():
+        for post in posts:
+            post_permission.has_permission(request, None)
+            post_permission.has_object_permission(request, None, post)
+
+    def check_profile_permissions():
+        for profile in profiles:
+            profile_permission.has_permission(request, None)
+            profile_permission.has_object_permission(request, None, profile)
+
+    return {
+        "post_list": (
+            lambda: PostListSerializer(posts, many=True, context=context).data,
+            len(posts),
+        ),
+        "post_retrieve": (
+            lambda: PostRetrieveSerializer(
+                posts, many=True, context=context
+            ).data,
+            len(posts),
+        ),
+        "profile_list": (
+            lambda: ProfileListSerializer(
+                profiles, many=True, context=context
+            ).data,
+            len(profiles),
+        ),
+        "follow_validate": (validate_follows, len(follow_attrs)),
+        "post_permission": (check_post_permissions, len(posts)),
+        "profile_permission": (check_profile_permissions, len(profiles)),
+    }
+
+
+def measure(function, repeat: int, min_time: float = 0.2) -> list:
+    """
+    Return the seconds per call of repeat runs, each long enough to last
+    at least min_time.
+    """
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / 10:
+            break
+        number *= 10
+    number = max(1, round(number * min_time / max(elapsed, 1e-9)))
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - started) / number)
+    return timings
+
+
+def run(fixtures: Fixtures, names=None, repeat=5, min_time=0.2) -> dict:
+    """
+    Time the cases and return {name: result} in microseconds.
+    """
+    results = {}
+    for name, (function, items) in cases(fixtures).items():
+        if names and name not in names:
+            continue
+        timings = measure(function, repeat, min_time)
+        median = statistics.median(timings)
+        results[name] = {
+            "items": items,
+            "median_us": round(median * 1e6, 2),
+            "min_us": round(min(timings) * 1e6, 2),
+            "per_item_us": round(median * 1e6 / max(items, 1), 3),
+        }
+    return results
@@ -0,0 +1,115 @@
+import datetime
+import posixpath
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Now
+from django.utils import timezone
+
+from social_media.models import MediaBlob
+from social_media.storage import media_storage
+
+
+def adjust(acquired=(), released=()) -> None:
+    """
+    Count references to stored files: one per name in acquired, minus
+    one per name in released. Names appearing in both cancel out.
+    """
+    changes = Counter(name for name in acquired if name)
+    changes.subtract(name for name in released if name)
+
+    by_delta = {}
+    for name, delta in changes.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(name)
+    if not by_delta:
+        return
+
+    with transaction.atomic():
+        MediaBlob.objects.bulk_create(
+            [
+                MediaBlob(name=name)
+                for name, delta in changes.items()
+                if delta > 0
+            ],
+            ignore_conflicts=True,
+        )
+        for delta, names in by_delta.items():
+            MediaBlob.objects.filter(name__in=names).update(
+                refcount=Greatest(F("refcount") + delta, Value(0)),
+                updated_at=Now(),
+            )
+
+
+def reconcile(counts: Counter) -> int:
+    """
+    Set reference counts to counts, as computed by images.referenced(),
+    e.g. after bulk writes that bypass model signals. Returns the number
+    of repaired blobs.
+    """
+    repaired = 0
+    with transaction.atomic():
+        stored = dict(MediaBlob.objects.values_list("name", "refcount"))
+        MediaBlob.objects.bulk_create(
+            [MediaBlob(name=name) for name in counts if name not in stored]
+        )
+        by_count = {}
+        for name in set(counts) | set(stored):
+            if counts[name] != stored.get(name):
+                by_count.setdefault(counts[name], []).append(name)
+        for count, names in by_count.items():
+            repaired += MediaBlob.objects.filter(name__in=names).update(
+                refcount=count, updated_at=Now()
+            )
+    return repaired
+
+
+def collect_garbage(grace: datetime.timedelta) -> int:
+    """
+    Delete stored files nobody has referred to for at least grace.
+
+    The grace period keeps files that are being uploaded, or reused by
+    an upload of the same content, until their owner has been saved.
+    Returns the number of deleted files.
+    """
+    storage = media_storage()
+    cutoff = timezone.now() - grace
+    deleted = 0
+
+    unused = MediaBlob.objects.filter(refcount=0, updated_at__lt=cutoff)
+    for name in list(unused.values_list("name", flat=True)):
+        exists = storage.exists(name)
+        if exists and storage.get_modified_time(name) >= cutoff:
+            continue
+        # Skip blobs that gained a reference in the meantime.
+        if MediaBlob.objects.filter(name=name, refcount=0).delete()[0]:
+            if exists:
+                storage.delete(name)
+                deleted += 1
+
+    # Files without a row: never referenced, e.g. variants of an image
+    # replaced while it was processed, or interrupted uploads.
+    for names in _walk(storage, storage.directory):
+        known = set(
+            MediaBlob.objects.filter(name__in=names).values_list(
+                "name", flat=True
+            )
+        )
+        for name in names:
+            if name not in known and storage.get_modified_time(name) < cutoff:
+                storage.delete(name)
+                deleted += 1
+    return deleted
+
+
+def _walk(storage, directory):
+    """
+    Yield the lists of file names below directory, one per directory.
+    """
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    yield [posixpath.join(directory, name) for name in files]
+    for name in directories:
+        yield from _walk(storage, posixpath.join(directory, name))
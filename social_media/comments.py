@@ -0,0 +1,86 @@
+from django.db import transaction
+from django.db.models import Prefetch
+
+from social_media import counters
+from social_media.models import Comment, Post, Profile
+
+# A path holds one fixed-width base-36 segment per level, so comparing
+# paths as strings orders a thread depth first.
+PATH_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+PATH_STEP = 7
+# Deepest level a reply can be nested at; deeper replies are attached
+# to the ancestor at this level.
+MAX_DEPTH = Comment._meta.get_field("path").max_length // PATH_STEP - 1
+# Number of top-level comments embedded in the post detail.
+PREVIEW_SIZE = 3
+
+
+def segment(comment_id: int) -> str:
+    digits = ""
+    while comment_id:
+        comment_id, digit = divmod(comment_id, len(PATH_DIGITS))
+        digits = PATH_DIGITS[digit] + digits
+    return digits.rjust(PATH_STEP, "0")
+
+
+def depth(comment: Comment) -> int:
+    """
+    Return 0 for top-level comments, 1 for replies to them, and so on.
+    """
+    return len(comment.path) // PATH_STEP - 1
+
+
+def reply_to(parent_path: str) -> tuple:
+    """
+    Return the path prefix and parent id of a reply to the comment at
+    parent_path.
+    """
+    prefix = parent_path[: MAX_DEPTH * PATH_STEP]
+    return prefix, int(prefix[-PATH_STEP:], len(PATH_DIGITS))
+
+
+def create(
+    post: Post, author: Profile, content: str, parent: Comment = None
+) -> Comment:
+    """
+    Add a comment to post, as a reply to parent if given.
+    """
+    prefix, parent_id = "", None
+    if parent is not None:
+        prefix, parent_id = reply_to(parent.path)
+
+    with transaction.atomic():
+        comment = Comment.objects.create(
+            post=post, author=author, content=content, parent_id=parent_id
+        )
+        # The path ends with the id, which is only known after INSERT.
+        comment.path = prefix + segment(comment.id)
+        Comment.objects.filter(pk=comment.pk).update(path=comment.path)
+        counters.adjust(Post, post.id, comments_count=1)
+    return comment
+
+
+def subtree(queryset, comment: Comment):
+    """
+    Filter queryset to comment and all its replies, at any depth, as a
+    range of paths that the (post, path) index serves directly.
+    """
+    return queryset.filter(
+        post_id=comment.post_id,
+        path__gte=comment.path,
+        path__lt=comment.path + "~",
+    )
+
+
+def preview(prefix: str = "") -> Prefetch:
+    """
+    Prefetch the latest PREVIEW_SIZE top-level comments of posts into
+    their `comment_preview` attribute.
+    """
+    return Prefetch(
+        prefix + "comments",
+        queryset=Comment.objects.filter(parent=None)
+        .select_related("author")
+        .order_by("-created_at", "-id")[:PREVIEW_SIZE],
+        to_attr="comment_preview",
+    )
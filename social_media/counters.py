@@ -0,0 +1,88 @@
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from social_media.models import Comment, Follow, Like, Post
+
+
+def adjust(model, pk: int, **deltas: int) -> None:
+    """
+    Atomically add deltas to counter columns of a single row,
+    e.g. adjust(Post, post.id, likes_count=1).
+
+    Counters never go below zero even if they have drifted.
+    """
+    adjust_many(model, [pk], **deltas)
+
+
+def adjust_many(model, pks, **deltas: int) -> None:
+    """
+    Like adjust, for several rows at once with a single UPDATE.
+    """
+    model.objects.filter(pk__in=pks).update(
+        **{
+            field: Greatest(F(field) + delta, Value(0))
+            for field, delta in deltas.items()
+        }
+    )
+
+
+def _count(queryset, field: str):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        Value(0),
+    )
+
+
+def post_counts() -> dict:
+    return {
+        "likes_count": _count(Like.objects.all(), "post"),
+        "comments_count": _count(Comment.objects.all(), "post"),
+    }
+
+
+def profile_counts() -> dict:
+    return {
+        "followers_count": _count(Follow.objects.all(), "following"),
+        "following_count": _count(Follow.objects.all(), "follower"),
+        "posts_count": _count(Post.objects.all(), "author"),
+    }
+
+
+def _reconcile(queryset, counts: dict) -> int:
+    annotations = {f"true_{field}": value for field, value in counts.items()}
+    drifted = Q()
+    for field in counts:
+        drifted |= ~Q(**{field: F(f"true_{field}")})
+
+    pks = list(
+        queryset.annotate(**annotations)
+        .filter(drifted)
+        .values_list("pk", flat=True)
+    )
+    if pks:
+        queryset.model.objects.filter(pk__in=pks).update(**counts)
+    return len(pks)
+
+
+def reconcile_posts(queryset) -> int:
+    """
+    Recompute like and comment counters for the given posts.
+
+    Only rows whose stored counters differ from the source tables are
+    written. Returns the number of repaired posts.
+    """
+    return _reconcile(queryset, post_counts())
+
+
+def reconcile_profiles(queryset) -> int:
+    """
+    Recompute follower, following and post counters for the given
+    profiles. Returns the number of repaired profiles.
+    """
+    return _reconcile(queryset, profile_counts())
@@ -0,0 +1,147 @@
+"""
+Synthetic data with the skew of real social networks, as records in the
+format of social_media.transfer.
+
+Popularity follows a power law: a few profiles get most followers, a
+few posts most likes and comments, a few tags most uses.
+"""
+
+import datetime
+import itertools
+import random
+
+from django.db.models import Max
+from django.utils import timezone
+
+from social_media.models import Comment, Post
+
+WORDS = (
+    "coffee morning city travel music weekend friends sunset project "
+    "garden book movie river train rain summer mountain kitchen code "
+    "coast market winter photo evening concert dinner street bike"
+).split()
+# Share of comments that reply to an earlier comment on the same post.
+REPLY_SHARE = 0.4
+
+
+def zipf_weights(size: int, exponent: float) -> list:
+    """
+    Cumulative weights ranking size items by a Zipf law, for
+    random.choices(cum_weights=...).
+    """
+    return list(
+        itertools.accumulate(1 / rank**exponent for rank in range(1, size + 1))
+    )
+
+
+def generate(
+    profiles: int,
+    posts: int,
+    follows: int,
+    likes: int,
+    comments: int,
+    tags: int = 100,
+    exponent: float = 1.1,
+    prefix: str = "user",
+    seed: int = 0,
+    days: int = 30,
+):
+    """
+    Yield profile, post, follow, like and comment records, in this order.
+
+    follows, likes and comments are averages per profile; each profile
+    draws its count from an exponential distribution around them.
+    Posts and comments are numbered after the largest existing ids.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    names = [f"{prefix}{number}" for number in range(profiles)]
+    # Popularity ranks are shuffled so that they do not follow creation
+    # order.
+    popular = names[:]
+    rng.shuffle(popular)
+    profile_weights = zipf_weights(profiles, exponent)
+    tag_names = [f"{rng.choice(WORDS)}{number}" for number in range(tags)]
+    tag_weights = zipf_weights(tags, exponent)
+
+    def moment():
+        return now - datetime.timedelta(seconds=rng.uniform(0, days * 86400))
+
+    def count(mean):
+        return min(int(rng.expovariate(1 / mean)) if mean else 0, profiles)
+
+    for name in names:
+        yield {
+            "type": "profile",
+            "username": name,
+            "email": f"{name}@example.com",
+            "password": "!",
+            "first_name": name.capitalize(),
+            "last_name": rng.choice(WORDS).capitalize(),
+            "bio": " ".join(rng.choices(WORDS, k=8)),
+        }
+
+    first_post = (Post.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+    authors = rng.choices(popular, cum_weights=profile_weights, k=posts)
+    for number, author in enumerate(authors, start=first_post):
+        yield {
+            "type": "post",
+            "id": number,
+            "author": author,
+            "post_content": " ".join(rng.choices(WORDS, k=rng.randint(5, 30))),
+            "created_at": moment().isoformat(),
+            "tags": sorted(
+                set(
+                    rng.choices(
+                        tag_names,
+                        cum_weights=tag_weights,
+                        k=rng.randint(0, 3),
+                    )
+                )
+            ),
+        }
+
+    for name in names:
+        for followed in set(
+            rng.choices(popular, cum_weights=profile_weights, k=count(follows))
+        ) - {name}:
+            yield {
+                "type": "follow",
+                "follower": name,
+                "following": followed,
+                "followed_at": moment().isoformat(),
+            }
+
+    post_ids = list(range(first_post, first_post + posts))
+    # Posts keep the popularity of their rank, not of their author.
+    rng.shuffle(post_ids)
+    post_weights = zipf_weights(posts, exponent)
+    if posts:
+        for name in names:
+            for post_id in set(
+                rng.choices(post_ids, cum_weights=post_weights, k=count(likes))
+            ):
+                yield {"type": "like", "post": post_id, "user": name}
+
+    next_comment = (Comment.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+    if posts:
+        threads = {}
+        for name in names:
+            for post_id in rng.choices(
+                post_ids, cum_weights=post_weights, k=count(comments)
+            ):
+                earlier = threads.setdefault(post_id, [])
+                parent = None
+                if earlier and rng.random() < REPLY_SHARE:
+                    parent = rng.choice(earlier)
+                earlier.append(next_comment)
+                yield {
+                    "type": "comment",
+                    "id": next_comment,
+                    "post": post_id,
+                    "author": name,
+                    "parent": parent,
+                    "content": " ".join(rng.choices(WORDS, k=12)),
+                    "created_at": moment().isoformat(),
+                }
+                next_comment += 1
@@ -0,0 +1,305 @@
+import bisect
+import logging
+import threading
+import time
+from array import array
+from collections import Counter
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection
+from django.dispatch import receiver
+
+from social_media.models import Follow
+
+logger = logging.getLogger(__name__)
+
+# Number of edges read from the database per query while loading.
+LOAD_BATCH_SIZE = 100_000
+
+
+class Adjacency:
+    """
+    Neighbour lists of a directed graph in compressed sparse row form:
+    the sorted neighbours of node n are targets[offsets[n]:offsets[n + 1]].
+
+    Node ids are used as indexes, which suits auto-incremented ids.
+    Changes made after loading are kept in small per-node overlays
+    until the next reload.
+    """
+
+    def __init__(self, pairs):
+        pairs = sorted(pairs)
+        size = pairs[-1][0] + 2 if pairs else 1
+        largest = max((target for _, target in pairs), default=0)
+
+        self.offsets = array(_typecode(len(pairs)), [0]) * size
+        for node, _ in pairs:
+            self.offsets[node + 1] += 1
+        for node in range(1, size):
+            self.offsets[node] += self.offsets[node - 1]
+        self.targets = array(
+            _typecode(largest), (target for _, target in pairs)
+        )
+        self.added = {}
+        self.removed = {}
+
+    def _base(self, node):
+        if node + 1 >= len(self.offsets):
+            return 0, 0
+        return self.offsets[node], self.offsets[node + 1]
+
+    def _in_base(self, node, target) -> bool:
+        start, end = self._base(node)
+        index = bisect.bisect_left(self.targets, target, start, end)
+        return index < end and self.targets[index] == target
+
+    def has(self, node, target) -> bool:
+        if target in self.added.get(node, ()):
+            return True
+        if target in self.removed.get(node, ()):
+            return False
+        return self._in_base(node, target)
+
+    def iter_neighbours(self, node):
+        start, end = self._base(node)
+        removed = self.removed.get(node, ())
+        for index in range(start, end):
+            target = self.targets[index]
+            if target not in removed:
+                yield target
+        yield from self.added.get(node, ())
+
+    def common(self, node, other, other_node) -> list:
+        """
+        Return the sorted neighbours of node that are also neighbours
+        of other_node in other.
+
+        The smaller of the two lists is walked and each of its entries
+        looked up in the other by bisection, so a profile with millions
+        of followers costs no more than the other side allows.
+        """
+        small, small_node = self, node
+        large, large_node = other, other_node
+        if small.degree(small_node) > large.degree(large_node):
+            small, small_node = other, other_node
+            large, large_node = self, node
+        return sorted(
+            target
+            for target in small.iter_neighbours(small_node)
+            if large.has(large_node, target)
+        )
+
+    def neighbours(self, node) -> set:
+        start, end = self._base(node)
+        result = set(self.targets[start:end])
+        result -= self.removed.get(node, set())
+        result |= self.added.get(node, set())
+        return result
+
+    def degree(self, node) -> int:
+        start, end = self._base(node)
+        return (
+            end
+            - start
+            - len(self.removed.get(node, ()))
+            + len(self.added.get(node, ()))
+        )
+
+    def add(self, node, target) -> None:
+        if self._in_base(node, target):
+            self.removed.get(node, set()).discard(target)
+        else:
+            self.added.setdefault(node, set()).add(target)
+
+    def remove(self, node, target) -> None:
+        if self._in_base(node, target):
+            self.removed.setdefault(node, set()).add(target)
+        else:
+            self.added.get(node, set()).discard(target)
+
+
+def _typecode(largest: int) -> str:
+    return "i" if largest < 2**31 else "q"
+
+
+class FollowGraph:
+    """
+    The follow graph in both directions, answering neighbourhood
+    queries without touching the database.
+    """
+
+    def __init__(self, edges):
+        edges = list(edges)
+        self.following = Adjacency(edges)
+        self.followers = Adjacency((b, a) for a, b in edges)
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load(cls):
+        edges = []
+        last_id = 0
+        while True:
+            batch = list(
+                Follow.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "follower_id", "following_id")[
+                    :LOAD_BATCH_SIZE
+                ]
+            )
+            if not batch:
+                return cls(edges)
+            edges.extend((a, b) for _, a, b in batch)
+            last_id = batch[-1][0]
+
+    def add(self, follower_id: int, following_id: int) -> None:
+        self.following.add(follower_id, following_id)
+        self.followers.add(following_id, follower_id)
+
+    def remove(self, follower_id: int, following_id: int) -> None:
+        self.following.remove(follower_id, following_id)
+        self.followers.remove(following_id, follower_id)
+
+    def mutual_followers(self, viewer_id: int, profile_id: int) -> list:
+        """
+        Profiles the viewer follows that also follow profile.
+        """
+        return self.following.common(viewer_id, self.followers, profile_id)
+
+    def follows_back(self, viewer_id: int) -> list:
+        """
+        Profiles the viewer follows that follow the viewer too.
+        """
+        return self.following.common(viewer_id, self.followers, viewer_id)
+
+    def suggestions(self, viewer_id: int, limit: int) -> list:
+        """
+        Return [(profile_id, overlap)] for profiles followed by the
+        profiles the viewer follows, ranked by how many of them follow
+        it. Profiles the viewer already follows are left out.
+
+        Only the FOLLOW_GRAPH_SUGGESTION_FANOUT smallest neighbour lists
+        are walked at each hop, which bounds the cost for accounts
+        following or followed by very many profiles.
+        """
+        fanout = settings.FOLLOW_GRAPH_SUGGESTION_FANOUT
+        following = self.following.neighbours(viewer_id)
+        counts = Counter()
+        for profile_id in sorted(following, key=self.following.degree)[
+            :fanout
+        ]:
+            neighbours = self.following.neighbours(profile_id)
+            if len(neighbours) > fanout:
+                neighbours = sorted(neighbours)[:fanout]
+            counts.update(neighbours)
+
+        candidates = [
+            (profile_id, overlap)
+            for profile_id, overlap in counts.items()
+            if profile_id != viewer_id and profile_id not in following
+        ]
+        candidates.sort(key=lambda item: (-item[1], item[0]))
+        return candidates[:limit]
+
+
+_graph = None
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+# Changes made while a load is in progress, replayed onto its result.
+_changes_during_load = None
+
+
+def get_graph() -> FollowGraph:
+    """
+    Return the follow graph, loading it on first use.
+
+    Other processes change the graph too, so it is reloaded in the
+    background once it is older than FOLLOW_GRAPH_MAX_AGE seconds.
+    Changes made in this process are applied right away.
+    """
+    graph = _graph
+    if graph is None:
+        with _load_lock:
+            if _graph is None:
+                _load()
+            return _graph
+
+    max_age = settings.FOLLOW_GRAPH_MAX_AGE
+    if max_age is not None and time.monotonic() - graph.loaded_at > max_age:
+        _start_reload()
+    return graph
+
+
+def warm() -> None:
+    """
+    Start loading the graph in the background when the process starts,
+    so that the first request using it does not wait for the load.
+    """
+    if _graph is None:
+        _start_reload()
+
+
+def _start_reload() -> None:
+    if _load_lock.acquire(blocking=False):
+        threading.Thread(
+            target=_reload_in_background,
+            name="follow-graph-reload",
+            daemon=True,
+        ).start()
+
+
+def _reload_in_background():
+    try:
+        _load()
+    except Exception:
+        logger.exception("Loading the follow graph failed")
+    finally:
+        connection.close()
+        _load_lock.release()
+
+
+def _load() -> None:
+    """
+    Load the graph from the database; the caller holds _load_lock.
+    """
+    global _graph, _changes_during_load
+    with _lock:
+        _changes_during_load = []
+    try:
+        graph = FollowGraph.load()
+    except BaseException:
+        with _lock:
+            _changes_during_load = None
+        raise
+    with _lock:
+        for change, follower_id, following_id in _changes_during_load:
+            getattr(graph, change)(follower_id, following_id)
+        _changes_during_load = None
+        _graph = graph
+
+
+def _apply(change: str, follower_id: int, following_id: int) -> None:
+    with _lock:
+        if _changes_during_load is not None:
+            _changes_during_load.append((change, follower_id, following_id))
+        if _graph is not None:
+            getattr(_graph, change)(follower_id, following_id)
+
+
+def follow_added(follower_id: int, following_id: int) -> None:
+    _apply("add", follower_id, following_id)
+
+
+def follow_removed(follower_id: int, following_id: int) -> None:
+    _apply("remove", follower_id, following_id)
+
+
+@receiver(setting_changed)
+def reset(setting=None, **kwargs):
+    """
+    Drop the loaded graph, e.g. between tests.
+    """
+    global _graph
+    if setting is None or setting.startswith("FOLLOW_GRAPH"):
+        with _lock:
+            _graph = None
@@ -0,0 +1,93 @@
+from django.db import transaction
+
+from social_media import counters, follow_graph, timeline
+from social_media.models import Follow, Profile
+
+# Upper bound for profiles accepted by one bulk request.
+MAX_BULK_FOLLOWS = 500
+
+
+def apply(profile: Profile, follow=(), unfollow=()) -> dict:
+    """
+    Follow and unfollow many profiles on behalf of profile in one
+    transaction.
+
+    Target profiles are validated with one query and follows are
+    inserted with a single bulk INSERT that ignores rows the
+    unique_together constraint already holds. Counters and the
+    follower's timeline are updated in the same transaction. Profiles
+    that do not exist are reported back instead of failing the batch.
+    """
+    requested = set(follow) | set(unfollow)
+    with transaction.atomic():
+        _lock(profile)
+        existing = set(
+            Profile.objects.filter(id__in=requested).values_list(
+                "id", flat=True
+            )
+        )
+        current = set(
+            Follow.objects.filter(
+                follower=profile, following_id__in=existing
+            ).values_list("following_id", flat=True)
+        )
+        added = sorted(existing.intersection(follow) - current)
+        removed = sorted(existing.intersection(unfollow) & current)
+
+        if added:
+            Follow.objects.bulk_create(
+                [
+                    Follow(follower=profile, following_id=following_id)
+                    for following_id in added
+                ],
+                ignore_conflicts=True,
+            )
+            counters.adjust(Profile, profile.id, following_count=len(added))
+            counters.adjust_many(Profile, added, followers_count=1)
+            timeline.backfill_many(profile, added)
+            # bulk_create sends no post_save, which keeps the follow
+            # graph up to date for single follows.
+            transaction.on_commit(lambda: _add_to_graph(profile.id, added))
+        if removed:
+            Follow.objects.filter(
+                follower=profile, following_id__in=removed
+            ).delete()
+            counters.adjust(Profile, profile.id, following_count=-len(removed))
+            counters.adjust_many(Profile, removed, followers_count=-1)
+            timeline.remove_many(profile, removed)
+
+    return {
+        "followed": sorted(existing.intersection(follow)),
+        "unfollowed": sorted(existing.intersection(unfollow)),
+        "missing": sorted(requested - existing),
+    }
+
+
+def toggle(profile: Profile, following: Profile) -> bool:
+    """
+    Follow following on behalf of profile, or unfollow it if profile
+    already follows it. Returns whether profile follows it now.
+    """
+    with transaction.atomic():
+        _lock(profile)
+        followed = Follow.objects.filter(
+            follower=profile, following=following
+        ).exists()
+        if followed:
+            apply(profile, unfollow=[following.id])
+        else:
+            apply(profile, follow=[following.id])
+    return not followed
+
+
+def _lock(profile: Profile) -> None:
+    """
+    Serialise follow changes of the same follower, so that the follows
+    read afterwards stay accurate until the counters are adjusted.
+    """
+    list(Profile.objects.select_for_update().filter(pk=profile.pk))
+
+
+def _add_to_graph(follower_id: int, following_ids) -> None:
+    for following_id in following_ids:
+        follow_graph.follow_added(follower_id, following_id)
@@ -0,0 +1,180 @@
+import io
+import pathlib
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from social_media import blobs
+from social_media.models import Post, Profile
+
+# Image kinds, keys of settings.IMAGE_VARIANTS:
+# (model, image field, field recording the variants)
+IMAGE_FIELDS = {
+    "post": (Post, "media", "media_variants"),
+    "profile": (Profile, "profile_picture", "profile_picture_variants"),
+}
+EXTENSIONS = {"JPEG": "jpg"}
+# Quality used when the original has to be re-encoded to drop EXIF.
+ORIGINAL_QUALITY = 95
+
+
+def needs_processing(instance, kind: str) -> bool:
+    """
+    Tell whether the image of instance has been replaced since its
+    variants were produced.
+    """
+    _, field, variants_field = IMAGE_FIELDS[kind]
+    image = getattr(instance, field)
+    variants = getattr(instance, variants_field)
+    return bool(image) and variants.get("source") != image.name
+
+
+def references(image_name, variants: dict) -> list:
+    """
+    Return the stored files a row refers to: its image and the variants
+    recorded for it.
+    """
+    names = [v["name"] for v in variants.get("variants", {}).values()]
+    if image_name:
+        names.append(image_name)
+    return names
+
+
+def referenced() -> Counter:
+    """
+    Count the references to stored files held by posts and profiles.
+    """
+    counts = Counter()
+    for model, field, variants_field in IMAGE_FIELDS.values():
+        rows = model.objects.exclude(**{field: ""}).values_list(
+            field, variants_field
+        )
+        for image_name, variants in rows.iterator():
+            counts.update(references(image_name, variants))
+    return counts
+
+
+def encode(image: Image.Image, image_format: str, quality: int) -> bytes:
+    """
+    Encode image without any EXIF data; Pillow only writes EXIF when it
+    is passed explicitly. The colour profile is kept.
+    """
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA")
+
+    buffer = io.BytesIO()
+    image.save(
+        buffer,
+        format=image_format,
+        quality=quality,
+        icc_profile=image.info.get("icc_profile"),
+    )
+    return buffer.getvalue()
+
+
+def variant_name(source: str, variant: str) -> str:
+    path = pathlib.PurePosixPath(source)
+    image_format = settings.IMAGE_VARIANT_FORMAT
+    extension = EXTENSIONS.get(image_format, image_format.lower())
+    return str(path.with_name(f"{path.stem}_{variant}.{extension}"))
+
+
+def render_variants(image: Image.Image, sizes: dict) -> dict:
+    """
+    Return {variant: (bytes, width, height)} for the given bounding
+    boxes. Images are never upscaled.
+    """
+    result = {}
+    for variant, size in sizes.items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+        result[variant] = (
+            encode(
+                resized,
+                settings.IMAGE_VARIANT_FORMAT,
+                settings.IMAGE_VARIANT_QUALITY,
+            ),
+            resized.width,
+            resized.height,
+        )
+    return result
+
+
+def process(kind: str, pk: int) -> bool:
+    """
+    Strip EXIF from the current image of a post or profile and store
+    its resized variants.
+
+    Files are content addressed, so an original without EXIF is stored
+    as a new file that replaces the image of the row. The result is
+    recorded only if the image has not been replaced in the meantime;
+    otherwise the new files are left to garbage collection. Returns
+    whether anything was recorded.
+    """
+    model, field, variants_field = IMAGE_FIELDS[kind]
+    instance = model.objects.filter(pk=pk).only(field).first()
+    image_file = getattr(instance, field, None)
+    if not image_file:
+        return False
+
+    source = image_file.name
+    storage = image_file.storage
+    image_name = source
+    try:
+        with storage.open(source, "rb") as handle:
+            image = Image.open(handle)
+            image.load()
+    except (OSError, Image.DecompressionBombError):
+        result = {"source": source, "status": "failed"}
+    else:
+        original_format = image.format
+        has_exif = bool(image.getexif())
+        image = ImageOps.exif_transpose(image)
+        if has_exif:
+            data = encode(image, original_format, ORIGINAL_QUALITY)
+            image_name = storage.save(source, ContentFile(data))
+
+        variants = {}
+        for variant, (data, width, height) in render_variants(
+            image, settings.IMAGE_VARIANTS[kind]
+        ).items():
+            variants[variant] = {
+                "name": storage.save(
+                    variant_name(source, variant), ContentFile(data)
+                ),
+                "width": width,
+                "height": height,
+            }
+        result = {
+            "source": image_name,
+            "status": "ready",
+            "width": image.width,
+            "height": image.height,
+            "variants": variants,
+        }
+
+    with transaction.atomic():
+        previous = (
+            model.objects.select_for_update()
+            .filter(pk=pk, **{field: source})
+            .values_list(variants_field, flat=True)
+            .first()
+        )
+        if previous is None:
+            return False
+        model.objects.filter(pk=pk).update(
+            **{field: image_name, variants_field: result}
+        )
+        blobs.adjust(
+            acquired=references(image_name, result),
+            released=references(source, previous),
+        )
+    return True
@@ -0,0 +1,279 @@
+import datetime
+import io
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from social_media.benchmarks import current_commit
+from social_media.models import Comment, Follow, Like, Post, Profile
+
+# name: (method, path, weight); {post} is replaced with a post id.
+SCENARIOS = {
+    "posts": ("GET", "/platform/posts/", 30),
+    "following_posts": ("GET", "/platform/posts/following_posts/", 25),
+    "profiles": ("GET", "/platform/profiles/", 15),
+    "reaction": ("GET", "/platform/posts/{post}/reaction/", 20),
+    "comment": ("POST", "/platform/posts/{post}/comment/", 10),
+}
+REMOTE_ADDR = "127.0.0.1"
+
+
+def percentile(latencies: list, p: float) -> float:
+    return latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """
+    Summarize (latency, ok, queries) samples of one endpoint.
+    """
+    latencies = sorted(latency for latency, _, _ in samples)
+    return {
+        "requests": len(samples),
+        "errors": sum(not ok for _, ok, _ in samples),
+        "throughput": round(len(samples) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.5) * 1000, 2),
+            "p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "mean": round(statistics.mean(latencies) * 1000, 2),
+        },
+        "queries_per_request": round(
+            statistics.mean(queries for _, _, queries in samples), 2
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the API routes concurrently with a weighted mix of reads "
+        "and writes as many users, and report latency percentiles, "
+        "throughput and queries per request as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=8,
+            help="Number of clients sending requests at the same time.",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=50,
+            help="Number of profiles the requests are spread over.",
+        )
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            dest="scenarios",
+            choices=sorted(SCENARIOS),
+            help="Only run this scenario; may be repeated.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output", help="Write the JSON report to this file."
+        )
+        parser.add_argument(
+            "--compare",
+            help="JSON report of an earlier run to print differences to.",
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        profiles = list(
+            Profile.objects.select_related("user").order_by("?")[
+                : options["users"]
+            ]
+        )
+        post_ids = list(
+            Post.objects.order_by("-created_at", "-id").values_list(
+                "id", flat=True
+            )[:1000]
+        )
+        if not profiles or not post_ids:
+            raise CommandError(
+                "The database needs profiles and posts; "
+                "see the generate_dataset command."
+            )
+
+        scenarios = {
+            name: SCENARIOS[name] for name in options["scenarios"] or SCENARIOS
+        }
+        tokens = [str(AccessToken.for_user(p.user)) for p in profiles]
+        names = rng.choices(
+            list(scenarios),
+            weights=[weight for _, _, weight in scenarios.values()],
+            k=options["requests"],
+        )
+        requests = [
+            (
+                name,
+                scenarios[name][0],
+                scenarios[name][1].format(post=rng.choice(post_ids)),
+                rng.choice(tokens),
+            )
+            for name in names
+        ]
+
+        # Measure the stack as deployed: no debug toolbar, no query log.
+        with override_settings(DEBUG=False):
+            samples, elapsed = self.run(requests, options["concurrency"])
+
+        report = {
+            "meta": {
+                "commit": current_commit(),
+                "started_at": datetime.datetime.now(
+                    datetime.timezone.utc
+                ).isoformat(),
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+                "users": len(profiles),
+                "seed": options["seed"],
+                "database": {
+                    "vendor": connection.vendor,
+                    "profiles": Profile.objects.count(),
+                    "posts": Post.objects.count(),
+                    "follows": Follow.objects.count(),
+                    "likes": Like.objects.count(),
+                    "comments": Comment.objects.count(),
+                },
+            },
+            "endpoints": {
+                name: summarize(samples[name], elapsed)
+                for name in scenarios
+                if samples[name]
+            },
+            "total": summarize(
+                [sample for name in samples for sample in samples[name]],
+                elapsed,
+            ),
+        }
+
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as handle:
+                baseline = json.load(handle)
+        self.print_table(report, baseline)
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                json.dump(report, handle, indent=2)
+                handle.write("\n")
+
+    def print_table(self, report, baseline=None):
+        rows = list(report["endpoints"].items()) + [("total", report["total"])]
+        for name, result in rows:
+            latency = result["latency_ms"]
+            line = (
+                f"{name:<16} {result['throughput']:8.1f} req/s  "
+                f"p50 {latency['p50']:7.1f} ms  "
+                f"p95 {latency['p95']:7.1f} ms  "
+                f"p99 {latency['p99']:7.1f} ms  "
+                f"queries {result['queries_per_request']:5.1f}  "
+                f"errors {result['errors']}"
+            )
+            if baseline is not None:
+                before = (
+                    baseline["total"]
+                    if name == "total"
+                    else baseline["endpoints"].get(name)
+                )
+                if before is not None:
+                    line += "  " + self.difference(before, result)
+            self.stdout.write(line)
+
+    @staticmethod
+    def difference(before, after):
+        def change(old, new):
+            return f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+
+        p95 = change(before["latency_ms"]["p95"], after["latency_ms"]["p95"])
+        throughput = change(before["throughput"], after["throughput"])
+        queries = after["queries_per_request"] - before["queries_per_request"]
+        return f"(p95 {p95}, throughput {throughput}, queries {queries:+.1f})"
+
+    def run(self, requests, concurrency):
+        application = get_wsgi_application()
+        pending = list(reversed(requests))
+        lock = threading.Lock()
+        samples = defaultdict(list)
+
+        def call(method, path, token):
+            body = b""
+            if method == "POST":
+                body = json.dumps(
+                    {"comment": {"content": "benchmark comment"}}
+                ).encode()
+            environ = {
+                "REQUEST_METHOD": method,
+                "PATH_INFO": path,
+                "QUERY_STRING": "",
+                "CONTENT_TYPE": "application/json",
+                "CONTENT_LENGTH": str(len(body)),
+                "SERVER_NAME": "localhost",
+                "SERVER_PORT": "80",
+                "SERVER_PROTOCOL": "HTTP/1.1",
+                "HTTP_HOST": "localhost",
+                "HTTP_AUTHORIZATION": f"Bearer {token}",
+                "REMOTE_ADDR": REMOTE_ADDR,
+                "wsgi.input": io.BytesIO(body),
+                "wsgi.errors": sys.stderr,
+                "wsgi.url_scheme": "http",
+                "wsgi.multithread": True,
+                "wsgi.multiprocess": False,
+                "wsgi.run_once": False,
+            }
+            status = []
+            queries = 0
+
+            def count(execute, sql, params, many, context):
+                nonlocal queries
+                queries += 1
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count):
+                response = application(
+                    environ, lambda code, headers: status.append(code)
+                )
+                try:
+                    b"".join(response)
+                finally:
+                    response.close()
+            # Redirects are how the toggle and comment actions answer.
+            return status[0][0] in "23", queries
+
+        def client():
+            try:
+                while True:
+                    with lock:
+                        if not pending:
+                            return
+                        name, method, path, token = pending.pop()
+                    started = time.perf_counter()
+                    ok, queries = call(method, path, token)
+                    latency = time.perf_counter() - started
+                    with lock:
+                        samples[name].append((latency, ok, queries))
+            finally:
+                # Each client thread opened its own connection.
+                connection.close()
+
+        with ThreadPoolExecutor(concurrency) as clients:
+            started = time.perf_counter()
+            futures = [clients.submit(client) for _ in range(concurrency)]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - started
+        return samples, elapsed
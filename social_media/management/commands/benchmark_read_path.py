@@ -0,0 +1,245 @@
+import asyncio
+import io
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from social_media.models import Post, Profile
+
+DEFAULT_PATHS = (
+    "/platform/posts/",
+    "/platform/posts/{post}/",
+    "/platform/posts/following_posts/",
+    "/platform/profiles/",
+    "/platform/profiles/{profile}/",
+)
+REMOTE_ADDR = "127.0.0.1"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare WSGI and ASGI throughput of the read endpoints on the "
+        "current database. Both handlers run in process, so the numbers "
+        "measure the application stack rather than a particular server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=50,
+            help="Number of clients sending requests at the same time.",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=8,
+            help="Worker threads of the WSGI server.",
+        )
+        parser.add_argument(
+            "--client-delay",
+            type=float,
+            default=0.0,
+            help="Seconds each client takes to read a response, "
+            "to model slow connections.",
+        )
+        parser.add_argument(
+            "--path",
+            action="append",
+            dest="paths",
+            help="Path to request; may be repeated. {post} and {profile} "
+            "are replaced with existing ids.",
+        )
+
+    def handle(self, *args, **options):
+        profile = Profile.objects.select_related("user").first()
+        post = Post.objects.first()
+        if profile is None or post is None:
+            raise CommandError(
+                "The database needs at least one profile and one post."
+            )
+
+        paths = [
+            path.format(post=post.id, profile=profile.id)
+            for path in options["paths"] or DEFAULT_PATHS
+        ]
+        token = str(AccessToken.for_user(profile.user))
+        requests = [
+            paths[i % len(paths)] for i in range(options["requests"])
+        ]
+
+        self.stdout.write(
+            f"{len(requests)} requests over {len(paths)} paths, "
+            f"{options['concurrency']} clients, "
+            f"{options['client_delay']}s client delay"
+        )
+        # Measure the stack as deployed: no debug toolbar, no query log.
+        with override_settings(DEBUG=False):
+            for name, run in (
+                (f"WSGI ({options['threads']} threads)", self.run_wsgi),
+                ("ASGI", self.run_asgi),
+            ):
+                latencies, errors, elapsed = run(requests, token, options)
+                self.report(name, latencies, errors, elapsed)
+
+    def report(self, name, latencies, errors, elapsed):
+        latencies = sorted(latencies)
+
+        def percentile(p):
+            return latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+
+        self.stdout.write(
+            f"{name:<20} {len(latencies) / elapsed:8.1f} req/s  "
+            f"p50 {percentile(0.5) * 1000:7.1f} ms  "
+            f"p95 {percentile(0.95) * 1000:7.1f} ms  "
+            f"p99 {percentile(0.99) * 1000:7.1f} ms  "
+            f"mean {statistics.mean(latencies) * 1000:7.1f} ms  "
+            f"errors {errors}"
+        )
+
+    @staticmethod
+    def split(path):
+        path, _, query = path.partition("?")
+        return path, query
+
+    def run_wsgi(self, requests, token, options):
+        application = get_wsgi_application()
+        pending = list(reversed(requests))
+        lock = threading.Lock()
+        latencies = []
+        errors = 0
+
+        def call(path):
+            path, query = self.split(path)
+            environ = {
+                "REQUEST_METHOD": "GET",
+                "PATH_INFO": path,
+                "QUERY_STRING": query,
+                "SERVER_NAME": "localhost",
+                "SERVER_PORT": "80",
+                "SERVER_PROTOCOL": "HTTP/1.1",
+                "HTTP_HOST": "localhost",
+                "HTTP_AUTHORIZATION": f"Bearer {token}",
+                "REMOTE_ADDR": REMOTE_ADDR,
+                "wsgi.input": io.BytesIO(),
+                "wsgi.errors": sys.stderr,
+                "wsgi.url_scheme": "http",
+                "wsgi.multithread": True,
+                "wsgi.multiprocess": False,
+                "wsgi.run_once": False,
+            }
+            status = []
+            body = application(
+                environ, lambda code, headers: status.append(code)
+            )
+            try:
+                b"".join(body)
+                # A sync worker stays busy while a slow client reads.
+                time.sleep(options["client_delay"])
+            finally:
+                body.close()
+            return status[0].startswith("2")
+
+        def client(workers):
+            nonlocal errors
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    path = pending.pop()
+                started = time.perf_counter()
+                ok = workers.submit(call, path).result()
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+                    errors += not ok
+
+        with ThreadPoolExecutor(options["threads"]) as workers:
+            call(requests[0])
+            started = time.perf_counter()
+            clients = [
+                threading.Thread(target=client, args=(workers,))
+                for _ in range(options["concurrency"])
+            ]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        return latencies, errors, elapsed
+
+    def run_asgi(self, requests, token, options):
+        application = get_asgi_application()
+        pending = list(reversed(requests))
+        latencies = []
+        errors = 0
+
+        async def call(path):
+            path, query = self.split(path)
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": "GET",
+                "scheme": "http",
+                "path": path,
+                "raw_path": path.encode(),
+                "query_string": query.encode(),
+                "root_path": "",
+                "headers": [
+                    (b"host", b"localhost"),
+                    (b"authorization", f"Bearer {token}".encode()),
+                ],
+                "client": (REMOTE_ADDR, 40000),
+                "server": ("localhost", 80),
+            }
+            status = []
+            body_sent = False
+            finished = asyncio.Event()
+
+            async def receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {"type": "http.request", "body": b""}
+                await finished.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status.append(message["status"])
+                elif not message.get("more_body"):
+                    # The event loop serves others while a client reads.
+                    await asyncio.sleep(options["client_delay"])
+                    finished.set()
+
+            await application(scope, receive, send)
+            return 200 <= status[0] < 300
+
+        async def client():
+            nonlocal errors
+            while pending:
+                path = pending.pop()
+                started = time.perf_counter()
+                ok = await call(path)
+                latencies.append(time.perf_counter() - started)
+                errors += not ok
+
+        async def main():
+            await call(requests[0])
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(client() for _ in range(options["concurrency"]))
+            )
+            return time.perf_counter() - started
+
+        elapsed = asyncio.run(main())
+        return latencies, errors, elapsed
@@ -0,0 +1,170 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from social_media import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the post and profile serializers, follow validation and "
+        "permission checks on in-memory fixtures, and compare the results "
+        "with earlier runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size",
+            type=int,
+            default=50,
+            help="Number of posts and profiles serialized per call.",
+        )
+        parser.add_argument("--tags", type=int, default=3)
+        parser.add_argument("--likes", type=int, default=10)
+        parser.add_argument("--comments", type=int, default=3)
+        parser.add_argument(
+            "--benchmark",
+            action="append",
+            dest="benchmarks",
+            help="Only run this benchmark; may be repeated.",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--min-time",
+            type=float,
+            default=0.2,
+            help="Minimum duration in seconds of each repetition.",
+        )
+        parser.add_argument(
+            "--history",
+            help="JSON Lines file the results are appended to; the last "
+            "entry with the same fixture sizes is the baseline.",
+        )
+        parser.add_argument(
+            "--compare",
+            help="JSON report to use as the baseline instead.",
+        )
+        parser.add_argument(
+            "--max-regression",
+            type=float,
+            help="Fail if a benchmark got slower than the baseline by more "
+            "than this percentage.",
+        )
+        parser.add_argument(
+            "--output", help="Write the JSON report to this file."
+        )
+
+    def handle(self, *args, **options):
+        fixtures = benchmarks.Fixtures(
+            options["size"],
+            tags=options["tags"],
+            likes=options["likes"],
+            comments=options["comments"],
+        )
+        unknown = set(options["benchmarks"] or ()) - set(
+            benchmarks.cases(fixtures)
+        )
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {sorted(unknown)}")
+
+        # Fixtures that trigger lazy loading would time the database.
+        with CaptureQueriesContext(connection) as context:
+            results = benchmarks.run(
+                fixtures,
+                options["benchmarks"],
+                repeat=options["repeat"],
+                min_time=options["min_time"],
+            )
+        if context.captured_queries:
+            raise CommandError(
+                f"The benchmarks ran {len(context.captured_queries)} "
+                "queries; fixtures are missing a relation."
+            )
+
+        report = {
+            "meta": {
+                "commit": benchmarks.current_commit(),
+                "started_at": datetime.datetime.now(
+                    datetime.timezone.utc
+                ).isoformat(),
+                "fixtures": {
+                    key: options[key]
+                    for key in ("size", "tags", "likes", "comments")
+                },
+            },
+            "results": results,
+        }
+        baseline = self.baseline(options, report["meta"]["fixtures"])
+        regressions = self.print_table(results, baseline)
+
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                json.dump(report, handle, indent=2)
+                handle.write("\n")
+        if options["history"]:
+            with open(options["history"], "a") as handle:
+                handle.write(json.dumps(report) + "\n")
+
+        limit = options["max_regression"]
+        if limit is not None:
+            slower = [
+                f"{name} ({change:+.0f}%)"
+                for name, change in regressions.items()
+                if change > limit
+            ]
+            if slower:
+                raise CommandError(
+                    f"Slower than the baseline by more than {limit:g}%: "
+                    + ", ".join(slower)
+                )
+
+    @staticmethod
+    def baseline(options, fixtures):
+        if options["compare"]:
+            with open(options["compare"]) as handle:
+                return json.load(handle)
+        if not options["history"]:
+            return None
+        try:
+            with open(options["history"]) as handle:
+                entries = [json.loads(line) for line in handle if line.strip()]
+        except FileNotFoundError:
+            return None
+        # Timings only compare across runs on fixtures of the same size.
+        for entry in reversed(entries):
+            if entry["meta"]["fixtures"] == fixtures:
+                return entry
+        return None
+
+    def print_table(self, results, baseline=None) -> dict:
+        """
+        Print the results and return {name: percent change} against the
+        baseline.
+        """
+        if baseline is not None:
+            self.stdout.write(
+                f"Baseline: {baseline['meta']['commit'] or 'unknown commit'} "
+                f"from {baseline['meta']['started_at']}"
+            )
+        changes = {}
+        for name, result in results.items():
+            line = (
+                f"{name:<20} {result['items']:5d} items  "
+                f"median {result['median_us']:10.1f} us  "
+                f"min {result['min_us']:10.1f} us  "
+                f"{result['per_item_us']:8.2f} us/item"
+            )
+            before = (baseline or {}).get("results", {}).get(name)
+            # The fastest run is the one least disturbed by other load.
+            if before and before["min_us"]:
+                changes[name] = (
+                    (result["min_us"] - before["min_us"])
+                    / before["min_us"]
+                    * 100
+                )
+                line += f"  ({changes[name]:+.0f}%)"
+            self.stdout.write(line)
+        return changes
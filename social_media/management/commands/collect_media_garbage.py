@@ -0,0 +1,37 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from social_media import blobs, images
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete uploaded files that no post or profile has referred to "
+        "for the grace period."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-hours",
+            type=float,
+            default=24,
+            help="Keep unreferenced files for this long, so that uploads "
+            "in progress are not collected.",
+        )
+        parser.add_argument(
+            "--reconcile",
+            action="store_true",
+            help="Recount references from posts and profiles first, "
+            "e.g. after bulk writes that bypass model signals.",
+        )
+
+    def handle(self, *args, **options):
+        if options["reconcile"]:
+            repaired = blobs.reconcile(images.referenced())
+            self.stdout.write(f"Repaired {repaired} reference counts.")
+
+        deleted = blobs.collect_garbage(
+            datetime.timedelta(hours=options["grace_hours"])
+        )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} files."))
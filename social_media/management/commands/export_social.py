@@ -0,0 +1,52 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from social_media import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        "Write profiles, posts, follows, likes and comments as JSON Lines, "
+        "reading the tables in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "output",
+            nargs="?",
+            default="-",
+            help="File to write, or - for standard output.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows read per query.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        records = 0
+        if options["output"] == "-":
+            output = sys.stdout
+            report = self.stderr
+        else:
+            output = open(options["output"], "w", encoding="utf-8")
+            report = self.stdout
+        try:
+            for line in transfer.export(options["batch_size"]):
+                output.write(line + "\n")
+                records += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        elapsed = time.monotonic() - started
+        report.write(
+            self.style.SUCCESS(
+                f"Exported {records} records in {elapsed:.1f}s "
+                f"({records / max(elapsed, 1e-9):.0f}/s)."
+            )
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from social_media import reaction_buffer
+
+
+class Command(BaseCommand):
+    help = (
+        "Write likes and unlikes waiting in the reaction buffer. Only "
+        "RedisStore is shared with other processes; a MemoryStore buffer "
+        "lives in the process that recorded the reactions."
+    )
+
+    def handle(self, *args, **options):
+        written = reaction_buffer.flush()
+        self.stdout.write(
+            self.style.SUCCESS(f"Wrote {written} buffered reactions.")
+        )
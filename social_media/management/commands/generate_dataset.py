@@ -0,0 +1,99 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from social_media import dataset, transfer
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate profiles, posts, follows, likes and comments whose "
+        "popularity follows a power law, for load testing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", type=int, default=1000)
+        parser.add_argument("--posts", type=int, default=10000)
+        parser.add_argument(
+            "--follows",
+            type=float,
+            default=20,
+            help="Average number of profiles each profile follows.",
+        )
+        parser.add_argument(
+            "--likes",
+            type=float,
+            default=30,
+            help="Average number of posts each profile likes.",
+        )
+        parser.add_argument(
+            "--comments",
+            type=float,
+            default=5,
+            help="Average number of comments each profile writes.",
+        )
+        parser.add_argument("--tags", type=int, default=100)
+        parser.add_argument(
+            "--exponent",
+            type=float,
+            default=1.1,
+            help="Zipf exponent of popularity; higher is more skewed.",
+        )
+        parser.add_argument(
+            "--prefix",
+            default="user",
+            help="Usernames are this prefix followed by a number.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of records inserted per transaction.",
+        )
+        parser.add_argument(
+            "--output",
+            help="Write JSON Lines for import_social to this file instead "
+            "of inserting the data.",
+        )
+
+    def handle(self, *args, **options):
+        records = dataset.generate(
+            profiles=options["profiles"],
+            posts=options["posts"],
+            follows=options["follows"],
+            likes=options["likes"],
+            comments=options["comments"],
+            tags=options["tags"],
+            exponent=options["exponent"],
+            prefix=options["prefix"],
+            seed=options["seed"],
+        )
+        started = time.monotonic()
+        if options["output"]:
+            written = 0
+            with open(options["output"], "w", encoding="utf-8") as handle:
+                for record in records:
+                    handle.write(json.dumps(record) + "\n")
+                    written += 1
+            self.stdout.write(self.style.SUCCESS(f"Wrote {written} records."))
+            return
+
+        importer = transfer.Importer()
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= options["batch_size"]:
+                importer.apply(batch)
+                batch = []
+        if batch:
+            importer.apply(batch)
+        importer.reset_sequences()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Inserted {importer.imported} records in {elapsed:.1f}s."
+            )
+        )
@@ -0,0 +1,100 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from social_media import blobs, images, transfer
+
+
+class Command(BaseCommand):
+    help = (
+        "Import profiles, posts, follows, likes and comments from JSON "
+        "Lines written by export_social, in batches of bulk inserts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="File to read.")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of records inserted per transaction.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="File recording how far the import got; defaults to the "
+            "input file name with .checkpoint appended.",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue an interrupted import from its checkpoint.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["input"]
+        checkpoint = options["checkpoint"] or path + ".checkpoint"
+        offset = lines = 0
+        if options["resume"] and os.path.exists(checkpoint):
+            with open(checkpoint) as handle:
+                state = json.load(handle)
+            offset, lines = state["offset"], state["lines"]
+            self.stdout.write(f"Resuming after line {lines}.")
+
+        importer = transfer.Importer()
+        started = time.monotonic()
+        batch = []
+        with open(path, "rb") as handle:
+            handle.seek(offset)
+            for line in handle:
+                offset += len(line)
+                lines += 1
+                if line.strip():
+                    try:
+                        batch.append(json.loads(line))
+                    except ValueError as error:
+                        raise CommandError(f"Line {lines}: {error}")
+                if len(batch) >= options["batch_size"]:
+                    self.apply(importer, batch, checkpoint, offset, lines)
+                    batch = []
+                    self.report(importer, started)
+            if batch:
+                self.apply(importer, batch, checkpoint, offset, lines)
+
+        importer.reset_sequences()
+        if importer.has_media:
+            blobs.reconcile(images.referenced())
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {importer.imported} records and skipped "
+                f"{importer.skipped} in {elapsed:.1f}s "
+                f"({importer.imported / max(elapsed, 1e-9):.0f}/s)."
+            )
+        )
+
+    def apply(self, importer, batch, checkpoint, offset, lines):
+        try:
+            importer.apply(batch)
+        except (KeyError, TypeError, ValueError) as error:
+            raise CommandError(
+                f"Invalid record in the batch ending at line {lines}: "
+                f"{error!r}"
+            )
+        # Written after the batch is committed: a crash in between
+        # repeats the batch, which inserts nothing twice.
+        temporary = checkpoint + ".part"
+        with open(temporary, "w") as handle:
+            json.dump({"offset": offset, "lines": lines}, handle)
+        os.replace(temporary, checkpoint)
+
+    def report(self, importer, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"{importer.imported} records, "
+            f"{importer.imported / max(elapsed, 1e-9):.0f}/s"
+        )
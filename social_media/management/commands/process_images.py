@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from social_media import images
+
+
+class Command(BaseCommand):
+    help = (
+        "Strip EXIF and produce the resized variants of uploaded images "
+        "that have not been processed yet, e.g. uploads made before image "
+        "processing existed or while no worker was running."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Reprocess every image, e.g. after changing the variants.",
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        for kind, (
+            model,
+            field,
+            variants_field,
+        ) in images.IMAGE_FIELDS.items():
+            queryset = model.objects.exclude(**{field: ""}).only(
+                field, variants_field
+            )
+            for instance in queryset.iterator():
+                if options["all"] or images.needs_processing(instance, kind):
+                    processed += images.process(kind, instance.pk)
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} images."))
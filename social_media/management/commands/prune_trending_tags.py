@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from social_media import trending
+
+
+class Command(BaseCommand):
+    help = "Delete tag usage buckets older than the longest trending window."
+
+    def handle(self, *args, **options):
+        deleted = trending.prune()
+        self.stdout.write(
+            self.style.SUCCESS(f"Deleted {deleted} tag usage buckets.")
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from social_media import search
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the full-text search indexes from the source tables, "
+        "e.g. after bulk writes that bypass model signals."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            search.index_posts()
+            search.index_profiles()
+        self.stdout.write(self.style.SUCCESS("Search indexes rebuilt."))
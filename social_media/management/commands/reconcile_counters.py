@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from social_media import counters
+from social_media.models import Post, Profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute denormalized like, comment, follower, following "
+        "and post counters and repair the rows that have drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Number of rows checked per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        repaired_posts = self.reconcile(
+            Post, counters.reconcile_posts, batch_size
+        )
+        repaired_profiles = self.reconcile(
+            Profile, counters.reconcile_profiles, batch_size
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Repaired {repaired_posts} posts "
+                f"and {repaired_profiles} profiles."
+            )
+        )
+
+    @staticmethod
+    def reconcile(model, reconcile, batch_size):
+        repaired = 0
+        last_pk = 0
+        while True:
+            pks = list(
+                model.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not pks:
+                return repaired
+
+            with transaction.atomic():
+                repaired += reconcile(
+                    model.objects.filter(pk__gte=pks[0], pk__lte=pks[-1])
+                )
+            last_pk = pks[-1]
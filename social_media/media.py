@@ -0,0 +1,193 @@
+import mimetypes
+import os
+import pathlib
+import re
+
+from django.conf import settings
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import require_safe
+
+from social_media.storage import media_storage
+
+# Content-addressed files never change, so clients may keep them as
+# long as they like.
+IMMUTABLE = "public, max-age=31536000, immutable"
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+@require_safe
+def serve(request, path):
+    """
+    Serve a file below MEDIA_ROOT. Files of the content-addressed
+    storage are named after their hash, which is used as their ETag.
+    """
+    full_path = pathlib.Path(safe_join(settings.MEDIA_ROOT, path))
+    try:
+        handle = open(full_path, "rb")
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        raise Http404("File not found.")
+
+    if path.startswith(media_storage().directory + "/"):
+        return serve_file(
+            request, handle, etag=full_path.stem, cache_control=IMMUTABLE
+        )
+    return serve_file(request, handle)
+
+
+def serve_file(
+    request, handle, content_type=None, etag=None, cache_control=None
+):
+    """
+    Respond with the content of an open file, honouring conditional
+    and range requests. The file is closed when the response is.
+
+    etag defaults to one derived from the size and modification time.
+    With MEDIA_SENDFILE set, files below MEDIA_ROOT are handed to the
+    web server, which then takes care of ranges.
+    """
+    stat = os.fstat(handle.fileno())
+    etag = '"%s"' % (etag or f"{stat.st_size:x}-{stat.st_mtime_ns:x}")
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(stat.st_mtime),
+        "Cache-Control": cache_control
+        or f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}",
+        "Accept-Ranges": "bytes",
+    }
+    if content_type is None:
+        content_type, encoding = mimetypes.guess_type(handle.name)
+        content_type = content_type or "application/octet-stream"
+        if encoding:
+            content_type = "application/octet-stream"
+
+    conditional = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if conditional is not None:
+        handle.close()
+        if isinstance(conditional, HttpResponseNotModified):
+            for header, value in headers.items():
+                conditional[header] = value
+        return conditional
+
+    offload = _offload_header(handle.name)
+    if offload is not None:
+        handle.close()
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response[offload[0]] = offload[1]
+        return response
+
+    byte_range = _byte_range(request, etag, stat.st_size)
+    if byte_range is None:
+        start, length, status = 0, stat.st_size, 200
+    elif byte_range == ():
+        handle.close()
+        response = HttpResponse(status=416, headers=headers)
+        response["Content-Range"] = f"bytes */{stat.st_size}"
+        return response
+    else:
+        start, length = byte_range
+        status = 206
+        headers["Content-Range"] = (
+            f"bytes {start}-{start + length - 1}/{stat.st_size}"
+        )
+
+    handle.seek(start)
+    return StreamingHttpResponse(
+        FileRange(handle, length),
+        status=status,
+        content_type=content_type,
+        headers={**headers, "Content-Length": str(length)},
+    )
+
+
+def _byte_range(request, etag, size):
+    """
+    Return (start, length) of the requested range, None to send the
+    whole file, or () if the range cannot be satisfied.
+
+    Only single ranges are supported; a request for several ranges gets
+    the whole file, which RFC 9110 allows.
+    """
+    header = request.META.get("HTTP_RANGE")
+    if not header or request.method != "GET":
+        return None
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range and etag not in parse_etags(if_range):
+        return None
+
+    match = RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size:
+            return ()
+        if end < start:
+            return None
+    elif last:
+        if not int(last) or not size:
+            return ()
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        return None
+    return start, end - start + 1
+
+
+class FileRange:
+    """
+    Iterates over length bytes of a file from its current position. The
+    response closes the file, also if the body is never read.
+    """
+
+    def __init__(self, handle, length):
+        self.handle = handle
+        self.length = length
+
+    def __iter__(self):
+        remaining = self.length
+        while remaining > 0:
+            chunk = self.handle.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    def close(self):
+        self.handle.close()
+
+
+def _offload_header(path):
+    """
+    Return the header handing path to the web server, or None if files
+    are served by Django or path is outside MEDIA_ROOT.
+    """
+    if settings.MEDIA_SENDFILE is None:
+        return None
+    try:
+        relative = (
+            pathlib.Path(path)
+            .resolve()
+            .relative_to(pathlib.Path(settings.MEDIA_ROOT).resolve())
+        )
+    except ValueError:
+        return None
+
+    if settings.MEDIA_SENDFILE == "x-accel-redirect":
+        return (
+            "X-Accel-Redirect",
+            settings.MEDIA_SENDFILE_PREFIX + relative.as_posix(),
+        )
+    return "X-Sendfile", str(pathlib.Path(path).resolve())
@@ -0,0 +1,436 @@
+"""
+Request metrics exported in the Prometheus text format.
+
+MetricsMiddleware records, for every request, its latency, response
+size and database queries, labelled by route, view (viewset and action
+for DRF views) and method. Values are summed in a store:
+
+- MemoryStore keeps them in the process, for a single process and tests;
+- FileStore keeps them in a memory-mapped file per process in a shared
+  directory, and the export sums the files of all processes, so that
+  every worker of a server reports the same totals.
+"""
+
+import contextlib
+import contextvars
+import hmac
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.module_loading import import_string
+from django.views.decorators.http import require_safe
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# name: (help, buckets); metrics without buckets are counters.
+METRICS = {
+    "http_requests_total": ("Requests handled, by status code.", None),
+    "http_request_duration_seconds": (
+        "Time from the request entering the middleware to the response "
+        "leaving it.",
+        LATENCY_BUCKETS,
+    ),
+    "http_response_size_bytes": (
+        "Size of response bodies; streamed responses without a "
+        "Content-Length are not counted.",
+        SIZE_BUCKETS,
+    ),
+    "db_queries_per_request": (
+        "Database queries run while handling a request.",
+        QUERY_BUCKETS,
+    ),
+    "db_query_duration_seconds_total": (
+        "Time spent in database queries.",
+        None,
+    ),
+}
+METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MemoryStore:
+    """
+    Sums values in process memory.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(float)
+
+    def add(self, increments) -> None:
+        with self.lock:
+            for key, amount in increments:
+                self.values[key] += amount
+
+    def collect(self) -> dict:
+        with self.lock:
+            return dict(self.values)
+
+
+class FileStore:
+    """
+    Sums values in a memory-mapped file per process, named after its
+    pid, in directory.
+
+    The file starts with the number of bytes in use, followed by entries
+    of a key length, the key and an 8-byte float, padded to 8 bytes.
+    Only the owning process writes to a file, so incrementing a value
+    needs no lock between processes, and readers only look at the
+    entries that were complete when the header was last written.
+
+    Files of stopped processes are kept so that their counts are not
+    lost; empty the directory when deploying.
+    """
+
+    HEADER = struct.Struct("<Q")
+    LENGTH = struct.Struct("<I")
+    VALUE = struct.Struct("<d")
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def _open(self) -> None:
+        # After a fork the child writes a file of its own.
+        self.pid = os.getpid()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"metrics-{self.pid}.db")
+        self.file = open(path, "a+b")
+        size = os.fstat(self.file.fileno()).st_size
+        if size < self.INITIAL_SIZE:
+            self.file.truncate(self.INITIAL_SIZE)
+            size = self.INITIAL_SIZE
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.offsets = {}
+        self.used = self.HEADER.unpack_from(self.map)[0] or self.HEADER.size
+        for key, offset, _ in self._entries(self.map, self.used):
+            self.offsets[key] = offset
+
+    @classmethod
+    def _entries(cls, data, used):
+        position = cls.HEADER.size
+        while position < used:
+            (length,) = cls.LENGTH.unpack_from(data, position)
+            start = position + cls.LENGTH.size
+            end = start + length
+            key = bytes(data[start:end]).decode()
+            offset = cls._align(end)
+            yield key, offset, cls.VALUE.unpack_from(data, offset)[0]
+            position = offset + cls.VALUE.size
+
+    @staticmethod
+    def _align(position: int) -> int:
+        return (position + 7) & ~7
+
+    def _insert(self, key: str) -> int:
+        encoded = key.encode()
+        start = self.used + self.LENGTH.size
+        key_end = start + len(encoded)
+        offset = self._align(key_end)
+        end = offset + self.VALUE.size
+        if end > len(self.map):
+            size = len(self.map)
+            while size < end:
+                size *= 2
+            self.map.close()
+            self.file.truncate(size)
+            self.map = mmap.mmap(self.file.fileno(), size)
+        self.LENGTH.pack_into(self.map, self.used, len(encoded))
+        self.map[start:key_end] = encoded
+        self.VALUE.pack_into(self.map, offset, 0.0)
+        self.used = end
+        self.HEADER.pack_into(self.map, 0, self.used)
+        self.offsets[key] = offset
+        return offset
+
+    def add(self, increments) -> None:
+        with self.lock:
+            if self.pid != os.getpid():
+                self._open()
+            for key, amount in increments:
+                key = "\0".join(key)
+                offset = self.offsets.get(key)
+                if offset is None:
+                    offset = self._insert(key)
+                (value,) = self.VALUE.unpack_from(self.map, offset)
+                self.VALUE.pack_into(self.map, offset, value + amount)
+
+    def collect(self) -> dict:
+        values = defaultdict(float)
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return {}
+        for name in names:
+            if not (name.startswith("metrics-") and name.endswith(".db")):
+                continue
+            with open(os.path.join(self.directory, name), "rb") as handle:
+                data = handle.read()
+            if len(data) < self.HEADER.size:
+                continue
+            used = self.HEADER.unpack_from(data)[0]
+            for key, _, value in self._entries(data, used):
+                values[tuple(key.split("\0"))] += value
+        return dict(values)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """
+    Return the configured store, or None if metrics are disabled.
+    """
+    global _store
+    if settings.METRICS_BACKEND is None:
+        return None
+    with _store_lock:
+        if _store is None:
+            backend = import_string(settings.METRICS_BACKEND)
+            _store = backend(**settings.METRICS_OPTIONS)
+        return _store
+
+
+@receiver(setting_changed)
+def reset_store(setting, **kwargs):
+    global _store
+    if setting.startswith("METRICS_"):
+        _store = None
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{name}="{_escape(v)}"' for name, v in labels.items())
+
+
+def _bucket(buckets, value) -> str:
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            return str(index)
+    return str(len(buckets))
+
+
+def _observe(increments, name, labels, value) -> None:
+    buckets = METRICS[name][1]
+    increments.append(((name, labels, _bucket(buckets, value)), 1))
+    increments.append(((name, labels, "sum"), value))
+
+
+def view_name(request) -> str:
+    """
+    Name the view that handled request: "PostViewSet.list" for a DRF
+    viewset action or a view naming its actions in metrics_names, the
+    view class for other DRF views, and the URL name otherwise.
+    """
+    match = request.resolver_match
+    if match is None:
+        return ""
+    names = getattr(match.func, "metrics_names", None)
+    if names is not None:
+        return names.get(request.method.lower(), match.view_name)
+    view_class = getattr(match.func, "cls", None)
+    if view_class is None:
+        return match.view_name or (
+            f"{match.func.__module__}.{match.func.__qualname__}"
+        )
+    actions = getattr(match.func, "actions", None) or {}
+    action = actions.get(request.method.lower())
+    if action is None:
+        return view_class.__name__
+    return f"{view_class.__name__}.{action}"
+
+
+class QueryTimer:
+    """
+    Counts the queries of a request and their time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    @contextlib.contextmanager
+    def measuring(self):
+        token = _query_timer.set(self)
+        try:
+            yield
+        finally:
+            _query_timer.reset(token)
+
+
+# A context variable rather than a wrapper per request: async views run
+# their queries through sync_to_async, on connections of another thread
+# that see the context of the request.
+_query_timer = contextvars.ContextVar("query_timer", default=None)
+
+
+def _time_query(execute, sql, params, many, context):
+    timer = _query_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.seconds += time.perf_counter() - started
+        timer.count += 1
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+class MetricsMiddleware:
+    """
+    Records latency, response size, status and database queries of each
+    request. Place it first in MIDDLEWARE so that the time spent in the
+    other middleware is included.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        store = get_store()
+        if store is None:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        queries = QueryTimer()
+        with queries.measuring():
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+        self.record(store, request, response, elapsed, queries)
+        return response
+
+    async def __acall__(self, request):
+        store = get_store()
+        if store is None:
+            return await self.get_response(request)
+
+        started = time.perf_counter()
+        queries = QueryTimer()
+        with queries.measuring():
+            response = await self.get_response(request)
+        elapsed = time.perf_counter() - started
+        self.record(store, request, response, elapsed, queries)
+        return response
+
+    @staticmethod
+    def record(store, request, response, elapsed, queries) -> None:
+        match = request.resolver_match
+        if match is not None and match.url_name == "metrics":
+            return
+        method = request.method if request.method in METHODS else "other"
+        labels = _labels(
+            route="/" + match.route if match is not None else "unmatched",
+            view=view_name(request),
+            method=method,
+        )
+        increments = [
+            (
+                (
+                    "http_requests_total",
+                    labels + "," + _labels(status=str(response.status_code)),
+                    "",
+                ),
+                1,
+            ),
+            (("db_query_duration_seconds_total", labels, ""), queries.seconds),
+        ]
+        _observe(increments, "http_request_duration_seconds", labels, elapsed)
+        _observe(increments, "db_queries_per_request", labels, queries.count)
+        if not response.streaming:
+            size = len(response.content)
+        else:
+            size = response.get("Content-Length")
+        if size is not None:
+            _observe(increments, "http_response_size_bytes", labels, int(size))
+        store.add(increments)
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render(values: dict) -> str:
+    """
+    Render summed store values in the Prometheus text format.
+    """
+    series = defaultdict(lambda: defaultdict(dict))
+    for (name, labels, suffix), value in values.items():
+        series[name][labels][suffix] = value
+
+    lines = []
+    for name, (help_text, buckets) in METRICS.items():
+        if name not in series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {'histogram' if buckets else 'counter'}")
+        for labels, values in sorted(series[name].items()):
+            if buckets is None:
+                lines.append(f"{name}{{{labels}}} {_format(values[''])}")
+                continue
+            count = 0
+            for index, bound in enumerate(buckets + ("+Inf",)):
+                count += values.get(str(index), 0)
+                le = _labels(le=str(bound))
+                lines.append(
+                    f"{name}_bucket{{{labels},{le}}} {_format(count)}"
+                )
+            lines.append(
+                f"{name}_sum{{{labels}}} {_format(values.get('sum', 0))}"
+            )
+            lines.append(f"{name}_count{{{labels}}} {_format(count)}")
+    return "\n".join(lines) + "\n"
+
+
+def _allowed(request) -> bool:
+    token = settings.METRICS_TOKEN
+    if token:
+        return hmac.compare_digest(
+            request.headers.get("Authorization", "").encode(),
+            f"Bearer {token}".encode(),
+        )
+    return request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS
+
+
+@require_safe
+def export(request):
+    """
+    Serve the metrics of all processes to a Prometheus scraper: with
+    METRICS_TOKEN set to requests bearing it, otherwise to INTERNAL_IPS.
+    """
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    store = get_store()
+    values = store.collect() if store is not None else {}
+    return HttpResponse(render(values), content_type=CONTENT_TYPE)
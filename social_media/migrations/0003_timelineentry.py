@@ -0,0 +1,109 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:17
+
+import django.db.models.deletion
+import social_media.models
+from django.db import migrations, models
+
+
+BACKFILL_SIZE = 200
+
+
+def backfill_timelines(apps, schema_editor):
+    Follow = apps.get_model("social_media", "Follow")
+    Post = apps.get_model("social_media", "Post")
+    TimelineEntry = apps.get_model("social_media", "TimelineEntry")
+
+    for follow in Follow.objects.all().iterator():
+        posts = Post.objects.filter(author_id=follow.following_id).order_by(
+            "-created_at", "-id"
+        )[:BACKFILL_SIZE]
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(
+                    owner_id=follow.follower_id,
+                    post_id=post.id,
+                    author_id=post.author_id,
+                    created_at=post.created_at,
+                )
+                for post in posts
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0002_rename_content_post_post_content"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="post",
+            name="media",
+            field=models.ImageField(
+                blank=True, null=True, upload_to=social_media.models.image_upload
+            ),
+        ),
+        migrations.AlterField(
+            model_name="profile",
+            name="profile_picture",
+            field=models.ImageField(
+                blank=True, null=True, upload_to=social_media.models.image_upload
+            ),
+        ),
+        migrations.CreateModel(
+            name="TimelineEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField()),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="social_media.profile",
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline",
+                        to="social_media.profile",
+                    ),
+                ),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to="social_media.post",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["owner", "-created_at", "-post"],
+                        name="timeline_owner_recent_idx",
+                    ),
+                    models.Index(
+                        fields=["owner", "author"], name="timeline_owner_author_idx"
+                    ),
+                ],
+                "unique_together": {("owner", "post")},
+            },
+        ),
+        migrations.RunPython(
+            backfill_timelines, migrations.RunPython.noop
+        ),
+    ]
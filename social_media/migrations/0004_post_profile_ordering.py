@@ -0,0 +1,31 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0003_timelineentry"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="post",
+            options={"ordering": ("-created_at", "-id")},
+        ),
+        migrations.AlterModelOptions(
+            name="profile",
+            options={"ordering": ("id",)},
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["-created_at", "-id"], name="post_recent_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["author", "-created_at", "-id"], name="post_author_recent_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:19
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        Value(0),
+    )
+
+
+def populate_counters(apps, schema_editor):
+    Comment = apps.get_model("social_media", "Comment")
+    Follow = apps.get_model("social_media", "Follow")
+    Like = apps.get_model("social_media", "Like")
+    Post = apps.get_model("social_media", "Post")
+    Profile = apps.get_model("social_media", "Profile")
+
+    Post.objects.update(
+        likes_count=_count(Like, "post"),
+        comments_count=_count(Comment, "post"),
+    )
+    Profile.objects.update(
+        followers_count=_count(Follow, "following"),
+        following_count=_count(Follow, "follower"),
+        posts_count=_count(Post, "author"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0004_post_profile_ordering"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="comments_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="likes_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="profile",
+            name="followers_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="profile",
+            name="following_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="profile",
+            name="posts_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:22
+
+import django.db.models.deletion
+import social_media.models
+from django.db import migrations, models
+
+
+TAGS = """
+    (SELECT coalesce(group_concat(t.name, ' '), '')
+     FROM social_media_tag t
+     JOIN social_media_post_tags pt ON pt.tag_id = t.id
+     WHERE pt.post_id = p.id)
+"""
+
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE social_media_post_fts USING fts5(
+        post_content, tags, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    INSERT INTO social_media_post_fts(rowid, post_content, tags)
+    SELECT p.id, p.post_content, {TAGS}
+    FROM social_media_post p
+    """,
+]
+
+DROP_SQL = [
+    "DROP TABLE IF EXISTS social_media_post_fts",
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0005_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PostSearchIndex",
+            fields=[
+                (
+                    "post",
+                    models.OneToOneField(
+                        db_column="rowid",
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="search_index",
+                        serialize=False,
+                        to="social_media.post",
+                    ),
+                ),
+                (
+                    "document",
+                    social_media.models.FullTextField(
+                        db_column="social_media_post_fts"
+                    ),
+                ),
+                ("post_content", models.TextField()),
+                ("tags", models.TextField()),
+            ],
+            options={
+                "db_table": "social_media_post_fts",
+                "managed": False,
+            },
+        ),
+        migrations.RunPython(
+            run_on_sqlite(CREATE_SQL), run_on_sqlite(DROP_SQL)
+        ),
+    ]
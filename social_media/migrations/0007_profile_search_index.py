@@ -0,0 +1,124 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:24
+
+import django.db.models.deletion
+import social_media.models
+from django.db import migrations, models
+
+
+FTS = "social_media_profile_fts"
+TRIGRAM = "social_media_profile_trigram"
+
+CREATE_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS} USING fts5(
+        username, first_name, last_name,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '1 2 3'
+    )
+    """,
+    f"""
+    CREATE VIRTUAL TABLE {TRIGRAM} USING fts5(
+        username, first_name, last_name, email, bio, tokenize = 'trigram'
+    )
+    """,
+    f"""
+    INSERT INTO {FTS}(rowid, username, first_name, last_name)
+    SELECT p.id, p.username, p.first_name, p.last_name
+    FROM social_media_profile p
+    """,
+    f"""
+    INSERT INTO {TRIGRAM}(rowid, username, first_name, last_name, email, bio)
+    SELECT p.id, p.username, p.first_name, p.last_name, u.email,
+        coalesce(p.bio, '')
+    FROM social_media_profile p JOIN user_user u ON u.id = p.user_id
+    """,
+]
+
+DROP_SQL = [
+    f"DROP TABLE IF EXISTS {FTS}",
+    f"DROP TABLE IF EXISTS {TRIGRAM}",
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0006_post_search_index"),
+        ("user", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProfileSearchIndex",
+            fields=[
+                (
+                    "profile",
+                    models.OneToOneField(
+                        db_column="rowid",
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="search_index",
+                        serialize=False,
+                        to="social_media.profile",
+                    ),
+                ),
+                (
+                    "document",
+                    social_media.models.FullTextField(
+                        db_column="social_media_profile_fts"
+                    ),
+                ),
+                ("username", models.TextField()),
+                ("first_name", models.TextField()),
+                ("last_name", models.TextField()),
+            ],
+            options={
+                "db_table": "social_media_profile_fts",
+                "managed": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="ProfileTrigramIndex",
+            fields=[
+                (
+                    "profile",
+                    models.OneToOneField(
+                        db_column="rowid",
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="trigram_index",
+                        serialize=False,
+                        to="social_media.profile",
+                    ),
+                ),
+                (
+                    "document",
+                    social_media.models.FullTextField(
+                        db_column="social_media_profile_trigram"
+                    ),
+                ),
+                ("username", models.TextField()),
+                ("first_name", models.TextField()),
+                ("last_name", models.TextField()),
+                ("email", models.TextField()),
+                ("bio", models.TextField()),
+            ],
+            options={
+                "db_table": "social_media_profile_trigram",
+                "managed": False,
+            },
+        ),
+        migrations.RunPython(
+            run_on_sqlite(CREATE_SQL), run_on_sqlite(DROP_SQL)
+        ),
+    ]
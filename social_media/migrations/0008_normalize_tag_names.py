@@ -0,0 +1,71 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+def normalize(name):
+    return " ".join(name.strip().lstrip("#").split()).casefold()
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    """
+    Normalize tag names and fold tags that collide after normalization
+    into the one with the lowest id.
+    """
+    Tag = apps.get_model("social_media", "Tag")
+    PostTags = apps.get_model("social_media", "Post").tags.through
+
+    canonical = {}
+    for tag in Tag.objects.order_by("id"):
+        name = normalize(tag.name)
+        if name not in canonical:
+            canonical[name] = tag
+            if tag.name != name:
+                tag.name = name
+                tag.save(update_fields=["name"])
+            continue
+
+        keep = canonical[name]
+        tagged = set(
+            PostTags.objects.filter(tag_id=keep.id).values_list(
+                "post_id", flat=True
+            )
+        )
+        PostTags.objects.bulk_create(
+            [
+                PostTags(post_id=post_id, tag_id=keep.id)
+                for post_id in PostTags.objects.filter(
+                    tag_id=tag.id
+                ).values_list("post_id", flat=True)
+                if post_id not in tagged
+            ]
+        )
+        tag.delete()
+
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(
+            """
+            UPDATE social_media_post_fts SET tags = (
+                SELECT coalesce(group_concat(t.name, ' '), '')
+                FROM social_media_tag t
+                JOIN social_media_post_tags pt ON pt.tag_id = t.id
+                WHERE pt.post_id = social_media_post_fts.rowid
+            )
+            """
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0007_profile_search_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="tag",
+            name="name",
+            field=models.CharField(max_length=50, unique=True),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:27
+
+import django.db.models.deletion
+from datetime import datetime, timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_usage(apps, schema_editor):
+    """
+    Count tag usage of the posts created within the last seven days.
+    """
+    Post = apps.get_model("social_media", "Post")
+    TagUsage = apps.get_model("social_media", "TagUsage")
+
+    size = 600  # seconds, the default TRENDING_BUCKET_SIZE
+    counts = {}
+    posts = Post.objects.filter(
+        created_at__gt=timezone.now() - timedelta(days=7)
+    ).prefetch_related("tags")
+    for post in posts.iterator(chunk_size=2000):
+        timestamp = post.created_at.timestamp()
+        bucket = datetime.fromtimestamp(
+            timestamp - timestamp % size, tz=post.created_at.tzinfo
+        )
+        for tag in post.tags.all():
+            counts[tag.id, bucket] = counts.get((tag.id, bucket), 0) + 1
+
+    TagUsage.objects.bulk_create(
+        [
+            TagUsage(tag_id=tag_id, bucket=bucket, count=count)
+            for (tag_id, bucket), count in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0008_normalize_tag_names"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TagUsage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket", models.DateTimeField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "tag",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="usage",
+                        to="social_media.tag",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["bucket"], name="tag_usage_bucket_idx")
+                ],
+                "unique_together": {("tag", "bucket")},
+            },
+        ),
+        migrations.RunPython(backfill_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:29
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    """
+    Keep the oldest like of every (post, user) pair and fix the like
+    counters of the posts that had duplicates.
+    """
+    Like = apps.get_model("social_media", "Like")
+    Post = apps.get_model("social_media", "Post")
+
+    duplicates = (
+        Like.objects.values("post", "user")
+        .annotate(first=Min("id"), total=Count("id"))
+        .filter(total__gt=1)
+    )
+    for row in duplicates:
+        Like.objects.filter(post=row["post"], user=row["user"]).exclude(
+            id=row["first"]
+        ).delete()
+        Post.objects.filter(id=row["post"]).update(
+            likes_count=Like.objects.filter(post=row["post"]).count()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0009_tagusage"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_likes, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name="like",
+            unique_together={("post", "user")},
+        ),
+    ]
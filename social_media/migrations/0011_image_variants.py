@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0010_unique_like"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="media_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="profile",
+            name="profile_picture_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
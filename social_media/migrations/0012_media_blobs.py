@@ -0,0 +1,59 @@
+# Generated by Django 5.1.5 on 2026-10-18 19:50
+
+import social_media.models
+import social_media.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0011_image_variants"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="post",
+            name="media",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=social_media.storage.media_storage,
+                upload_to=social_media.models.image_upload,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="profile",
+            name="profile_picture",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=social_media.storage.media_storage,
+                upload_to=social_media.models.image_upload,
+            ),
+        ),
+        migrations.CreateModel(
+            name="MediaBlob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("refcount", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["refcount", "updated_at"], name="blob_unused_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.1.5 on 2026-10-18 20:41
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+# Must match social_media.comments
+PATH_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+PATH_STEP = 7
+
+
+def set_paths(apps, schema_editor):
+    """
+    Existing comments become top-level comments of their post.
+    """
+    Comment = apps.get_model("social_media", "Comment")
+    comments = list(Comment.objects.only("id"))
+    for comment in comments:
+        segment, number = "", comment.id
+        while number:
+            number, digit = divmod(number, len(PATH_DIGITS))
+            segment = PATH_DIGITS[digit] + segment
+        comment.path = segment.rjust(PATH_STEP, "0")
+    Comment.objects.bulk_update(comments, ["path"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_media", "0012_media_blobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="created_at",
+            field=models.DateTimeField(
+                auto_now_add=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="replies",
+                to="social_media.comment",
+            ),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="path",
+            field=models.CharField(default="", editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["post", "path"], name="comment_thread_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["post", "parent", "-created_at", "-id"],
+                name="comment_recent_idx",
+            ),
+        ),
+    ]
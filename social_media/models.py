@@ -5,6 +5,9 @@ import uuid
 from django.utils.text import slugify
 from django.conf import settings
 from django.db import models
+from django.db.models import Lookup
+
+from social_media.storage import media_storage
 
 
 # Create your models here.
@@ -39,20 +42,87 @@ class Profile(models.Model):
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
     profile_picture = models.ImageField(
-        upload_to=image_upload, null=True, blank=True
+        upload_to=image_upload,
+        storage=media_storage,
+        null=True,
+        blank=True,
+    )
+    profile_picture_variants = models.JSONField(
+        default=dict, blank=True, editable=False
     )
     bio = models.TextField(null=True, blank=True)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    posts_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ("id",)
 
     def __str__(self):
         return f"{self.username}"
 
 
+class TagManager(models.Manager):
+    def resolve(self, names):
+        """
+        Return Tag objects for the given names, creating missing ones.
+
+        Names are normalized and deduplicated first. Existing tags are
+        fetched with one query; missing ones are inserted with a single
+        bulk_create that tolerates concurrent inserts and read back.
+        """
+        names = {Tag.normalize(name) for name in names} - {""}
+        if not names:
+            return []
+
+        tags = list(self.filter(name__in=names))
+        missing = names - {tag.name for tag in tags}
+        if missing:
+            self.bulk_create(
+                [Tag(name=name) for name in missing], ignore_conflicts=True
+            )
+            tags += list(self.filter(name__in=missing))
+        return tags
+
+
 class Tag(models.Model):
-    name = models.CharField(max_length=50)
+    name = models.CharField(max_length=50, unique=True)
+
+    objects = TagManager()
 
     def __str__(self):
         return f"#{self.name}"
 
+    def save(self, *args, **kwargs):
+        self.name = self.normalize(self.name)
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        return " ".join(name.strip().lstrip("#").split()).casefold()
+
+
+class TagUsage(models.Model):
+    """
+    Number of posts tagged with a tag within one time bucket,
+    see social_media.trending.
+    """
+
+    tag = models.ForeignKey(
+        Tag, on_delete=models.CASCADE, related_name="usage"
+    )
+    bucket = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("tag", "bucket")
+        indexes = [
+            models.Index(fields=["bucket"], name="tag_usage_bucket_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.tag} used {self.count} times from {self.bucket}"
+
 
 class Post(models.Model):
     author = models.ForeignKey(
@@ -60,21 +130,68 @@ class Post(models.Model):
     )
     post_content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
-    media = models.ImageField(upload_to=image_upload, null=True, blank=True)
+    media = models.ImageField(
+        upload_to=image_upload,
+        storage=media_storage,
+        null=True,
+        blank=True,
+    )
+    media_variants = models.JSONField(default=dict, blank=True, editable=False)
     tags = models.ManyToManyField(Tag, blank=True, related_name="posts")
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ("-created_at", "-id")
+        indexes = [
+            models.Index(
+                fields=["-created_at", "-id"], name="post_recent_idx"
+            ),
+            models.Index(
+                fields=["author", "-created_at", "-id"],
+                name="post_author_recent_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.author} posted: {self.post_content}"
 
 
 class Comment(models.Model):
+    """
+    A comment on a post, or a reply to another comment.
+
+    `path` is the materialized path of the comment in its thread: the
+    fixed-width ids of its ancestors and itself, so that ordering by
+    path lists threads depth first and a subtree is one range of paths.
+    See social_media.comments.
+    """
+
     post = models.ForeignKey(
         Post, on_delete=models.CASCADE, related_name="comments"
     )
     author = models.ForeignKey(
         Profile, on_delete=models.CASCADE, related_name="comments"
     )
+    parent = models.ForeignKey(
+        "self",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="replies",
+    )
+    path = models.CharField(max_length=255, editable=False)
     content = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["post", "path"], name="comment_thread_idx"),
+            models.Index(
+                fields=["post", "parent", "-created_at", "-id"],
+                name="comment_recent_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.author} commented on {self.post}: {self.content}"
@@ -88,6 +205,9 @@ class Like(models.Model):
         Profile, on_delete=models.CASCADE, related_name="likes"
     )
 
+    class Meta:
+        unique_together = ("post", "user")
+
     def __str__(self):
         return f"{self.user}"
 
@@ -106,3 +226,149 @@ class Follow(models.Model):
 
     def __str__(self):
         return f"{self.follower} follows {self.following}"
+
+
+class TimelineEntry(models.Model):
+    owner = models.ForeignKey(
+        Profile, on_delete=models.CASCADE, related_name="timeline"
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    author = models.ForeignKey(
+        Profile, on_delete=models.CASCADE, related_name="+"
+    )
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("owner", "post")
+        indexes = [
+            models.Index(
+                fields=["owner", "-created_at", "-post"],
+                name="timeline_owner_recent_idx",
+            ),
+            models.Index(
+                fields=["owner", "author"],
+                name="timeline_owner_author_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.post} in {self.owner}'s timeline"
+
+
+class MediaBlob(models.Model):
+    """
+    A file of the content-addressed media storage and the number of
+    image and variant fields referring to it.
+
+    References are counted by social_media.blobs; blobs nobody refers
+    to are deleted by the collect_media_garbage command.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["refcount", "updated_at"], name="blob_unused_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
+
+
+class FullTextField(models.TextField):
+    """
+    The hidden column of an FTS5 table that carries its name;
+    supports the `match` lookup.
+    """
+
+
+@FullTextField.register_lookup
+class Match(Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", lhs_params + rhs_params
+
+
+class PostSearchIndex(models.Model):
+    """
+    Read-only view of the FTS5 index over post content and tag names.
+
+    The table is created by migration 0006 on SQLite and kept in sync
+    with Post, Post.tags and Tag by the signal handlers in
+    social_media.signals, which call social_media.search. Bulk paths
+    that skip signals (bulk_create, update, raw SQL) must be followed
+    by the rebuild_search_index command.
+    """
+
+    post = models.OneToOneField(
+        Post,
+        primary_key=True,
+        db_column="rowid",
+        on_delete=models.DO_NOTHING,
+        related_name="search_index",
+    )
+    document = FullTextField(db_column="social_media_post_fts")
+    post_content = models.TextField()
+    tags = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = "social_media_post_fts"
+
+
+class ProfileSearchIndex(models.Model):
+    """
+    Read-only view of the word-level FTS5 index over profile names,
+    with prefix indexes for typeahead. Created by migration 0007.
+    """
+
+    profile = models.OneToOneField(
+        Profile,
+        primary_key=True,
+        db_column="rowid",
+        on_delete=models.DO_NOTHING,
+        related_name="search_index",
+    )
+    document = FullTextField(db_column="social_media_profile_fts")
+    username = models.TextField()
+    first_name = models.TextField()
+    last_name = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = "social_media_profile_fts"
+
+
+class ProfileTrigramIndex(models.Model):
+    """
+    Read-only view of the trigram FTS5 index over profile fields,
+    used for substring filters and fuzzy matching.
+    Created by migration 0007.
+    """
+
+    profile = models.OneToOneField(
+        Profile,
+        primary_key=True,
+        db_column="rowid",
+        on_delete=models.DO_NOTHING,
+        related_name="trigram_index",
+    )
+    document = FullTextField(db_column="social_media_profile_trigram")
+    username = models.TextField()
+    first_name = models.TextField()
+    last_name = models.TextField()
+    email = models.TextField()
+    bio = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = "social_media_profile_trigram"
@@ -0,0 +1,260 @@
+import base64
+import binascii
+import bisect
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque-cursor pagination over a unique ordering.
+
+    Each page is fetched with a WHERE clause on the ordering columns
+    of the last row seen, so deep pages cost the same as the first one
+    and no OFFSET or COUNT(*) is ever issued.
+    """
+
+    ordering = ("id",)
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Like paginate_queryset, evaluating the page with the async ORM.
+        """
+        queryset = self.get_page_queryset(queryset, request)
+        return self.set_page([obj async for obj in queryset])
+
+    def get_page_queryset(self, queryset, request):
+        """
+        Return the queryset for the requested page, with one extra row
+        to tell whether there is a page after it.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = [
+            self._get_field(queryset.model, name.lstrip("-"))
+            for name in self.ordering
+        ]
+        self.position, self.reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [self._flip(name) for name in ordering]
+
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            queryset = queryset.filter(self._after(ordering, self.position))
+        return queryset[: self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if self.reverse:
+            results.reverse()
+
+        self.has_next = has_more if not self.reverse else True
+        self.has_previous = (
+            has_more if self.reverse else self.position is not None
+        )
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {
+                    "type": "string",
+                    "nullable": True,
+                    "format": "uri",
+                },
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "The pagination cursor value.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page.",
+                "schema": {"type": "integer"},
+            },
+        ]
+
+    def encode_cursor(self, obj, reverse):
+        payload = {
+            "p": [
+                (
+                    field.value_to_string(obj)
+                    if not isinstance(field, str)
+                    else getattr(obj, field)
+                )
+                for field in self.fields
+            ],
+            "r": reverse,
+        }
+        cursor = base64.urlsafe_b64encode(
+            json.dumps(payload, separators=(",", ":")).encode()
+        ).decode()
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, cursor
+        )
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            values = payload["p"]
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [
+                field.to_python(value) if not isinstance(field, str) else value
+                for field, value in zip(self.fields, values)
+            ]
+            return position, bool(payload.get("r"))
+        except (
+            binascii.Error,
+            KeyError,
+            TypeError,
+            ValueError,
+            ValidationError,
+        ):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def _get_field(model, name):
+        """
+        Return the model field for an ordering name, or the name itself
+        when ordering by an annotation whose values are JSON-serializable.
+        """
+        try:
+            return model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return name
+
+    @staticmethod
+    def _flip(name):
+        return name[1:] if name.startswith("-") else f"-{name}"
+
+    @staticmethod
+    def _after(ordering, position):
+        """
+        Build the lexicographic "comes after position" condition,
+        e.g. (a < x) OR (a = x AND b < y) for ordering ("-a", "-b").
+        """
+        condition = Q()
+        equal = Q()
+        for name, value in zip(ordering, position):
+            field = name.lstrip("-")
+            lookup = "lt" if name.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{field}__{lookup}": value})
+            equal &= Q(**{field: value})
+        return condition
+
+
+class PostPagination(KeysetPagination):
+    ordering = ("-created_at", "-id")
+
+
+class ProfilePagination(KeysetPagination):
+    ordering = ("id",)
+
+
+class ProfileIdPagination(ProfilePagination):
+    """
+    Pages through profiles whose ids were computed outside the
+    database, e.g. by the follow graph, querying only the ids that can
+    be on the requested page.
+    """
+
+    def paginate_ids(self, ids, queryset, request, view=None):
+        """
+        ids must be sorted in ascending order.
+        """
+        self.fields = [self._get_field(queryset.model, "id")]
+        position, reverse = self.decode_cursor(request)
+        page_size = self.get_page_size(request)
+        if position is None:
+            window = ids[: page_size + 1]
+        elif reverse:
+            end = bisect.bisect_left(ids, position[0])
+            start = max(end - page_size - 1, 0)
+            window = ids[start:end]
+        else:
+            start = bisect.bisect_right(ids, position[0])
+            end = start + page_size + 1
+            window = ids[start:end]
+        return self.paginate_queryset(
+            queryset.filter(id__in=window), request, view
+        )
+
+
+class TimelinePagination(KeysetPagination):
+    ordering = ("-created_at", "-post_id")
+
+
+class CommentPagination(KeysetPagination):
+    # Depth-first thread order; see social_media.comments.
+    ordering = ("path",)
+
+
+class SearchPagination(KeysetPagination):
+    ordering = ("score", "id")
@@ -7,7 +7,7 @@ class ProfilePermission(BasePermission):
         return request.method in ["GET"] or request.user.is_authenticated
 
     def has_object_permission(self, request, view, obj):
-        return obj.user == request.user or request.method in ["GET"]
+        return request.method in ["GET"] or obj.user == request.user
 
 
 class PostPermission(BasePermission):
@@ -15,4 +15,4 @@ class PostPermission(BasePermission):
         return request.method in ["GET"] or request.user.is_authenticated
 
     def has_object_permission(self, request, view, obj):
-        return obj.author.user == request.user or request.method in ["GET"]
+        return request.method in ["GET"] or obj.author.user == request.user
@@ -0,0 +1,443 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from social_media import reactions
+from social_media.models import Like, Post, Profile
+
+logger = logging.getLogger(__name__)
+
+# Number of (post, profile) intents written per transaction on flush.
+FLUSH_BATCH_SIZE = 500
+
+
+class MemoryStore:
+    """
+    Keeps pending intents in process memory.
+
+    Suitable for a single process and for tests. Intents that have been
+    drained but not yet written stay visible to reads until the flush
+    completes, so a like never disappears while it is being written.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.intents = {}
+        self.deltas = {}
+        self.flushing = {}
+        self.flushing_deltas = {}
+
+    def record(self, post_id, profile_id, liked, persisted) -> bool:
+        """
+        Set the intent of profile for a post and return the resulting
+        state. liked=None toggles the state the profile currently sees.
+        """
+        key = (post_id, profile_id)
+        with self.lock:
+            state = self.intents.get(key, self.flushing.get(key, persisted))
+            if liked is None:
+                liked = not state
+            self.intents[key] = liked
+            if liked != state:
+                self.deltas[post_id] = self.deltas.get(post_id, 0) + (
+                    1 if liked else -1
+                )
+        return liked
+
+    def pending(self, profile_id, post_ids) -> dict:
+        with self.lock:
+            result = {}
+            for post_id in post_ids:
+                key = (post_id, profile_id)
+                if key in self.intents:
+                    result[post_id] = self.intents[key]
+                elif key in self.flushing:
+                    result[post_id] = self.flushing[key]
+            return result
+
+    def pending_counts(self, post_ids) -> dict:
+        with self.lock:
+            return {
+                post_id: self.deltas.get(post_id, 0)
+                + self.flushing_deltas.get(post_id, 0)
+                for post_id in post_ids
+                if post_id in self.deltas or post_id in self.flushing_deltas
+            }
+
+    def size(self) -> int:
+        return len(self.intents)
+
+    def drain(self) -> dict:
+        """
+        Take the pending intents for writing. Returns an empty dict if
+        another flush is still in progress.
+        """
+        with self.lock:
+            if self.flushing:
+                return {}
+            self.flushing, self.intents = self.intents, {}
+            self.flushing_deltas, self.deltas = self.deltas, {}
+            return dict(self.flushing)
+
+    def forget(self, written, deltas) -> None:
+        """
+        Drop intents that have been written, and the deltas they applied
+        to the stored counters, from the ones being flushed.
+        """
+        with self.lock:
+            for key in written:
+                self.flushing.pop(key, None)
+            for post_id, delta in deltas.items():
+                self.flushing_deltas[post_id] = (
+                    self.flushing_deltas.get(post_id, 0) - delta
+                )
+
+    def done(self) -> None:
+        with self.lock:
+            self._forget_flushing()
+
+    def _forget_flushing(self) -> None:
+        self.flushing = {}
+        self.flushing_deltas = {}
+
+    def requeue(self) -> None:
+        """
+        Put drained intents back after a failed flush. Intents recorded
+        in the meantime take precedence.
+        """
+        with self.lock:
+            self.intents = {**self.flushing, **self.intents}
+            for post_id, delta in self.flushing_deltas.items():
+                self.deltas[post_id] = self.deltas.get(post_id, 0) + delta
+            self._forget_flushing()
+
+
+RECORD_SCRIPT = """
+local state = redis.call('HGET', KEYS[1], ARGV[1])
+if not state then
+    state = redis.call('HGET', KEYS[3], ARGV[1]) or ARGV[3]
+end
+local liked = ARGV[2]
+if liked == '' then
+    liked = state == '1' and '0' or '1'
+end
+redis.call('HSET', KEYS[1], ARGV[1], liked)
+if liked ~= state then
+    redis.call('HINCRBY', KEYS[2], ARGV[4], liked == '1' and 1 or -1)
+end
+return liked
+"""
+
+DRAIN_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return {}
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {}
+end
+redis.call('RENAME', KEYS[1], KEYS[3])
+redis.call('EXPIRE', KEYS[3], ARGV[1])
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('RENAME', KEYS[2], KEYS[4])
+    redis.call('EXPIRE', KEYS[4], ARGV[1])
+end
+return redis.call('HGETALL', KEYS[3])
+"""
+
+REQUEUE_SCRIPT = """
+local intents = redis.call('HGETALL', KEYS[3])
+for i = 1, #intents, 2 do
+    redis.call('HSETNX', KEYS[1], intents[i], intents[i + 1])
+end
+local deltas = redis.call('HGETALL', KEYS[4])
+for i = 1, #deltas, 2 do
+    redis.call('HINCRBY', KEYS[2], deltas[i], deltas[i + 1])
+end
+redis.call('DEL', KEYS[3], KEYS[4])
+"""
+
+
+class RedisStore:
+    """
+    Keeps pending intents in Redis so that every process sees them and
+    any process can flush them.
+
+    Intents live in a hash of "post:profile" -> "1"/"0" and per-post
+    deltas in a second hash. Draining renames both hashes atomically,
+    which also keeps a second flusher from picking up the same batch.
+    The drained copies expire after `flush_timeout` seconds in case the
+    flushing process dies.
+    """
+
+    def __init__(
+        self,
+        url="redis://localhost:6379/0",
+        prefix="reactions",
+        flush_timeout=60,
+    ):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.keys = [
+            f"{prefix}:intents",
+            f"{prefix}:deltas",
+            f"{prefix}:flushing",
+            f"{prefix}:flushing_deltas",
+        ]
+        self.flush_timeout = flush_timeout
+        self.record_script = self.client.register_script(RECORD_SCRIPT)
+        self.drain_script = self.client.register_script(DRAIN_SCRIPT)
+        self.requeue_script = self.client.register_script(REQUEUE_SCRIPT)
+
+    def record(self, post_id, profile_id, liked, persisted) -> bool:
+        result = self.record_script(
+            keys=self.keys,
+            args=[
+                f"{post_id}:{profile_id}",
+                "" if liked is None else int(liked),
+                int(persisted),
+                post_id,
+            ],
+        )
+        return result == "1"
+
+    def pending(self, profile_id, post_ids) -> dict:
+        post_ids = list(post_ids)
+        if not post_ids:
+            return {}
+        fields = [f"{post_id}:{profile_id}" for post_id in post_ids]
+        pipeline = self.client.pipeline()
+        pipeline.hmget(self.keys[0], fields)
+        pipeline.hmget(self.keys[2], fields)
+        current, flushing = pipeline.execute()
+        result = {}
+        for post_id, value, old in zip(post_ids, current, flushing):
+            if value is not None or old is not None:
+                result[post_id] = (value or old) == "1"
+        return result
+
+    def pending_counts(self, post_ids) -> dict:
+        post_ids = list(post_ids)
+        if not post_ids:
+            return {}
+        pipeline = self.client.pipeline()
+        pipeline.hmget(self.keys[1], post_ids)
+        pipeline.hmget(self.keys[3], post_ids)
+        current, flushing = pipeline.execute()
+        return {
+            post_id: int(value or 0) + int(old or 0)
+            for post_id, value, old in zip(post_ids, current, flushing)
+            if value is not None or old is not None
+        }
+
+    def size(self) -> int:
+        return self.client.hlen(self.keys[0])
+
+    def drain(self) -> dict:
+        values = self.drain_script(keys=self.keys, args=[self.flush_timeout])
+        intents = {}
+        for field, liked in zip(values[::2], values[1::2]):
+            post_id, profile_id = field.split(":")
+            intents[int(post_id), int(profile_id)] = liked == "1"
+        return intents
+
+    def forget(self, written, deltas) -> None:
+        pipeline = self.client.pipeline()
+        if written:
+            pipeline.hdel(
+                self.keys[2],
+                *[
+                    f"{post_id}:{profile_id}"
+                    for post_id, profile_id in written
+                ],
+            )
+        for post_id, delta in deltas.items():
+            pipeline.hincrby(self.keys[3], post_id, -delta)
+        pipeline.execute()
+
+    def done(self) -> None:
+        self.client.delete(self.keys[2], self.keys[3])
+
+    def requeue(self) -> None:
+        self.requeue_script(keys=self.keys)
+
+
+_store = None
+_store_lock = threading.Lock()
+_flusher = None
+
+
+def get_store():
+    """
+    Return the configured store, or None if reactions are written
+    directly.
+    """
+    global _store
+    if settings.REACTION_BUFFER_BACKEND is None:
+        return None
+    with _store_lock:
+        if _store is None:
+            backend = import_string(settings.REACTION_BUFFER_BACKEND)
+            _store = backend(**settings.REACTION_BUFFER_OPTIONS)
+        return _store
+
+
+@receiver(setting_changed)
+def reset_store(setting, **kwargs):
+    global _store
+    if setting.startswith("REACTION_BUFFER"):
+        _store = None
+
+
+def _flush_forever(interval):
+    while True:
+        time.sleep(interval)
+        close_old_connections()
+        try:
+            flush()
+        except Exception:
+            logger.exception("Flushing buffered reactions failed")
+        finally:
+            close_old_connections()
+
+
+def _start_flusher():
+    global _flusher
+    interval = settings.REACTION_BUFFER_FLUSH_INTERVAL
+    if interval is None or _flusher is not None:
+        return
+    with _store_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(
+                target=_flush_forever,
+                args=(interval,),
+                name="reaction-buffer-flusher",
+                daemon=True,
+            )
+            _flusher.start()
+            atexit.register(flush)
+
+
+def _persisted(post_ids, profile: Profile) -> set:
+    return set(
+        Like.objects.filter(user=profile, post_id__in=post_ids).values_list(
+            "post_id", flat=True
+        )
+    )
+
+
+def record(post_id: int, profile: Profile, liked) -> bool:
+    """
+    Like (liked=True), unlike (liked=False) or toggle (liked=None) a post
+    and return whether the profile now likes it.
+
+    With buffering enabled the intent is stored and written on the next
+    flush; otherwise it is written immediately.
+    """
+    store = get_store()
+    if store is None:
+        if liked is None:
+            liked = not reactions.unlike(post_id, profile)
+            if liked:
+                reactions.like(post_id, profile)
+        elif liked:
+            reactions.like(post_id, profile)
+        else:
+            reactions.unlike(post_id, profile)
+        return liked
+
+    persisted = post_id in _persisted([post_id], profile)
+    liked = store.record(post_id, profile.id, liked, persisted)
+    _after_record(store)
+    return liked
+
+
+def apply(profile: Profile, operations) -> dict:
+    """
+    Buffered counterpart of reactions.apply. Posts that do not exist are
+    reported right away; the rest are recorded as intents.
+    """
+    store = get_store()
+    if store is None:
+        return reactions.apply(profile, operations)
+
+    wanted = {}
+    for post_id, liked in operations:
+        wanted[post_id] = liked
+    existing = set(
+        Post.objects.filter(id__in=wanted).values_list("id", flat=True)
+    )
+    persisted = _persisted(existing, profile)
+
+    result = {"liked": [], "unliked": [], "missing": []}
+    for post_id, liked in sorted(wanted.items()):
+        if post_id not in existing:
+            result["missing"].append(post_id)
+            continue
+        store.record(post_id, profile.id, liked, post_id in persisted)
+        result["liked" if liked else "unliked"].append(post_id)
+    _after_record(store)
+    return result
+
+
+def _after_record(store):
+    if store.size() >= settings.REACTION_BUFFER_MAX_PENDING:
+        flush()
+    else:
+        _start_flusher()
+
+
+def pending_likes(profile: Profile, post_ids) -> dict:
+    """
+    Return {post_id: liked} for intents of profile not yet written.
+    """
+    store = get_store()
+    if store is None or profile is None:
+        return {}
+    return store.pending(profile.id, post_ids)
+
+
+def pending_counts(post_ids) -> dict:
+    """
+    Return {post_id: delta} to add to the stored like counters.
+    """
+    store = get_store()
+    if store is None:
+        return {}
+    return store.pending_counts(post_ids)
+
+
+def flush() -> int:
+    """
+    Write all pending intents in transactions of FLUSH_BATCH_SIZE.
+    Returns the number of intents written.
+
+    Each committed batch is dropped from the store right away, so that
+    a failing batch puts back only the intents that were not written.
+    """
+    store = get_store()
+    if store is None:
+        return 0
+
+    intents = store.drain()
+    if not intents:
+        return 0
+    items = list(intents.items())
+    try:
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            end = start + FLUSH_BATCH_SIZE
+            batch = dict(items[start:end])
+            _, deltas = reactions.write(batch)
+            store.forget(batch, deltas)
+    except Exception:
+        store.requeue()
+        raise
+    store.done()
+    return len(items)
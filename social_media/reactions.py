@@ -0,0 +1,132 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from social_media import counters
+from social_media.models import Like, Post, Profile
+
+# Upper bound for operations accepted by one bulk request.
+MAX_BULK_OPERATIONS = 500
+
+
+def like(post_id: int, profile: Profile) -> bool:
+    """
+    Like a post on behalf of profile.
+
+    Relies on the (post, user) unique constraint instead of checking
+    first, so concurrent requests cannot create duplicates.
+    Returns False if the post was already liked.
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                Like.objects.create(post_id=post_id, user=profile)
+        except IntegrityError:
+            return False
+        counters.adjust(Post, post_id, likes_count=1)
+    return True
+
+
+def unlike(post_id: int, profile: Profile) -> bool:
+    """
+    Remove the like of profile from a post with a single DELETE.
+    Returns False if the post was not liked.
+    """
+    with transaction.atomic():
+        deleted, _ = Like.objects.filter(
+            post_id=post_id, user=profile
+        ).delete()
+        if deleted:
+            counters.adjust(Post, post_id, likes_count=-deleted)
+    return bool(deleted)
+
+
+def write(intents) -> tuple:
+    """
+    Persist a batch of {(post_id, profile_id): liked} intents.
+
+    Current likes are read once, the difference is inserted or deleted
+    in bulk and counters are adjusted with one UPDATE per distinct
+    delta. Intents for posts or profiles that no longer exist are
+    dropped. Returns the ids of the missing posts and the
+    {post_id: delta} applied to the like counters.
+    """
+    post_ids = {post_id for post_id, _ in intents}
+    profile_ids = {profile_id for _, profile_id in intents}
+    with transaction.atomic():
+        existing = set(
+            Post.objects.filter(id__in=post_ids).values_list("id", flat=True)
+        )
+        profiles = set(
+            Profile.objects.filter(id__in=profile_ids).values_list(
+                "id", flat=True
+            )
+        )
+        intents = {
+            (post_id, profile_id): liked
+            for (post_id, profile_id), liked in intents.items()
+            if post_id in existing and profile_id in profiles
+        }
+        current = set(
+            Like.objects.filter(
+                post_id__in=existing, user_id__in=profiles
+            ).values_list("post_id", "user_id")
+        )
+
+        new = [pair for pair, liked in intents.items() if liked]
+        new = [pair for pair in new if pair not in current]
+        removed = [
+            pair
+            for pair, liked in intents.items()
+            if not liked and pair in current
+        ]
+
+        deltas = defaultdict(int)
+        if new:
+            Like.objects.bulk_create(
+                [
+                    Like(post_id=post_id, user_id=profile_id)
+                    for post_id, profile_id in new
+                ],
+                ignore_conflicts=True,
+            )
+            for post_id, _ in new:
+                deltas[post_id] += 1
+        if removed:
+            matches = Q()
+            for post_id, profile_id in removed:
+                matches |= Q(post_id=post_id, user_id=profile_id)
+            Like.objects.filter(matches).delete()
+            for post_id, _ in removed:
+                deltas[post_id] -= 1
+
+        by_delta = defaultdict(list)
+        for post_id, delta in deltas.items():
+            if delta:
+                by_delta[delta].append(post_id)
+        for delta, pks in by_delta.items():
+            counters.adjust_many(Post, pks, likes_count=delta)
+
+    return post_ids - existing, dict(deltas)
+
+
+def apply(profile: Profile, operations) -> dict:
+    """
+    Apply a batch of (post_id, liked) operations in one transaction.
+
+    Operations on the same post collapse to the last one. Posts that
+    do not exist are reported back instead of failing the batch.
+    """
+    wanted = {}
+    for post_id, liked in operations:
+        wanted[post_id] = liked
+
+    missing, _ = write(
+        {(post_id, profile.id): liked for post_id, liked in wanted.items()}
+    )
+    result = {"liked": [], "unliked": [], "missing": sorted(missing)}
+    for post_id, liked in sorted(wanted.items()):
+        if post_id not in missing:
+            result["liked" if liked else "unliked"].append(post_id)
+    return result
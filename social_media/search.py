@@ -0,0 +1,217 @@
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from social_media.models import Post, Profile
+
+# bm25() column weights: a hit in the post text counts twice as much
+# as a hit in the tag names.
+RANK_SQL = "bm25(social_media_post_fts, 2.0, 1.0)"
+SNIPPET_SQL = (
+    "snippet(social_media_post_fts, 0, '<mark>', '</mark>', '…', 16)"
+)
+# Usernames weigh more than first and last names.
+PROFILE_RANK_SQL = "bm25(social_media_profile_fts, 3.0, 1.0, 1.0)"
+PROFILE_FUZZY_RANK_SQL = (
+    "bm25(social_media_profile_trigram, 3.0, 1.0, 1.0, 0.0, 0.0)"
+)
+NAME_COLUMNS = "{username first_name last_name}"
+
+POST_INDEX_SQL = """
+    INSERT INTO social_media_post_fts(rowid, post_content, tags)
+    SELECT p.id, p.post_content,
+        (SELECT coalesce(group_concat(t.name, ' '), '')
+         FROM social_media_tag t
+         JOIN social_media_post_tags pt ON pt.tag_id = t.id
+         WHERE pt.post_id = p.id)
+    FROM social_media_post p
+"""
+PROFILE_INDEX_SQL = """
+    INSERT INTO social_media_profile_fts(
+        rowid, username, first_name, last_name
+    )
+    SELECT p.id, p.username, p.first_name, p.last_name
+    FROM social_media_profile p
+"""
+PROFILE_TRIGRAM_INDEX_SQL = """
+    INSERT INTO social_media_profile_trigram(
+        rowid, username, first_name, last_name, email, bio
+    )
+    SELECT p.id, p.username, p.first_name, p.last_name, u.email,
+        coalesce(p.bio, '')
+    FROM social_media_profile p JOIN user_user u ON u.id = p.user_id
+"""
+# Keeps the number of bound parameters well below SQLite's limit.
+CHUNK_SIZE = 500
+
+
+def _reindex(table, insert_sql, ids=None):
+    """
+    Rewrite the index rows for the given ids (all rows if ids is None)
+    from the source tables. Rows whose source is gone are dropped.
+    """
+    if connection.vendor != "sqlite":
+        return
+
+    with connection.cursor() as cursor:
+        if ids is None:
+            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(insert_sql)
+            return
+
+        ids = list(ids)
+        for start in range(0, len(ids), CHUNK_SIZE):
+            chunk = ids[start:start + CHUNK_SIZE]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(
+                f"DELETE FROM {table} WHERE rowid IN ({placeholders})", chunk
+            )
+            cursor.execute(
+                f"{insert_sql} WHERE p.id IN ({placeholders})", chunk
+            )
+
+
+def index_posts(ids=None):
+    """
+    Bring the post search index up to date for the given post ids,
+    or rebuild it entirely when no ids are given.
+    """
+    _reindex("social_media_post_fts", POST_INDEX_SQL, ids)
+
+
+def index_profiles(ids=None):
+    """
+    Bring both profile search indexes up to date for the given profile
+    ids, or rebuild them entirely when no ids are given.
+    """
+    _reindex("social_media_profile_fts", PROFILE_INDEX_SQL, ids)
+    _reindex("social_media_profile_trigram", PROFILE_TRIGRAM_INDEX_SQL, ids)
+
+
+def _quote(word: str) -> str:
+    return '"' + word.replace('"', '""') + '"'
+
+
+def to_match_query(text: str) -> str:
+    """
+    Turn free text into an FTS5 query matching every word,
+    with the last word treated as a prefix.
+
+    Words are quoted so FTS5 operators in user input are taken literally.
+    """
+    words = [_quote(word) for word in text.split()]
+    if not words:
+        return ""
+    words[-1] += "*"
+    return " ".join(words)
+
+
+def filter_posts(queryset, text: str):
+    """
+    Restrict a Post queryset to posts whose content or tags match text.
+    """
+    query = to_match_query(text)
+    if not query:
+        return queryset
+    if connection.vendor != "sqlite":
+        return queryset.filter(post_content__icontains=text)
+    return queryset.filter(search_index__document__match=query)
+
+
+def search_posts(text: str):
+    """
+    Return posts matching text annotated with their BM25 `score`
+    (lower is better) and a highlighted `snippet` of the content.
+    """
+    queryset = filter_posts(Post.objects.all(), text)
+    if connection.vendor != "sqlite" or not to_match_query(text):
+        queryset = queryset.annotate(
+            score=Value(0.0, output_field=FloatField()),
+            snippet=F("post_content"),
+        )
+        return queryset if to_match_query(text) else queryset.none()
+    return queryset.annotate(
+        score=RawSQL(RANK_SQL, (), output_field=FloatField()),
+        snippet=RawSQL(SNIPPET_SQL, ()),
+    )
+
+
+def filter_profiles(queryset, **filters):
+    """
+    Restrict a Profile queryset to profiles whose fields contain the given
+    substrings, e.g. filter_profiles(queryset, username="jo").
+
+    Substrings of three or more characters are looked up in the trigram
+    index; shorter ones fall back to icontains.
+    """
+    lookups = {
+        "email": "user__email",
+        "username": "username",
+        "first_name": "first_name",
+        "last_name": "last_name",
+        "bio": "bio",
+    }
+    for field, value in filters.items():
+        if not value:
+            continue
+        if connection.vendor != "sqlite" or len(value) < 3:
+            queryset = queryset.filter(
+                **{f"{lookups[field]}__icontains": value}
+            )
+            continue
+        queryset = queryset.filter(
+            trigram_index__document__match=f"{field} : {_quote(value)}"
+        )
+    return queryset
+
+
+def _profile_candidates(match, rank_sql, exclude, limit):
+    return list(
+        Profile.objects.filter(match)
+        .exclude(id__in=exclude)
+        .annotate(score=RawSQL(rank_sql, (), output_field=FloatField()))
+        .order_by("score", "id")[:limit]
+    )
+
+
+def typeahead_profiles(text: str, limit: int) -> list:
+    """
+    Suggest profiles for a partially typed name.
+
+    Profiles whose username, first or last name start with the typed
+    words come first. Remaining slots are filled with fuzzy matches
+    ranked by the number of trigrams they share with the input.
+    """
+    query = to_match_query(text)
+    if not query:
+        return []
+
+    if connection.vendor != "sqlite":
+        return list(
+            Profile.objects.filter(username__istartswith=text.strip())[
+                :limit
+            ]
+        )
+
+    profiles = _profile_candidates(
+        Q(search_index__document__match=f"{NAME_COLUMNS} : ({query})"),
+        PROFILE_RANK_SQL,
+        (),
+        limit,
+    )
+
+    normalized = " ".join(text.lower().split())
+    trigrams = {
+        "".join(chars)
+        for chars in zip(normalized, normalized[1:], normalized[2:])
+        if " " not in chars
+    }
+    if len(profiles) < limit and trigrams:
+        fuzzy = " OR ".join(_quote(trigram) for trigram in sorted(trigrams))
+        profiles += _profile_candidates(
+            Q(trigram_index__document__match=f"{NAME_COLUMNS} : ({fuzzy})"),
+            PROFILE_FUZZY_RANK_SQL,
+            [profile.id for profile in profiles],
+            limit - len(profiles),
+        )
+    return profiles
@@ -1,17 +1,212 @@
+from django.conf import settings
+from django.db import transaction
 from social_media.models import Follow, Like, Post, Profile, Tag, Comment
+from social_media import (
+    comments,
+    counters,
+    follows,
+    reaction_buffer,
+    reactions,
+    timeline,
+    trending,
+)
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class EagerLoadingMixin:
+    """
+    Declares the relations a serializer walks so that viewsets can load
+    them up front instead of issuing a query per row.
+    """
+
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, prefix=""):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(
+                *(prefix + field for field in cls.select_related_fields)
+            )
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(
+                *(prefix + field for field in cls.prefetch_related_fields)
+            )
+        return queryset
+
+
+class ViewerRelationListSerializer(serializers.ListSerializer):
+    """
+    Looks up the viewer's relation to the whole page with a single
+    IN query before the items are serialized.
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, "all") else data)
+        self.child.viewer_relations = self.child.get_viewer_relations(items)
+        return super().to_representation(items)
+
+
+class ViewerRelationMixin:
+    """
+    Base for serializers exposing a flag that depends on the current
+    viewer, e.g. whether they liked a post. Subclasses implement
+    relations_for(viewer, ids) returning the set of related ids.
+    """
+
+    viewer_relations = None
+
+    def get_viewer(self):
+        request = self.context.get("request")
+        user = getattr(request, "user", None)
+        if user is None or not user.is_authenticated:
+            return None
+        return getattr(user, "profile", None)
+
+    def get_viewer_relations(self, items):
+        viewer = self.get_viewer()
+        if viewer is None or not items:
+            return set()
+        ids = [item.id for item in items]
+        return self.merge_pending(
+            viewer, ids, set(self.relations_for(viewer, ids))
+        )
+
+    async def aget_viewer_relations(self, items):
+        """
+        Async counterpart of get_viewer_relations for async views,
+        which have to look the relations up before serializing.
+        """
+        viewer = self.get_viewer()
+        if viewer is None or not items:
+            return set()
+        ids = [item.id for item in items]
+        related = {pk async for pk in self.relations_for(viewer, ids)}
+        return self.merge_pending(viewer, ids, related)
+
+    def merge_pending(self, viewer, ids, related):
+        return related
+
+    def is_related(self, instance):
+        if self.viewer_relations is None:
+            self.viewer_relations = self.get_viewer_relations([instance])
+        return instance.id in self.viewer_relations
+
+
+class PostViewerMixin(ViewerRelationMixin):
+    """
+    Adds `liked_by_me` and `likes`, both including likes that are still
+    waiting in the reaction buffer.
+    """
+
+    pending_counts = None
+
+    def relations_for(self, viewer, ids):
+        return Like.objects.filter(user=viewer, post_id__in=ids).values_list(
+            "post_id", flat=True
+        )
+
+    def merge_pending(self, viewer, ids, related):
+        pending = reaction_buffer.pending_likes(viewer, ids)
+        for post_id, liked in pending.items():
+            if liked:
+                related.add(post_id)
+            else:
+                related.discard(post_id)
+        return related
+
+    def get_viewer_relations(self, items):
+        self.pending_counts = reaction_buffer.pending_counts(
+            [item.id for item in items]
+        )
+        return super().get_viewer_relations(items)
+
+    async def aget_viewer_relations(self, items):
+        self.pending_counts = reaction_buffer.pending_counts(
+            [item.id for item in items]
+        )
+        return await super().aget_viewer_relations(items)
+
+    def get_liked_by_me(self, post) -> bool:
+        return self.is_related(post)
+
+    def get_likes(self, post) -> int:
+        if self.pending_counts is None:
+            self.viewer_relations = self.get_viewer_relations([post])
+        return max(post.likes_count + self.pending_counts.get(post.id, 0), 0)
+
+
+class ProfileViewerMixin(ViewerRelationMixin):
+    def relations_for(self, viewer, ids):
+        return Follow.objects.filter(
+            follower=viewer, following_id__in=ids
+        ).values_list("following_id", flat=True)
+
+    def get_following(self, profile) -> bool:
+        return self.is_related(profile)
+
+
+@extend_schema_field(OpenApiTypes.OBJECT)
+class ImageVariantsField(serializers.Field):
+    """
+    Exposes the processed variants of an image field as
+    {variant: {"url", "width", "height"}}, empty until the current image
+    has been processed.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return getattr(instance, self.image_field), super().get_attribute(
+            instance
+        )
+
+    def to_representation(self, value):
+        image, variants = value
+        if (
+            not image
+            or variants.get("source") != image.name
+            or variants.get("status") != "ready"
+        ):
+            return {}
+
+        request = self.context.get("request")
+        result = {}
+        for name, variant in variants["variants"].items():
+            url = image.storage.url(variant["name"])
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            result[name] = {
+                "url": url,
+                "width": variant["width"],
+                "height": variant["height"],
+            }
+        return result
+
+
+class ProfileSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     email = serializers.EmailField(source="user.email", read_only=True)
+    profile_picture_variants = ImageVariantsField("profile_picture")
     is_active = serializers.BooleanField(
         source="user.is_active", read_only=True
     )
 
+    select_related_fields = ("user",)
+
     class Meta:
         model = Profile
         fields = "__all__"
-        read_only_fields = ("user",)
+        read_only_fields = (
+            "user",
+            "followers_count",
+            "following_count",
+            "posts_count",
+        )
 
     def create(self, validated_data):
         user = self.context["request"].user
@@ -19,15 +214,55 @@ class ProfileSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class ProfileListSerializer(serializers.ModelSerializer):
+class ProfileListSerializer(
+    ProfileViewerMixin, EagerLoadingMixin, serializers.ModelSerializer
+):
     email = serializers.EmailField(source="user.email")
     is_active = serializers.BooleanField(
         source="user.is_active", read_only=True
     )
+    following = serializers.SerializerMethodField()
+    profile_picture_variants = ImageVariantsField("profile_picture")
+
+    select_related_fields = ("user",)
 
     class Meta:
         model = Profile
-        fields = ("id", "username", "email", "profile_picture", "is_active")
+        list_serializer_class = ViewerRelationListSerializer
+        fields = (
+            "id",
+            "username",
+            "email",
+            "profile_picture",
+            "profile_picture_variants",
+            "is_active",
+            "followers_count",
+            "following_count",
+            "posts_count",
+            "following",
+        )
+
+
+class ProfileSuggestionSerializer(ProfileListSerializer):
+    overlap = serializers.IntegerField(read_only=True)
+
+    class Meta(ProfileListSerializer.Meta):
+        fields = ProfileListSerializer.Meta.fields + ("overlap",)
+
+
+class ProfileTypeaheadSerializer(serializers.ModelSerializer):
+    profile_picture_variants = ImageVariantsField("profile_picture")
+
+    class Meta:
+        model = Profile
+        fields = (
+            "id",
+            "username",
+            "first_name",
+            "last_name",
+            "profile_picture",
+            "profile_picture_variants",
+        )
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -44,53 +279,91 @@ class TagRetrieveSerializer(serializers.ModelSerializer):
         fields = ("name",)
 
 
+class TrendingTagSerializer(serializers.Serializer):
+    name = serializers.CharField(read_only=True)
+    score = serializers.FloatField(read_only=True)
+    uses = serializers.IntegerField(read_only=True)
+
+
 class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = "__all__"
 
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     add_your_tags = serializers.CharField(write_only=True, required=False)
+    media_variants = ImageVariantsField("media")
+
+    prefetch_related_fields = ("tags",)
 
     class Meta:
         model = Post
         fields = "__all__"
-        read_only_fields = ("author",)
+        read_only_fields = ("author", "likes_count", "comments_count")
+
+    def validate_add_your_tags(self, value):
+        names = [Tag.normalize(tag) for tag in value.split(",")]
+        max_length = Tag._meta.get_field("name").max_length
+        too_long = [name for name in names if len(name) > max_length]
+        if too_long:
+            raise serializers.ValidationError(
+                f"Tags must be at most {max_length} characters long: "
+                + ", ".join(too_long)
+            )
+        return names
+
+    def add_tags(self, validated_data, current=()):
+        if "add_your_tags" in validated_data:
+            tags = list(validated_data.get("tags", current))
+            tags += Tag.objects.resolve(validated_data.pop("add_your_tags"))
+            validated_data["tags"] = list(
+                {tag.id: tag for tag in tags}.values()
+            )
 
     def create(self, validated_data):
         author = self.context["request"].user.profile
         validated_data["author"] = author
-        if "add_your_tags" in validated_data:
-            tags = [
-                tag.strip()
-                for tag in validated_data.pop("add_your_tags").split(",")
-            ]
-            for tag in tags:
-                new_tag, _ = Tag.objects.get_or_create(name=tag)
-                validated_data["tags"].append(new_tag)
-        return super().create(validated_data)
+        with transaction.atomic():
+            self.add_tags(validated_data)
+            tags = validated_data.get("tags", [])
+            post = super().create(validated_data)
+            counters.adjust(Profile, author.id, posts_count=1)
+            timeline.fan_out_post(post)
+            trending.record([tag.id for tag in tags], post.created_at)
+        return post
 
     def update(self, instance, validated_data):
-        if "add_your_tags" in validated_data:
-            tags = [
-                tag.strip()
-                for tag in validated_data.pop("add_your_tags").split(",")
-            ]
-            for tag in tags:
-                new_tag, _ = Tag.objects.get_or_create(name=tag)
-                validated_data["tags"].append(new_tag)
-        return super().update(instance, validated_data)
-
-
-class PostListSerializer(serializers.ModelSerializer):
-    likes = serializers.IntegerField(source="likes.count", read_only=True)
+        with transaction.atomic():
+            self.add_tags(validated_data, current=instance.tags.all())
+            return super().update(instance, validated_data)
+
+
+class PostListSerializer(
+    PostViewerMixin, EagerLoadingMixin, serializers.ModelSerializer
+):
+    likes = serializers.SerializerMethodField()
+    liked_by_me = serializers.SerializerMethodField()
+    media_variants = ImageVariantsField("media")
     tags = TagRetrieveSerializer(many=True)
     author = serializers.CharField(source="author.username", read_only=True)
 
+    select_related_fields = ("author",)
+    prefetch_related_fields = ("tags",)
+
     class Meta:
         model = Post
-        fields = "id", "likes", "tags", "post_content", "author"
+        list_serializer_class = ViewerRelationListSerializer
+        fields = (
+            "id",
+            "likes",
+            "liked_by_me",
+            "comments_count",
+            "tags",
+            "post_content",
+            "media_variants",
+            "author",
+        )
         read_only_fields = ("author",)
 
     def create(self, validated_data):
@@ -99,43 +372,86 @@ class PostListSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class PostSearchSerializer(PostListSerializer):
+    score = serializers.FloatField(read_only=True)
+    snippet = serializers.CharField(read_only=True)
+
+    class Meta(PostListSerializer.Meta):
+        fields = PostListSerializer.Meta.fields + ("score", "snippet")
+
+
 class CommentInPostSerializer(serializers.ModelSerializer):
     author = serializers.CharField(source="author.username", read_only=True)
 
     class Meta:
         model = Comment
         fields = (
+            "id",
             "author",
             "content",
+            "created_at",
         )
 
-    def create(self, validated_data):
-        return super().create(validated_data)
 
-
-class CommentPostSerializer(serializers.ModelSerializer):
+class CommentPostSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     id = serializers.IntegerField(read_only=True)
     comment = CommentInPostSerializer(many=False, write_only=True)
     post_content = serializers.CharField(read_only=True)
-    comments = CommentSerializer(many=True, read_only=True)
 
     class Meta:
         model = Post
         fields = (
             "id",
             "post_content",
-            "comments",
             "comment",
         )
 
     def create(self, validated_data):
-        comment_data = validated_data.pop("comment")
         post = self.context["post"]
-        author = self.context["request"].user.profile
-        Comment.objects.create(author=author, post=post, **comment_data)
+        comments.create(
+            post,
+            self.context["request"].user.profile,
+            validated_data["comment"]["content"],
+        )
         return post
 
 
+class ThreadCommentSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    author = serializers.CharField(source="author.username", read_only=True)
+    depth = serializers.SerializerMethodField()
+
+    select_related_fields = ("author",)
+
+    class Meta:
+        model = Comment
+        fields = (
+            "id",
+            "parent",
+            "author",
+            "content",
+            "created_at",
+            "depth",
+        )
+
+    def get_depth(self, comment) -> int:
+        return comments.depth(comment)
+
+    def validate_parent(self, parent):
+        if parent is not None and parent.post_id != self.context["post"].id:
+            raise serializers.ValidationError(
+                "The comment belongs to another post."
+            )
+        return parent
+
+    def create(self, validated_data):
+        return comments.create(
+            self.context["post"],
+            self.context["request"].user.profile,
+            validated_data["content"],
+            validated_data.get("parent"),
+        )
+
+
 class LikeRetrieveSerializer(serializers.ModelSerializer):
     info = serializers.StringRelatedField(source="__str__")
 
@@ -144,19 +460,41 @@ class LikeRetrieveSerializer(serializers.ModelSerializer):
         fields = ("info",)
 
 
-class PostRetrieveSerializer(serializers.ModelSerializer):
+class PostRetrieveSerializer(
+    PostViewerMixin, EagerLoadingMixin, serializers.ModelSerializer
+):
     tags = TagRetrieveSerializer(many=True)
-    comments = CommentInPostSerializer(many=True, read_only=True)
-    likes = serializers.IntegerField(source="likes.count", read_only=True)
+    comments = CommentInPostSerializer(
+        source="comment_preview", many=True, read_only=True
+    )
+    likes = serializers.SerializerMethodField()
+    liked_by_me = serializers.SerializerMethodField()
+    media_variants = ImageVariantsField("media")
     liked_users = LikeRetrieveSerializer(
         source="likes", many=True, read_only=True
     )
     author = serializers.CharField(source="author.username", read_only=True)
 
+    select_related_fields = ("author",)
+    prefetch_related_fields = ("tags", "likes__user")
+
     class Meta:
         model = Post
+        list_serializer_class = ViewerRelationListSerializer
         fields = "__all__"
 
+    @classmethod
+    def setup_eager_loading(cls, queryset, prefix=""):
+        """
+        Also prefetch the preview of the latest top-level comments; the
+        full threads are served by the comments endpoint.
+        """
+        return (
+            super()
+            .setup_eager_loading(queryset, prefix)
+            .prefetch_related(comments.preview(prefix))
+        )
+
 
 class LikeSerializer(serializers.ModelSerializer):
     class Meta:
@@ -164,6 +502,66 @@ class LikeSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class LikeOperationSerializer(serializers.Serializer):
+    post = serializers.IntegerField(min_value=1)
+    liked = serializers.BooleanField()
+
+
+class BulkLikeSerializer(serializers.Serializer):
+    operations = LikeOperationSerializer(
+        many=True, allow_empty=False, max_length=reactions.MAX_BULK_OPERATIONS
+    )
+
+
+class BulkLikeResultSerializer(serializers.Serializer):
+    liked = serializers.ListField(child=serializers.IntegerField())
+    unliked = serializers.ListField(child=serializers.IntegerField())
+    missing = serializers.ListField(child=serializers.IntegerField())
+
+
+class BulkFollowSerializer(serializers.Serializer):
+    follow = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        max_length=follows.MAX_BULK_FOLLOWS,
+    )
+    unfollow = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        max_length=follows.MAX_BULK_FOLLOWS,
+    )
+
+    def validate(self, attrs):
+        follow = set(attrs.setdefault("follow", []))
+        unfollow = set(attrs.setdefault("unfollow", []))
+        if not follow and not unfollow:
+            raise serializers.ValidationError(
+                "Provide profiles to follow or unfollow."
+            )
+        if follow & unfollow:
+            raise serializers.ValidationError(
+                "A profile cannot be both followed and unfollowed."
+            )
+        if self.context["profile"].id in follow:
+            raise serializers.ValidationError("You cannot follow yourself")
+        return attrs
+
+
+class BulkFollowResultSerializer(serializers.Serializer):
+    followed = serializers.ListField(child=serializers.IntegerField())
+    unfollowed = serializers.ListField(child=serializers.IntegerField())
+    missing = serializers.ListField(child=serializers.IntegerField())
+
+
+class ThumbnailSerializer(serializers.Serializer):
+    width = serializers.IntegerField(
+        min_value=1, max_value=settings.THUMBNAIL_MAX_WIDTH
+    )
+    format = serializers.ChoiceField(
+        choices=list(settings.THUMBNAIL_FORMATS), default="webp"
+    )
+
+
 class FollowSerializer(serializers.ModelSerializer):
     class Meta:
         model = Follow
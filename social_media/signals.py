@@ -0,0 +1,167 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import receiver
+
+from social_media import blobs, follow_graph, images, search, tasks
+from social_media.models import Follow, Post, Profile, Tag
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.index_posts([instance.pk])
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def index_post_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            search.index_posts([instance.pk])
+        return
+
+    if action == "pre_clear":
+        instance._cleared_post_ids = list(
+            instance.posts.values_list("id", flat=True)
+        )
+    elif action == "post_clear":
+        search.index_posts(getattr(instance, "_cleared_post_ids", []))
+    elif action in ("post_add", "post_remove"):
+        search.index_posts(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+def index_renamed_tag(sender, instance, created, **kwargs):
+    if not created:
+        search.index_posts(instance.posts.values_list("id", flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_posts(sender, instance, **kwargs):
+    instance._tagged_post_ids = list(
+        instance.posts.values_list("id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+def index_deleted_tag(sender, instance, **kwargs):
+    search.index_posts(getattr(instance, "_tagged_post_ids", []))
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def index_profile(sender, instance, **kwargs):
+    search.index_profiles([instance.pk])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def index_user_profile(sender, instance, created, **kwargs):
+    if not created:
+        search.index_profiles(
+            Profile.objects.filter(user=instance).values_list("id", flat=True)
+        )
+
+
+def schedule_image_processing(instance, kind, raw):
+    if raw or not images.needs_processing(instance, kind):
+        return
+    transaction.on_commit(lambda: tasks.process_image.delay(kind, instance.pk))
+
+
+@receiver(post_save, sender=Post)
+def process_post_media(sender, instance, raw=False, **kwargs):
+    schedule_image_processing(instance, "post", raw)
+
+
+@receiver(post_save, sender=Profile)
+def process_profile_picture(sender, instance, raw=False, **kwargs):
+    schedule_image_processing(instance, "profile", raw)
+
+
+def stored_references(instance, kind):
+    _, field, variants_field = images.IMAGE_FIELDS[kind]
+    return images.references(
+        getattr(instance, field).name, getattr(instance, variants_field)
+    )
+
+
+def remember_references(instance, kind):
+    """
+    Keep the files the stored row refers to, to count the references
+    that a save replaces.
+    """
+    model, field, variants_field = images.IMAGE_FIELDS[kind]
+    row = None
+    if not instance._state.adding:
+        row = (
+            model.objects.filter(pk=instance.pk)
+            .values_list(field, variants_field)
+            .first()
+        )
+    instance._stored_references = images.references(*row) if row else []
+
+
+def count_references(instance, kind, raw):
+    if raw:
+        return
+    blobs.adjust(
+        acquired=stored_references(instance, kind),
+        released=getattr(instance, "_stored_references", []),
+    )
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_media(sender, instance, raw=False, **kwargs):
+    if not raw:
+        remember_references(instance, "post")
+
+
+@receiver(pre_save, sender=Profile)
+def remember_profile_picture(sender, instance, raw=False, **kwargs):
+    if not raw:
+        remember_references(instance, "profile")
+
+
+@receiver(post_save, sender=Post)
+def count_post_media(sender, instance, raw=False, **kwargs):
+    count_references(instance, "post", raw)
+
+
+@receiver(post_save, sender=Profile)
+def count_profile_picture(sender, instance, raw=False, **kwargs):
+    count_references(instance, "profile", raw)
+
+
+@receiver(post_delete, sender=Post)
+def release_post_media(sender, instance, **kwargs):
+    blobs.adjust(released=stored_references(instance, "post"))
+
+
+@receiver(post_delete, sender=Profile)
+def release_profile_picture(sender, instance, **kwargs):
+    blobs.adjust(released=stored_references(instance, "profile"))
+
+
+@receiver(post_save, sender=Follow)
+def add_follow_to_graph(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(
+            lambda: follow_graph.follow_added(
+                instance.follower_id, instance.following_id
+            )
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def remove_follow_from_graph(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: follow_graph.follow_removed(
+            instance.follower_id, instance.following_id
+        )
+    )
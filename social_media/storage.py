@@ -0,0 +1,69 @@
+import hashlib
+import os
+import pathlib
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file under the SHA-256 of its content, so identical
+    uploads share one file and a stored file never changes.
+
+    The name passed to save() only contributes its extension. Files are
+    never overwritten or deleted on behalf of a single owner; owners are
+    counted in MediaBlob rows and unreferenced files are reclaimed by
+    the collect_media_garbage command.
+    """
+
+    directory = "blobs"
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is only known once the content has been hashed.
+        return name
+
+    def blob_name(self, digest: str, suffix: str) -> str:
+        return f"{self.directory}/{digest[:2]}/{digest[2:4]}/{digest}{suffix}"
+
+    def _save(self, name, content):
+        suffix = pathlib.PurePosixPath(name).suffix.lower()
+        directory = self.path(self.directory)
+        os.makedirs(directory, exist_ok=True)
+
+        # Hash while copying into a temporary file next to the blobs,
+        # so the content is read once and moved into place atomically.
+        digest = hashlib.sha256()
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(descriptor, "wb") as handle:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    handle.write(chunk)
+
+            name = self.blob_name(digest.hexdigest(), suffix)
+            path = self.path(name)
+            if os.path.exists(path):
+                os.remove(temporary)
+                # Keep a blob that is being reused away from collection.
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.chmod(temporary, self.file_permissions_mode or 0o644)
+                os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return name
+
+
+_storage = ContentAddressedStorage()
+
+
+def media_storage():
+    """
+    Storage of uploaded images; a callable so that migrations do not
+    depend on its settings.
+    """
+    return _storage
@@ -0,0 +1,19 @@
+from celery import shared_task
+
+from social_media import images, trending
+
+
+@shared_task
+def process_image(kind: str, pk: int) -> None:
+    """
+    Strip EXIF and produce the resized variants of an uploaded image.
+    """
+    images.process(kind, pk)
+
+
+@shared_task
+def prune_trending_tags() -> int:
+    """
+    Delete expired tag usage buckets; scheduled by CELERY_BEAT_SCHEDULE.
+    """
+    return trending.prune()
@@ -1,3 +1,2102 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+    force_authenticate,
+)
+from asgiref.sync import async_to_sync
+from PIL import Image
+from rest_framework_simplejwt.tokens import AccessToken
+
+from social_media.models import (
+    Comment,
+    Follow,
+    Like,
+    MediaBlob,
+    Post,
+    Profile,
+    Tag,
+    TagUsage,
+)
+from social_media import (
+    benchmarks,
+    blobs,
+    comments,
+    counters,
+    dataset,
+    follow_graph,
+    follows,
+    images,
+    metrics,
+    reaction_buffer,
+    reactions,
+    search,
+    tasks,
+    thumbnails,
+    timeline,
+    transfer,
+    trending,
+)
+from social_media.pagination import KeysetPagination, ProfileIdPagination
+from social_media.serializers import (
+    PostListSerializer,
+    ProfileListSerializer,
+)
+from social_media.views import PostViewSet, ProfileViewSet
+from social_media_api.celery import app
+from user.models import User
+
+
+def create_profile(username):
+    user = User.objects.create_user(email=f"{username}@example.com")
+    return Profile.objects.create(
+        user=user,
+        username=username,
+        first_name=username,
+        last_name=username,
+    )
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every read endpoint must issue the same number of queries
+    no matter how many rows it serializes.
+    """
+
+    def setUp(self):
+        self.profile = create_profile("viewer")
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+        self.target = create_profile("target")
+        self.post = self.create_post(self.target)
+        self.seeded = 0
+
+    def create_post(self, author):
+        post = Post.objects.create(author=author, post_content="content")
+        post.tags.add(*Tag.objects.resolve(["a", "b"]))
+        timeline.fan_out_post(post)
+        return post
+
+    def seed(self, count):
+        """
+        Add `count` more rows to every relation the endpoints walk.
+        """
+        for _ in range(count):
+            self.seeded += 1
+            other = create_profile(f"user{self.seeded}")
+            Follow.objects.create(follower=self.profile, following=other)
+            Follow.objects.create(follower=other, following=self.profile)
+            post = self.create_post(other)
+            Like.objects.create(post=post, user=self.profile)
+            Like.objects.create(post=self.post, user=other)
+            Comment.objects.create(
+                post=self.post, author=other, content="comment"
+            )
+        counters.reconcile_posts(Post.objects.all())
+        counters.reconcile_profiles(Profile.objects.all())
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url):
+        self.seed(2)
+        small = self.count_queries(url)
+        self.seed(8)
+        large = self.count_queries(url)
+        self.assertEqual(
+            small,
+            large,
+            f"{url} issued {small} queries for a small dataset "
+            f"and {large} for a large one",
+        )
+
+    def test_post_list(self):
+        self.assertConstantQueries(reverse("social_media:post-list"))
+
+    def test_post_detail(self):
+        self.assertConstantQueries(
+            reverse("social_media:post-detail", args=[self.post.id])
+        )
+
+    def test_post_comments(self):
+        self.assertConstantQueries(
+            reverse("social_media:post-comment", args=[self.post.id])
+        )
+
+    def test_comment_thread(self):
+        self.assertConstantQueries(
+            reverse("social_media:post-comments", args=[self.post.id])
+        )
+
+    def test_following_posts(self):
+        self.assertConstantQueries(
+            reverse("social_media:post-following-posts")
+        )
+
+    def test_liked_posts(self):
+        self.assertConstantQueries(reverse("social_media:post-likes"))
+
+    def test_profile_list(self):
+        self.assertConstantQueries(reverse("social_media:profile-list"))
+
+    def test_profile_detail(self):
+        self.assertConstantQueries(
+            reverse("social_media:profile-detail", args=[self.target.id])
+        )
+
+    def test_followers(self):
+        self.assertConstantQueries(reverse("social_media:profile-followers"))
+
+    def test_followings(self):
+        self.assertConstantQueries(reverse("social_media:profile-followings"))
+
+    def test_post_search(self):
+        self.assertConstantQueries(
+            reverse("social_media:post-search") + "?q=content"
+        )
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.profile = create_profile("viewer")
+        self.author = create_profile("author")
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+        self.feed = reverse("social_media:post-following-posts")
+
+    def follow(self, profile):
+        self.client.get(
+            reverse("social_media:profile-follow", args=[profile.id])
+        )
+
+    def create_post(self, author, content="content"):
+        self.client.force_authenticate(author.user)
+        response = self.client.post(
+            reverse("social_media:post-list"), {"post_content": content}
+        )
+        self.client.force_authenticate(self.profile.user)
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.data["id"]
+
+    def feed_ids(self, url=None):
+        response = self.client.get(url or self.feed)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [post["id"] for post in response.data["results"]]
+
+    def test_new_posts_are_fanned_out(self):
+        self.follow(self.author)
+        post_id = self.create_post(self.author)
+        self.assertTrue(self.profile.timeline.filter(post_id=post_id).exists())
+        self.assertEqual(self.feed_ids(), [post_id])
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        post_ids = [self.create_post(self.author) for _ in range(3)]
+        self.assertEqual(self.feed_ids(), [])
+
+        self.follow(self.author)
+        self.assertEqual(self.feed_ids(), post_ids[::-1])
+
+        self.follow(self.author)
+        self.assertEqual(self.feed_ids(), [])
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=0)
+    def test_high_follower_posts_are_pulled_on_read(self):
+        other = create_profile("other")
+        self.follow(self.author)
+        self.follow(other)
+        first = self.create_post(self.author)
+        second = self.create_post(other)
+        self.assertFalse(self.profile.timeline.exists())
+
+        self.assertEqual(self.feed_ids(), [second, first])
+        third = self.create_post(self.author)
+        self.assertEqual(self.feed_ids(), [third, second, first])
+
+    def test_fan_out_reads_a_fresh_follower_count(self):
+        self.follow(self.author)
+        post = Post.objects.create(author=self.author, post_content="c")
+        post.author.followers_count = 10**6
+        timeline.fan_out_post(post)
+        self.assertTrue(self.profile.timeline.filter(post=post).exists())
+
+    def test_pagination(self):
+        self.follow(self.author)
+        post_ids = [self.create_post(self.author) for _ in range(5)]
+        post_ids.reverse()
+
+        url = self.feed + "?page_size=2"
+        pages = []
+        while url:
+            response = self.client.get(url)
+            pages.append([post["id"] for post in response.data["results"]])
+            url = response.data["next"]
+        self.assertEqual(pages, [post_ids[:2], post_ids[2:4], post_ids[4:]])
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        author = create_profile("author")
+        self.client = APIClient()
+        self.client.force_authenticate(author.user)
+        posts = [
+            Post.objects.create(author=author, post_content=str(number))
+            for number in range(7)
+        ]
+        # Ties on created_at must be broken by id.
+        Post.objects.filter(id__in=[post.id for post in posts[2:5]]).update(
+            created_at=posts[2].created_at
+        )
+        self.post_ids = list(
+            Post.objects.order_by("-created_at", "-id").values_list(
+                "id", flat=True
+            )
+        )
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            pages.append([row["id"] for row in response.data["results"]])
+            url = response.data[link]
+        return pages, response.data
+
+    def test_next_and_previous(self):
+        url = reverse("social_media:post-list") + "?page_size=3"
+        pages, last = self.walk(url, "next")
+        self.assertEqual(
+            pages,
+            [self.post_ids[:3], self.post_ids[3:6], self.post_ids[6:]],
+        )
+
+        pages, first = self.walk(last["previous"], "previous")
+        self.assertEqual(pages, [self.post_ids[3:6], self.post_ids[:3]])
+        self.assertIsNotNone(first["next"])
+
+    def test_invalid_cursor(self):
+        for cursor in ("garbage", "e30=", "eyJwIjpbMV19"):
+            response = self.client.get(
+                reverse("social_media:post-list") + f"?cursor={cursor}"
+            )
+            self.assertEqual(response.status_code, 404, cursor)
+
+    def test_page_size_is_clamped(self):
+        paginator = KeysetPagination()
+        factory = APIRequestFactory()
+        for query, expected in (
+            ({}, paginator.page_size),
+            ({"page_size": "1000"}, paginator.max_page_size),
+            ({"page_size": "0"}, paginator.page_size),
+            ({"page_size": "x"}, paginator.page_size),
+            ({"page_size": "5"}, 5),
+        ):
+            request = Request(factory.get("/", query))
+            self.assertEqual(paginator.get_page_size(request), expected)
+
+    def paginate_ids(self, ids, url):
+        paginator = ProfileIdPagination()
+        request = Request(APIRequestFactory().get(url))
+        with self.assertNumQueries(1):
+            page = paginator.paginate_ids(ids, Profile.objects.all(), request)
+        return [profile.id for profile in page], paginator
+
+    def test_paginate_ids(self):
+        ids = sorted(create_profile(f"user{number}").id for number in range(5))
+        pages = []
+        url = "/?page_size=2"
+        while url:
+            page, paginator = self.paginate_ids(ids, url)
+            pages.append(page)
+            url = paginator.get_next_link()
+        self.assertEqual(pages, [ids[:2], ids[2:4], ids[4:]])
+
+        pages = []
+        url = paginator.get_previous_link()
+        while url:
+            page, paginator = self.paginate_ids(ids, url)
+            pages.append(page)
+            url = paginator.get_previous_link()
+        self.assertEqual(pages, [ids[2:4], ids[:2]])
+
+
+class PostSearchTests(TestCase):
+    def setUp(self):
+        self.profile = create_profile("viewer")
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+
+    def search(self, q):
+        response = self.client.get(
+            reverse("social_media:post-search"), {"q": q}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    def post(self, content, *tags):
+        post = Post.objects.create(author=self.profile, post_content=content)
+        post.tags.add(*Tag.objects.resolve(tags))
+        return post
+
+    def test_results_are_ranked_by_relevance(self):
+        long = self.post(
+            "A long post mentioning python once among many other words "
+            "about gardening, cooking and the weather this week"
+        )
+        focused = self.post("python tips: python idioms for python users")
+        short = self.post("Notes on python idioms")
+        results = self.search("python")
+        self.assertEqual(
+            [post["id"] for post in results], [focused.id, short.id, long.id]
+        )
+        scores = [post["score"] for post in results]
+        self.assertEqual(scores, sorted(scores))
+
+    def test_snippet_highlights_matches(self):
+        self.post("Release notes for the new garden planner")
+        [result] = self.search("gard")
+        self.assertEqual(
+            result["snippet"],
+            "Release notes for the new <mark>garden</mark> planner",
+        )
+
+    def test_tag_names_match(self):
+        post = self.post("Nothing to see in the text", "Django")
+        self.assertEqual([p["id"] for p in self.search("django")], [post.id])
+        self.assertEqual(self.search("flask"), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        post = self.post("first draft")
+        post.post_content = "final version"
+        post.save()
+        self.assertEqual(self.search("draft"), [])
+        self.assertEqual([p["id"] for p in self.search("final")], [post.id])
+
+        post.delete()
+        self.assertEqual(self.search("final"), [])
+
+    def test_index_follows_tag_changes(self):
+        post = self.post("Weekend plans", "hiking")
+        tag = Tag.objects.get(name="hiking")
+        tag.name = "trekking"
+        tag.save()
+        self.assertEqual(self.search("hiking"), [])
+        self.assertEqual([p["id"] for p in self.search("trek")], [post.id])
+
+        post.tags.clear()
+        self.assertEqual(self.search("trek"), [])
+        post.tags.add(tag)
+        tag.delete()
+        self.assertEqual(self.search("trek"), [])
+
+
+class ProfileSearchTests(TestCase):
+    def setUp(self):
+        self.alice = self.create("alice", "Alice", "Smith")
+        self.alina = self.create("alina", "Alina", "Jones")
+        self.bob = self.create("bob", "Robert", "Alison")
+        self.carol = self.create("carol", "Carol", "Brown")
+        self.typeahead = reverse("social_media:profile-typeahead")
+
+    @staticmethod
+    def create(username, first_name, last_name):
+        user = User.objects.create_user(email=f"{username}@example.com")
+        return Profile.objects.create(
+            user=user,
+            username=username,
+            first_name=first_name,
+            last_name=last_name,
+        )
+
+    def suggest(self, q, **params):
+        response = self.client.get(self.typeahead, {"q": q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [profile["username"] for profile in response.data]
+
+    def test_prefix_match(self):
+        self.assertEqual(self.suggest("car"), ["carol"])
+        # Fuzzy matches on "ali" follow the prefix match.
+        self.assertEqual(self.suggest("alice sm")[0], "alice")
+        self.assertEqual(self.suggest("rob"), ["bob"])
+
+    def test_username_matches_rank_first(self):
+        suggestions = self.suggest("ali")
+        self.assertEqual(set(suggestions), {"alice", "alina", "bob"})
+        self.assertEqual(suggestions[-1], "bob")
+
+    def test_fuzzy_matches_fill_remaining_slots(self):
+        self.assertEqual(self.suggest("lice"), ["alice"])
+        self.assertEqual(self.suggest("ali", limit=1), ["alice"])
+
+    def test_empty_query(self):
+        self.assertEqual(self.suggest(""), [])
+        self.assertEqual(self.suggest("   "), [])
+        self.assertEqual(self.client.get(self.typeahead).data, [])
+
+    def test_profile_list_filters(self):
+        url = reverse("social_media:profile-list")
+        for params, expected in (
+            ({"username": "lin"}, ["alina"]),
+            ({"username": "li"}, ["alice", "alina"]),
+            ({"last_name": "ison"}, ["bob"]),
+            ({"email": "carol@"}, ["carol"]),
+            ({"username": "al", "last_name": "smi"}, ["alice"]),
+        ):
+            response = self.client.get(url, params)
+            self.assertEqual(
+                [profile["username"] for profile in response.data["results"]],
+                expected,
+                params,
+            )
+
+    def test_index_follows_renames(self):
+        self.carol.username = "caroline"
+        self.carol.save()
+        self.assertEqual(self.suggest("carol"), ["caroline"])
+        self.carol.delete()
+        self.assertEqual(self.suggest("carol"), [])
+
+
+class TagTests(TestCase):
+    def names(self, tags):
+        return sorted(tag.name for tag in tags)
+
+    def test_normalize(self):
+        self.assertEqual(Tag.normalize("  #Django "), "django")
+        self.assertEqual(Tag.normalize("##Straße"), "strasse")
+        self.assertEqual(Tag.normalize("Open\t  Source"), "open source")
+        self.assertEqual(Tag.objects.create(name="#Python").name, "python")
+
+    def test_resolve_deduplicates(self):
+        tags = Tag.objects.resolve(["Django", "#django", " DJANGO ", "", "#"])
+        self.assertEqual(self.names(tags), ["django"])
+        self.assertEqual(Tag.objects.count(), 1)
+
+    def test_resolve_mixes_existing_and_missing_tags(self):
+        existing = Tag.objects.create(name="python")
+        with self.assertNumQueries(3):
+            tags = Tag.objects.resolve(["Python", "rust", "go"])
+        self.assertEqual(self.names(tags), ["go", "python", "rust"])
+        self.assertIn(existing, tags)
+        self.assertEqual(Tag.objects.count(), 3)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(Tag.objects.resolve(["rust", "go"])), 2)
+
+    def test_names_are_unique(self):
+        Tag.objects.create(name="python")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Tag.objects.create(name="#Python")
+
+    def test_post_creation_queries_do_not_grow_with_tags(self):
+        author = create_profile("author")
+        client = APIClient()
+        client.force_authenticate(author.user)
+
+        def count_queries(tags):
+            with CaptureQueriesContext(connection) as context:
+                response = client.post(
+                    reverse("social_media:post-list"),
+                    {"post_content": "content", "add_your_tags": tags},
+                )
+            self.assertEqual(response.status_code, 201, response.content)
+            self.assertEqual(
+                len(response.data["tags"]), len(set(tags.split(",")))
+            )
+            return len(context.captured_queries)
+
+        few = ",".join(f"new{number}" for number in range(2))
+        many = ",".join(f"tag{number}" for number in range(20))
+        self.assertEqual(count_queries(few), count_queries(many))
+        # Again, now that every tag exists.
+        self.assertEqual(count_queries(few), count_queries(many))
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        tags = {
+            tag.name: tag
+            for tag in Tag.objects.resolve(["fresh", "stale", "old"])
+        }
+        self.fresh, self.stale, self.old = (
+            tags["fresh"],
+            tags["stale"],
+            tags["old"],
+        )
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def use(self, tag, ago, times=1):
+        for _ in range(times):
+            trending.record([tag.id], self.now - ago)
+
+    def test_bucket_for(self):
+        size = settings.TRENDING_BUCKET_SIZE
+        bucket = trending.bucket_for(self.now)
+        self.assertLessEqual(bucket, self.now)
+        self.assertLess(self.now - bucket, size)
+        self.assertEqual(bucket.timestamp() % size.total_seconds(), 0)
+        self.assertEqual(trending.bucket_for(bucket), bucket)
+
+    def test_recent_usage_outranks_older_usage(self):
+        self.use(self.fresh, datetime.timedelta(minutes=5), times=3)
+        self.use(self.stale, datetime.timedelta(hours=20), times=5)
+        self.use(self.old, datetime.timedelta(days=3), times=50)
+
+        ranking = trending.rank("24h", now=self.now)
+        self.assertEqual(
+            [(tag["name"], tag["uses"]) for tag in ranking],
+            [("#fresh", 3), ("#stale", 5)],
+        )
+        self.assertGreater(ranking[0]["score"], ranking[1]["score"])
+        # Twenty hours is more than three six-hour half-lives.
+        self.assertLess(ranking[1]["score"], 5 / 8)
+
+        ranking = trending.rank("7d", now=self.now)
+        self.assertEqual(ranking[0]["name"], "#old")
+        self.assertEqual(
+            [tag["name"] for tag in trending.rank("1h", now=self.now)],
+            ["#fresh"],
+        )
+
+    def test_prune(self):
+        self.use(self.fresh, datetime.timedelta(minutes=5))
+        self.use(self.old, datetime.timedelta(days=8))
+        self.assertEqual(trending.prune(now=self.now), 1)
+        self.assertEqual(
+            list(TagUsage.objects.values_list("tag_id", flat=True)),
+            [self.fresh.id],
+        )
+
+    def test_prune_is_scheduled(self):
+        entry = settings.CELERY_BEAT_SCHEDULE["prune-trending-tags"]
+        self.assertEqual(entry["task"], tasks.prune_trending_tags.name)
+        self.assertIn(entry["task"], app.tasks)
+
+        self.use(self.old, datetime.timedelta(days=8))
+        self.assertEqual(tasks.prune_trending_tags.delay().get(), 1)
+
+    def test_endpoint(self):
+        author = create_profile("author")
+        client = APIClient()
+        client.force_authenticate(author.user)
+        for tags in ("fresh", "fresh,stale"):
+            client.post(
+                reverse("social_media:post-list"),
+                {"post_content": "content", "add_your_tags": tags},
+            )
+
+        url = reverse("social_media:tag-trending")
+        response = self.client.get(url, {"window": "1h", "limit": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(tag["name"], tag["uses"]) for tag in response.data],
+            [("#fresh", 2)],
+        )
+        response = self.client.get(url, {"window": "1y"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ViewerFlagTests(TestCase):
+    def setUp(self):
+        self.viewer = create_profile("viewer")
+        self.profiles = [
+            create_profile(f"user{number}") for number in range(6)
+        ]
+        self.posts = [
+            Post.objects.create(author=profile, post_content="content")
+            for profile in self.profiles
+        ]
+        for profile, post in zip(self.profiles[::2], self.posts[::2]):
+            Follow.objects.create(follower=self.viewer, following=profile)
+            Like.objects.create(post=post, user=self.viewer)
+        self.request = Request(APIRequestFactory().get("/"))
+        self.request.user = self.viewer.user
+
+    def serialize(self, serializer_class, queryset, queries=1):
+        rows = list(serializer_class.setup_eager_loading(queryset))
+        context = {"request": self.request}
+        with self.assertNumQueries(queries):
+            return serializer_class(rows, many=True, context=context).data
+
+    def test_liked_by_me(self):
+        data = self.serialize(PostListSerializer, Post.objects.order_by("id"))
+        self.assertEqual(
+            [post["liked_by_me"] for post in data], [True, False] * 3
+        )
+
+    def test_following(self):
+        data = self.serialize(
+            ProfileListSerializer,
+            Profile.objects.exclude(id=self.viewer.id).order_by("id"),
+        )
+        self.assertEqual(
+            [profile["following"] for profile in data], [True, False] * 3
+        )
+
+    def test_anonymous_viewer(self):
+        self.request.user = AnonymousUser()
+        data = self.serialize(PostListSerializer, Post.objects, queries=0)
+        self.assertFalse(any(post["liked_by_me"] for post in data))
+
+    def test_single_instance(self):
+        context = {"request": self.request}
+        self.assertTrue(
+            PostListSerializer(self.posts[0], context=context).data[
+                "liked_by_me"
+            ]
+        )
+        self.assertFalse(
+            ProfileListSerializer(self.profiles[1], context=context).data[
+                "following"
+            ]
+        )
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.profile = create_profile("viewer")
+        self.author = create_profile("author")
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+
+    def assertCounts(self, instance, **counts):
+        instance.refresh_from_db()
+        self.assertEqual(
+            {field: getattr(instance, field) for field in counts}, counts
+        )
+
+    def test_follow_and_unfollow(self):
+        follow = reverse("social_media:profile-follow", args=[self.author.id])
+        self.client.get(follow)
+        self.assertCounts(self.profile, following_count=1, followers_count=0)
+        self.assertCounts(self.author, following_count=0, followers_count=1)
+
+        self.client.get(follow)
+        self.assertCounts(self.profile, following_count=0)
+        self.assertCounts(self.author, followers_count=0)
+
+    def test_post_like_and_comment(self):
+        self.client.force_authenticate(self.author.user)
+        response = self.client.post(
+            reverse("social_media:post-list"), {"post_content": "content"}
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        post = Post.objects.get(id=response.data["id"])
+        self.assertCounts(self.author, posts_count=1)
+
+        self.client.force_authenticate(self.profile.user)
+        like = reverse("social_media:post-like", args=[post.id])
+        self.client.put(like)
+        self.assertCounts(post, likes_count=1)
+        self.client.delete(like)
+        self.assertCounts(post, likes_count=0)
+
+        response = self.client.post(
+            reverse("social_media:post-comments", args=[post.id]),
+            {"content": "comment"},
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertCounts(post, comments_count=1)
+
+        self.client.force_authenticate(self.author.user)
+        response = self.client.delete(
+            reverse("social_media:post-detail", args=[post.id])
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertCounts(self.author, posts_count=0)
+
+    def test_deleting_a_profile_updates_the_others(self):
+        post = Post.objects.create(author=self.author, post_content="content")
+        self.client.get(
+            reverse("social_media:profile-follow", args=[self.author.id])
+        )
+        self.client.put(reverse("social_media:post-like", args=[post.id]))
+        Comment.objects.create(post=post, author=self.profile, content="c")
+        counters.reconcile_posts(Post.objects.all())
+
+        response = self.client.delete(
+            reverse("social_media:profile-detail", args=[self.profile.id])
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertCounts(self.author, followers_count=0)
+        self.assertCounts(post, likes_count=0, comments_count=0)
+
+    def test_reconcile_counters_repairs_drift(self):
+        post = Post.objects.create(author=self.author, post_content="content")
+        Like.objects.create(post=post, user=self.profile)
+        Comment.objects.create(post=post, author=self.profile, content="c")
+        Follow.objects.create(follower=self.profile, following=self.author)
+        Post.objects.update(likes_count=7, comments_count=0)
+        Profile.objects.update(
+            followers_count=3, following_count=0, posts_count=9
+        )
+
+        out = io.StringIO()
+        call_command("reconcile_counters", "--batch-size", "1", stdout=out)
+        self.assertIn("Repaired 1 posts and 2 profiles.", out.getvalue())
+        self.assertCounts(post, likes_count=1, comments_count=1)
+        self.assertCounts(
+            self.profile, followers_count=0, following_count=1, posts_count=0
+        )
+        self.assertCounts(
+            self.author, followers_count=1, following_count=0, posts_count=1
+        )
+
+        out = io.StringIO()
+        call_command("reconcile_counters", stdout=out)
+        self.assertIn("Repaired 0 posts and 0 profiles.", out.getvalue())
+
+
+class LikeTests(TestCase):
+    def setUp(self):
+        self.profile = create_profile("viewer")
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+        self.post = Post.objects.create(
+            author=create_profile("author"), post_content="content"
+        )
+        self.like = reverse("social_media:post-like", args=[self.post.id])
+
+    def test_like_and_unlike_are_idempotent(self):
+        for _ in range(2):
+            response = self.client.put(self.like)
+            self.assertEqual(response.data, {"liked": True, "likes": 1})
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 1)
+
+        for _ in range(2):
+            response = self.client.delete(self.like)
+            self.assertEqual(response.data, {"liked": False, "likes": 0})
+        self.assertFalse(Like.objects.exists())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_like_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.put(self.like).status_code, 401)
+
+    def test_bulk_likes(self):
+        other = Post.objects.create(
+            author=self.post.author, post_content="other"
+        )
+        Like.objects.create(post=other, user=self.profile)
+        counters.reconcile_posts(Post.objects.all())
+
+        response = self.client.post(
+            reverse("social_media:post-bulk-likes"),
+            {
+                "operations": [
+                    {"post": self.post.id, "liked": False},
+                    {"post": self.post.id, "liked": True},
+                    {"post": other.id, "liked": False},
+                    {"post": 999, "liked": True},
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            response.data,
+            {"liked": [self.post.id], "unliked": [other.id], "missing": [999]},
+        )
+        self.assertEqual(
+            list(Like.objects.values_list("post_id", flat=True)),
+            [self.post.id],
+        )
+        self.assertEqual(
+            dict(Post.objects.values_list("id", "likes_count")),
+            {self.post.id: 1, other.id: 0},
+        )
+
+    def test_bulk_likes_rejects_empty_operations(self):
+        response = self.client.post(
+            reverse("social_media:post-bulk-likes"),
+            {"operations": []},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_duplicate_likes_are_rejected(self):
+        Like.objects.create(post=self.post, user=self.profile)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Like.objects.create(post=self.post, user=self.profile)
+
+
+@override_settings(
+    REACTION_BUFFER_BACKEND="social_media.reaction_buffer.MemoryStore",
+    REACTION_BUFFER_FLUSH_INTERVAL=None,
+)
+class ReactionBufferTests(TestCase):
+    def setUp(self):
+        self.profile = create_profile("viewer")
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+        self.post = Post.objects.create(
+            author=create_profile("author"), post_content="content"
+        )
+        self.detail = reverse("social_media:post-detail", args=[self.post.id])
+        self.like = reverse("social_media:post-like", args=[self.post.id])
+        self.addCleanup(
+            reaction_buffer.reset_store, setting="REACTION_BUFFER_BACKEND"
+        )
+
+    def test_pending_like_is_visible_before_flush(self):
+        response = self.client.put(self.like)
+        self.assertEqual(response.data, {"liked": True, "likes": 1})
+        self.assertFalse(Like.objects.exists())
+
+        response = self.client.get(self.detail)
+        self.assertTrue(response.data["liked_by_me"])
+        self.assertEqual(response.data["likes"], 1)
+
+        self.assertEqual(reaction_buffer.flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(self.client.get(self.detail).data["likes"], 1)
+
+    def test_toggles_collapse_into_one_write(self):
+        reaction = reverse("social_media:post-reaction", args=[self.post.id])
+        for _ in range(3):
+            self.client.get(reaction)
+        self.assertEqual(self.client.get(self.detail).data["likes"], 1)
+
+        with CaptureQueriesContext(connection) as context:
+            reaction_buffer.flush()
+        inserts = [
+            query
+            for query in context.captured_queries
+            if query["sql"].startswith("INSERT")
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 1)
+
+    def test_unlike_of_stored_like(self):
+        Like.objects.create(post=self.post, user=self.profile)
+        counters.reconcile_posts(Post.objects.all())
+
+        response = self.client.delete(self.like)
+        self.assertEqual(response.data, {"liked": False, "likes": 0})
+        self.assertFalse(self.client.get(self.detail).data["liked_by_me"])
+
+        reaction_buffer.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        self.assertFalse(Like.objects.exists())
+
+    def test_failed_flush_keeps_intents(self):
+        self.client.put(self.like)
+        with mock.patch.object(
+            reactions, "write", side_effect=RuntimeError("database is locked")
+        ):
+            with self.assertRaises(RuntimeError):
+                reaction_buffer.flush()
+        self.assertEqual(self.client.get(self.detail).data["likes"], 1)
+
+        self.assertEqual(reaction_buffer.flush(), 1)
+        self.assertTrue(Like.objects.filter(post=self.post).exists())
+
+    def test_failed_batch_keeps_only_unwritten_intents(self):
+        other = Post.objects.create(
+            author=self.post.author, post_content="other"
+        )
+        self.client.put(self.like)
+        self.client.put(reverse("social_media:post-like", args=[other.id]))
+        write = reactions.write
+        calls = []
+
+        def fail_second_batch(intents):
+            calls.append(intents)
+            if len(calls) == 2:
+                raise RuntimeError("database is locked")
+            return write(intents)
+
+        with mock.patch.object(reaction_buffer, "FLUSH_BATCH_SIZE", 1):
+            with mock.patch.object(
+                reactions, "write", side_effect=fail_second_batch
+            ):
+                with self.assertRaises(RuntimeError):
+                    reaction_buffer.flush()
+
+        self.assertEqual(Like.objects.count(), 1)
+        for post in (self.post, other):
+            detail = reverse("social_media:post-detail", args=[post.id])
+            self.assertEqual(self.client.get(detail).data["likes"], 1)
+
+        self.assertEqual(reaction_buffer.flush(), 1)
+        self.assertEqual(Like.objects.count(), 2)
+
+
+class AsyncReadViewTests(TestCase):
+    """
+    The async read views must return exactly what the viewsets return.
+    """
+
+    def setUp(self):
+        self.profile = create_profile("viewer")
+        self.target = create_profile("target")
+        Follow.objects.create(follower=self.profile, following=self.target)
+        counters.reconcile_profiles(Profile.objects.all())
+        self.post = Post.objects.create(
+            author=self.target, post_content="content"
+        )
+        self.post.tags.add(*Tag.objects.resolve(["a"]))
+        timeline.fan_out_post(self.post)
+        Like.objects.create(post=self.post, user=self.profile)
+        counters.reconcile_posts(Post.objects.all())
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+        self.factory = APIRequestFactory()
+
+    def assertSameAsViewset(self, viewset, actions, url, **kwargs):
+        request = self.factory.get(url)
+        force_authenticate(request, self.profile.user)
+        expected = viewset.as_view(actions)(request, **kwargs)
+        expected.render()
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, expected.content)
+
+    def test_post_list(self):
+        self.assertSameAsViewset(
+            PostViewSet,
+            {"get": "list"},
+            reverse("social_media:post-list") + "?tag=a",
+        )
+
+    def test_post_detail(self):
+        self.assertSameAsViewset(
+            PostViewSet,
+            {"get": "retrieve"},
+            reverse("social_media:post-detail", args=[self.post.id]),
+            pk=self.post.id,
+        )
+
+    def test_following_posts(self):
+        self.assertSameAsViewset(
+            PostViewSet,
+            {"get": "following_posts"},
+            reverse("social_media:post-following-posts"),
+        )
+
+    def test_profile_list(self):
+        self.assertSameAsViewset(
+            ProfileViewSet,
+            {"get": "list"},
+            reverse("social_media:profile-list") + "?username=tar",
+        )
+
+    def test_profile_detail(self):
+        self.assertSameAsViewset(
+            ProfileViewSet,
+            {"get": "retrieve"},
+            reverse("social_media:profile-detail", args=[self.target.id]),
+            pk=self.target.id,
+        )
+
+    def test_missing_post(self):
+        response = self.client.get(
+            reverse("social_media:post-detail", args=[self.post.id + 1])
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_jwt_authentication(self):
+        client = APIClient()
+        url = reverse("social_media:post-detail", args=[self.post.id])
+        token = AccessToken.for_user(self.profile.user)
+
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        with mock.patch.object(
+            PostViewSet,
+            "initial",
+            autospec=True,
+            side_effect=PostViewSet.initial,
+        ) as initial:
+            self.assertTrue(client.get(url).data["liked_by_me"])
+        request = initial.call_args.args[1]
+        self.assertEqual(request.auth["jti"], token["jti"])
+
+        client.credentials(HTTP_AUTHORIZATION="Bearer invalid")
+        response = client.get(url)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("WWW-Authenticate", response)
+
+    def test_viewset_authentication_and_permissions(self):
+        client = APIClient()
+        url = reverse("social_media:post-detail", args=[self.post.id])
+        token = AccessToken.for_user(self.profile.user)
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        with mock.patch.object(PostViewSet, "authentication_classes", ()):
+            self.assertFalse(client.get(url).data["liked_by_me"])
+
+        with mock.patch.object(
+            PostViewSet, "permission_classes", (IsAuthenticated,)
+        ):
+            self.assertEqual(APIClient().get(url).status_code, 401)
+            self.assertEqual(client.get(url).status_code, 200)
+
+    def test_writes_reach_the_viewset(self):
+        response = self.client.patch(
+            reverse("social_media:post-detail", args=[self.post.id]),
+            {"post_content": "changed"},
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_browsable_api_is_served_by_the_viewset(self):
+        response = self.client.get(
+            reverse("social_media:post-list"), HTTP_ACCEPT="text/html"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"<html", response.content)
+
+
+class ImageProcessingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.profile = create_profile("author")
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+
+    def upload(self):
+        """
+        Post a 2000x1000 JPEG carrying EXIF, rotated by its orientation.
+        """
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+        exif[0x010F] = "Camera"  # Make
+        buffer = io.BytesIO()
+        Image.new("RGB", (2000, 1000), "red").save(
+            buffer, format="JPEG", exif=exif
+        )
+        image = SimpleUploadedFile(
+            "photo.jpg", buffer.getvalue(), content_type="image/jpeg"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("social_media:post-list"),
+                {"post_content": "content", "media": image},
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, 201)
+        return Post.objects.get(id=response.data["id"])
+
+    def test_upload_is_stripped_and_resized(self):
+        post = self.upload()
+
+        with default_storage.open(post.media.name) as handle:
+            original = Image.open(handle)
+            self.assertEqual(original.size, (1000, 2000))
+            self.assertFalse(original.getexif())
+
+        variants = post.media_variants["variants"]
+        self.assertEqual(post.media_variants["source"], post.media.name)
+        self.assertEqual(
+            {name: (v["width"], v["height"]) for name, v in variants.items()},
+            {"small": (160, 320), "medium": (400, 800), "large": (800, 1600)},
+        )
+        with default_storage.open(variants["small"]["name"]) as handle:
+            small = Image.open(handle)
+            self.assertEqual(small.format, "WEBP")
+            self.assertFalse(small.getexif())
+
+        detail = self.client.get(
+            reverse("social_media:post-detail", args=[post.id])
+        )
+        self.assertTrue(
+            detail.data["media_variants"]["large"]["url"].endswith(".webp")
+        )
+        listed = self.client.get(reverse("social_media:post-list"))
+        self.assertEqual(
+            listed.data["results"][0]["media_variants"],
+            detail.data["media_variants"],
+        )
+
+    def test_variants_of_replaced_image_are_hidden(self):
+        post = self.upload()
+        Post.objects.filter(id=post.id).update(media="posts/missing.jpg")
+
+        detail = reverse("social_media:post-detail", args=[post.id])
+        self.assertEqual(self.client.get(detail).data["media_variants"], {})
+
+        self.assertTrue(images.process("post", post.id))
+        post.refresh_from_db()
+        self.assertEqual(post.media_variants["status"], "failed")
+        self.assertEqual(self.client.get(detail).data["media_variants"], {})
+
+
+class MediaBlobTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.profile = create_profile("author")
+        buffer = io.BytesIO()
+        Image.new("RGB", (1000, 1000), "blue").save(buffer, format="PNG")
+        self.content = buffer.getvalue()
+
+    def create_post(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(
+                author=self.profile,
+                post_content="content",
+                media=SimpleUploadedFile("meme.png", self.content),
+            )
+        post.refresh_from_db()
+        return post
+
+    def refcounts(self, post):
+        return {
+            blob.name: blob.refcount
+            for blob in MediaBlob.objects.filter(
+                name__in=images.references(
+                    post.media.name, post.media_variants
+                )
+            )
+        }
+
+    def test_identical_uploads_share_files(self):
+        first = self.create_post()
+        second = self.create_post()
+        self.assertEqual(first.media.name, second.media.name)
+        self.assertEqual(first.media_variants, second.media_variants)
+        self.assertEqual(set(self.refcounts(first).values()), {2})
+        self.assertEqual(len(self.refcounts(first)), 4)
+
+        first.delete()
+        self.assertEqual(set(self.refcounts(second).values()), {1})
+        self.assertEqual(blobs.collect_garbage(datetime.timedelta(0)), 0)
+
+        second.delete()
+        self.assertEqual(blobs.collect_garbage(datetime.timedelta(0)), 4)
+        self.assertFalse(default_storage.exists(second.media.name))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_grace_period_keeps_recent_files(self):
+        self.create_post().delete()
+        self.assertEqual(blobs.collect_garbage(datetime.timedelta(hours=1)), 0)
+
+    def test_reconcile(self):
+        post = self.create_post()
+        MediaBlob.objects.update(refcount=5)
+
+        self.assertEqual(blobs.reconcile(images.referenced()), 4)
+        self.assertEqual(set(self.refcounts(post).values()), {1})
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.cache_dir = os.path.join(media_root, "thumbnails")
+        settings = override_settings(
+            MEDIA_ROOT=media_root, THUMBNAIL_CACHE_DIR=self.cache_dir
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (1000, 500), "green").save(buffer, format="PNG")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post = Post.objects.create(
+                author=create_profile("author"),
+                post_content="content",
+                media=SimpleUploadedFile("photo.png", buffer.getvalue()),
+            )
+        self.post.refresh_from_db()
+        self.client = APIClient()
+
+    def get(self, width, image_format="webp", **headers):
+        return self.client.get(
+            reverse("social_media:post-thumbnail", args=[self.post.id]),
+            {"width": width, "format": image_format},
+            headers=headers,
+        )
+
+    def test_thumbnail_is_rendered_once(self):
+        with mock.patch.object(
+            thumbnails, "render", wraps=thumbnails.render
+        ) as render:
+            for _ in range(2):
+                response = self.get(300, "jpeg", accept="image/jpeg")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response["Content-Type"], "image/jpeg")
+                image = Image.open(io.BytesIO(b"".join(response)))
+                self.assertEqual(image.size, (300, 150))
+        render.assert_called_once()
+
+        response = self.get(300, "jpeg", if_none_match=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalid_request(self):
+        self.assertEqual(self.get(0).status_code, 400)
+        self.assertEqual(self.get(100, "gif").status_code, 400)
+        profile = create_profile("no-picture")
+        response = self.client.get(
+            reverse("social_media:profile-thumbnail", args=[profile.id]),
+            {"width": 100},
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_concurrent_requests_render_once(self):
+        def slow_render(*args):
+            time.sleep(0.1)
+            return render(*args)
+
+        render = thumbnails.render
+        results = []
+        with mock.patch.object(
+            thumbnails, "render", side_effect=slow_render
+        ) as patched:
+            workers = [
+                threading.Thread(
+                    target=lambda: results.append(
+                        thumbnails.open_thumbnail(
+                            self.post.media, {}, 200, "WEBP"
+                        )
+                    )
+                )
+                for _ in range(5)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        patched.assert_called_once()
+        self.assertEqual(len({handle.read() for handle in results}), 1)
+        for handle in results:
+            handle.close()
+
+    def test_least_recently_used_are_evicted(self):
+        for width in (100, 200, 300):
+            self.get(width).close()
+            time.sleep(0.01)
+        self.get(100).close()  # now the most recently used
+        paths = {
+            width: thumbnails.cache_path(self.post.media.name, width, "WEBP")
+            for width in (100, 200, 300, 400)
+        }
+        used = sum(
+            os.path.getsize(path) for path in paths.values() if path.exists()
+        )
+
+        with override_settings(THUMBNAIL_CACHE_MAX_SIZE=used):
+            self.get(400).close()
+        self.assertFalse(paths[200].exists())
+        self.assertTrue(paths[100].exists())
+        self.assertTrue(paths[400].exists())
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.content = bytes(range(256)) * 40
+        self.name = default_storage.save("notes.bin", io.BytesIO(self.content))
+        self.blob = Profile._meta.get_field("profile_picture").storage.save(
+            "picture.png", io.BytesIO(self.content)
+        )
+        self.client = APIClient()
+
+    def get(self, name, **headers):
+        return self.client.get(reverse("media", args=[name]), headers=headers)
+
+    def test_content_addressed_files_are_immutable(self):
+        response = self.get(self.blob)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response), self.content)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(
+            response["ETag"], '"%s"' % pathlib.PurePath(self.blob).stem
+        )
+        self.assertIn("immutable", response["Cache-Control"])
+
+        response = self.get(self.blob, if_none_match=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("immutable", response["Cache-Control"])
+
+    def test_range_requests(self):
+        response = self.get(self.name, range="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response), self.content[10:20])
+        self.assertEqual(
+            response["Content-Range"], f"bytes 10-19/{len(self.content)}"
+        )
+
+        response = self.get(self.name, range="bytes=-5")
+        self.assertEqual(b"".join(response), self.content[-5:])
+
+        response = self.get(self.name, range="bytes=100000-")
+        self.assertEqual(response.status_code, 416)
+
+        etag = self.get(self.name)["ETag"]
+        response = self.get(self.name, range="bytes=0-1", if_range=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.get(self.name, range="bytes=0-1", if_range='"old"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response), self.content)
+
+    def test_sendfile(self):
+        with override_settings(MEDIA_SENDFILE="x-accel-redirect"):
+            response = self.get(self.blob)
+        self.assertEqual(
+            response["X-Accel-Redirect"], "/protected-media/" + self.blob
+        )
+        self.assertEqual(response.content, b"")
+
+    def test_missing_file(self):
+        self.assertEqual(self.get("missing.png").status_code, 404)
+        self.assertEqual(self.get("blobs").status_code, 404)
+
+
+class CommentThreadTests(TestCase):
+    def setUp(self):
+        self.profile = create_profile("viewer")
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+        self.post = Post.objects.create(
+            author=create_profile("author"), post_content="content"
+        )
+        self.url = reverse("social_media:post-comments", args=[self.post.id])
+
+    def add(self, content, parent=None):
+        response = self.client.post(
+            self.url,
+            {"content": content, "parent": parent and parent["id"]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def test_thread_order(self):
+        first = self.add("first")
+        reply = self.add("reply", first)
+        self.add("nested", reply)
+        self.add("second")
+        self.add("late reply", first)
+
+        results = self.client.get(self.url).data["results"]
+        self.assertEqual(
+            [(c["content"], c["depth"]) for c in results],
+            [
+                ("first", 0),
+                ("reply", 1),
+                ("nested", 2),
+                ("late reply", 1),
+                ("second", 0),
+            ],
+        )
+        self.assertEqual(results[1]["parent"], first["id"])
+
+        subtree = self.client.get(self.url, {"root": reply["id"]})
+        self.assertEqual(
+            [c["content"] for c in subtree.data["results"]],
+            ["reply", "nested"],
+        )
+        self.assertEqual(
+            self.client.get(self.url, {"root": 10**6}).status_code,
+            404,
+        )
+
+        page = self.client.get(self.url, {"page_size": 2}).data
+        self.assertEqual(len(page["results"]), 2)
+        rest = self.client.get(page["next"]).data["results"]
+        self.assertEqual(
+            [c["content"] for c in rest], ["nested", "late reply"]
+        )
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 5)
+
+    def test_invalid_parent(self):
+        other = Post.objects.create(author=self.profile, post_content="x")
+        foreign = comments.create(other, self.profile, "elsewhere")
+        response = self.client.post(
+            self.url, {"content": "reply", "parent": foreign.id}
+        )
+        self.assertEqual(response.status_code, 400)
+
+        self.client.force_authenticate(None)
+        response = self.client.post(self.url, {"content": "anonymous"})
+        self.assertEqual(response.status_code, 401)
+
+    def test_deep_replies_are_flattened(self):
+        comment = comments.create(self.post, self.profile, "root")
+        for _ in range(comments.MAX_DEPTH + 2):
+            parent = comment
+            comment = comments.create(self.post, self.profile, "reply", parent)
+        self.assertEqual(comments.depth(comment), comments.MAX_DEPTH)
+        self.assertEqual(comment.parent_id, parent.parent_id)
+
+    def test_post_detail_embeds_a_preview(self):
+        for number in range(comments.PREVIEW_SIZE + 2):
+            top = comments.create(self.post, self.profile, f"top {number}")
+        comments.create(self.post, self.profile, "reply", top)
+
+        response = self.client.get(
+            reverse("social_media:post-detail", args=[self.post.id])
+        )
+        self.assertEqual(
+            [c["content"] for c in response.data["comments"]],
+            [f"top {number}" for number in range(4, 1, -1)],
+        )
+
+
+class FollowGraphTests(TestCase):
+    def setUp(self):
+        self.addCleanup(follow_graph.reset)
+        follow_graph.reset()
+        self.a, self.b, self.c, self.d, self.e = (
+            create_profile(name) for name in "abcde"
+        )
+        for follower, following in (
+            (self.a, self.b),
+            (self.a, self.c),
+            (self.b, self.a),
+            (self.b, self.d),
+            (self.c, self.d),
+            (self.c, self.e),
+            (self.d, self.a),
+        ):
+            Follow.objects.create(follower=follower, following=following)
+        self.client = APIClient()
+        self.client.force_authenticate(self.a.user)
+
+    def usernames(self, response):
+        self.assertEqual(response.status_code, 200)
+        results = response.data
+        if isinstance(results, dict):
+            results = results["results"]
+        return [profile["username"] for profile in results]
+
+    def test_endpoints(self):
+        self.assertEqual(
+            self.usernames(
+                self.client.get(
+                    reverse("social_media:profile-follows-you-back")
+                )
+            ),
+            ["b"],
+        )
+        self.assertEqual(
+            self.usernames(
+                self.client.get(
+                    reverse(
+                        "social_media:profile-mutual-followers",
+                        args=[self.d.id],
+                    )
+                )
+            ),
+            ["b", "c"],
+        )
+        response = self.client.get(reverse("social_media:profile-suggestions"))
+        self.assertEqual(
+            [(p["username"], p["overlap"]) for p in response.data],
+            [("d", 2), ("e", 1)],
+        )
+
+    def test_mutual_followers_are_paginated(self):
+        url = reverse(
+            "social_media:profile-mutual-followers", args=[self.d.id]
+        )
+        page = self.client.get(url, {"page_size": 1}).data
+        self.assertEqual(self.usernames(self.client.get(url)), ["b", "c"])
+        self.assertEqual([p["username"] for p in page["results"]], ["b"])
+        following = self.client.get(page["next"]).data
+        self.assertEqual([p["username"] for p in following["results"]], ["c"])
+        self.assertIsNone(following["next"])
+        previous = self.client.get(following["previous"]).data
+        self.assertEqual([p["username"] for p in previous["results"]], ["b"])
+
+    def test_follow_updates_the_loaded_graph(self):
+        graph = follow_graph.get_graph()
+        follow = reverse("social_media:profile-follow", args=[self.d.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(follow)
+        self.assertIs(follow_graph.get_graph(), graph)
+        self.assertEqual(graph.follows_back(self.a.id), [self.b.id, self.d.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(follow)
+        self.assertEqual(graph.follows_back(self.a.id), [self.b.id])
+        self.assertEqual(
+            graph.suggestions(self.a.id, 10), [(self.d.id, 2), (self.e.id, 1)]
+        )
+
+    def test_changes_on_loaded_edges(self):
+        graph = follow_graph.FollowGraph([(1, 2), (1, 3), (2, 1)])
+        graph.remove(1, 2)
+        graph.add(1, 5)
+        graph.add(7, 1)
+        self.assertEqual(graph.following.neighbours(1), {3, 5})
+        self.assertEqual(graph.followers.neighbours(1), {2, 7})
+        self.assertEqual(graph.following.degree(1), 2)
+        graph.add(1, 2)
+        graph.remove(1, 5)
+        self.assertEqual(graph.following.neighbours(1), {2, 3})
+        graph.add(2, 3)
+        self.assertEqual(graph.following.common(1, graph.following, 2), [3])
+        self.assertEqual(graph.followers.common(3, graph.followers, 1), [2])
+        graph.remove(2, 1)
+        self.assertEqual(graph.followers.common(3, graph.followers, 1), [])
+
+    def test_intersections_walk_the_smaller_side(self):
+        edges = [(follower, 1) for follower in range(2, 10_000)]
+        edges += [(10_001, 5), (10_001, 1), (10_001, 10_000)]
+        graph = follow_graph.FollowGraph(edges)
+        graph.add(10_001, 7)
+        graph.remove(5, 1)
+        with mock.patch.object(
+            follow_graph.Adjacency, "neighbours", side_effect=AssertionError
+        ), mock.patch.object(
+            graph.followers, "iter_neighbours", side_effect=AssertionError
+        ):
+            self.assertEqual(graph.mutual_followers(10_001, 1), [7])
+
+    def test_warm_loads_in_the_background(self):
+        loaded = follow_graph.FollowGraph([(1, 2)])
+        with mock.patch.object(
+            follow_graph.FollowGraph, "load", return_value=loaded
+        ):
+            follow_graph.warm()
+            self.assertIs(follow_graph.get_graph(), loaded)
+
+
+class BulkFollowTests(TestCase):
+    def setUp(self):
+        self.addCleanup(follow_graph.reset)
+        follow_graph.reset()
+        self.profile = create_profile("viewer")
+        self.others = [create_profile(f"creator{i}") for i in range(3)]
+        for other in self.others:
+            Post.objects.create(author=other, post_content="content")
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+        self.url = reverse("social_media:profile-bulk-follow")
+
+    def test_follow_and_unfollow(self):
+        first, second, third = (other.id for other in self.others)
+        Follow.objects.create(follower=self.profile, following_id=third)
+        counters.reconcile_profiles(Profile.objects.all())
+        follow_graph.get_graph()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                self.url,
+                {"follow": [first, second, third], "unfollow": [999]},
+                format="json",
+            )
+        self.assertEqual(
+            response.data,
+            {
+                "followed": [first, second, third],
+                "unfollowed": [],
+                "missing": [999],
+            },
+        )
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.following_count, 3)
+        self.assertEqual(Profile.objects.get(id=first).followers_count, 1)
+        # Only profiles followed by this request are backfilled.
+        self.assertEqual(timeline.get_feed(self.profile).count(), 2)
+        self.assertEqual(
+            follow_graph.get_graph().following.neighbours(self.profile.id),
+            {first, second, third},
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                self.url, {"unfollow": [first, first]}, format="json"
+            )
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.following_count, 2)
+        self.assertEqual(Profile.objects.get(id=first).followers_count, 0)
+        self.assertEqual(
+            sorted(
+                entry.author_id for entry in timeline.get_feed(self.profile)
+            ),
+            [second],
+        )
+        self.assertEqual(
+            follow_graph.get_graph().following.neighbours(self.profile.id),
+            {second, third},
+        )
+        self.assertEqual(counters.reconcile_profiles(Profile.objects.all()), 0)
+
+    def test_single_toggle_takes_the_bulk_path(self):
+        counters.reconcile_profiles(Profile.objects.all())
+        target = self.others[0]
+        url = reverse("social_media:profile-follow", args=[target.id])
+        with mock.patch.object(follows, "apply", wraps=follows.apply) as apply:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.get(url)
+            self.client.get(url)
+        self.assertEqual(
+            apply.call_args_list,
+            [
+                mock.call(self.profile, follow=[target.id]),
+                mock.call(self.profile, unfollow=[target.id]),
+            ],
+        )
+        self.assertEqual(counters.reconcile_profiles(Profile.objects.all()), 0)
+
+        response = self.client.get(
+            reverse("social_media:profile-follow", args=[self.profile.id])
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_invalid_requests(self):
+        for data in (
+            {},
+            {"follow": [self.profile.id]},
+            {"follow": [1], "unfollow": [1]},
+            {"follow": list(range(1, 502))},
+        ):
+            response = self.client.post(self.url, data, format="json")
+            self.assertEqual(response.status_code, 400, data)
+
+        self.client.force_authenticate(None)
+        response = self.client.post(self.url, {"follow": [1]}, format="json")
+        self.assertEqual(response.status_code, 401)
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "social.jsonl")
+
+        alice, bob = create_profile("alice"), create_profile("bob")
+        post = Post.objects.create(author=alice, post_content="hello world")
+        post.tags.set(Tag.objects.resolve(["greeting"]))
+        Follow.objects.create(follower=bob, following=alice)
+        Like.objects.create(post=post, user=bob)
+        root = comments.create(post, bob, "first")
+        comments.create(post, alice, "reply", parent=root)
+        counters.reconcile_profiles(Profile.objects.all())
+        counters.reconcile_posts(Post.objects.all())
+
+    def snapshot(self):
+        return {
+            "profiles": list(
+                Profile.objects.values_list(
+                    "username",
+                    "user__email",
+                    "followers_count",
+                    "following_count",
+                    "posts_count",
+                )
+            ),
+            "posts": list(
+                Post.objects.values_list(
+                    "id",
+                    "author__username",
+                    "post_content",
+                    "created_at",
+                    "likes_count",
+                    "comments_count",
+                    "tags__name",
+                )
+            ),
+            "follows": list(
+                Follow.objects.values_list(
+                    "follower__username", "following__username", "followed_at"
+                )
+            ),
+            "likes": list(
+                Like.objects.values_list("post_id", "user__username")
+            ),
+            "comments": list(
+                Comment.objects.order_by("path").values_list(
+                    "id",
+                    "parent_id",
+                    "path",
+                    "author__username",
+                    "content",
+                    "created_at",
+                )
+            ),
+        }
+
+    def export_and_clear(self):
+        call_command("export_social", self.path, stdout=io.StringIO())
+        expected = self.snapshot()
+        User.objects.all().delete()
+        Tag.objects.all().delete()
+        return expected
+
+    def test_round_trip(self):
+        expected = self.export_and_clear()
+        output = io.StringIO()
+        call_command(
+            "import_social", self.path, "--batch-size", "2", stdout=output
+        )
+        self.assertIn("Imported 7 records and skipped 0", output.getvalue())
+        self.assertEqual(self.snapshot(), expected)
+        self.assertFalse(os.path.exists(self.path + ".checkpoint"))
+
+        bob = Profile.objects.get(username="bob")
+        self.assertEqual(timeline.get_feed(bob).count(), 1)
+        self.assertEqual(search.search_posts("greeting").count(), 1)
+        self.assertEqual(
+            [p.username for p in search.typeahead_profiles("ali", 5)],
+            ["alice"],
+        )
+
+    def test_resume_after_failure(self):
+        expected = self.export_and_clear()
+        apply = transfer.Importer.apply
+        calls = []
+
+        def fail_on_third_batch(importer, records):
+            calls.append(records)
+            if len(calls) == 3:
+                raise RuntimeError("interrupted")
+            return apply(importer, records)
+
+        with mock.patch.object(
+            transfer.Importer, "apply", fail_on_third_batch
+        ):
+            with self.assertRaises(RuntimeError):
+                call_command(
+                    "import_social",
+                    self.path,
+                    "--batch-size",
+                    "2",
+                    stdout=io.StringIO(),
+                )
+        self.assertTrue(os.path.exists(self.path + ".checkpoint"))
+        self.assertEqual(Like.objects.count(), 0)
+
+        output = io.StringIO()
+        call_command(
+            "import_social",
+            self.path,
+            "--batch-size",
+            "2",
+            "--resume",
+            stdout=output,
+        )
+        self.assertIn("Resuming after line 4.", output.getvalue())
+        self.assertIn("Imported 3 records", output.getvalue())
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_batches_can_be_applied_twice(self):
+        expected = self.export_and_clear()
+        with open(self.path) as handle:
+            records = [json.loads(line) for line in handle]
+        transfer.Importer().apply(records)
+        transfer.Importer().apply(records)
+        self.assertEqual(self.snapshot(), expected)
+
+    def test_ids_of_other_rows_are_refused(self):
+        expected = self.export_and_clear()
+        carol = create_profile("carol")
+        post_id = expected["posts"][0][0]
+        Post.objects.create(id=post_id, author=carol, post_content="mine")
+
+        with self.assertRaisesMessage(
+            CommandError, f"Ids of other posts in the database: [{post_id}]"
+        ):
+            call_command("import_social", self.path, stdout=io.StringIO())
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+
+    def test_imported_posts_reach_existing_followers(self):
+        bob = Profile.objects.get(username="bob")
+        self.assertEqual(timeline.get_feed(bob).count(), 0)
+        with open(self.path, "w") as handle:
+            handle.write(
+                '{"type": "post", "id": 500, "author": "alice", '
+                '"post_content": "imported", '
+                '"created_at": "2024-01-01T00:00:00+00:00"}\n'
+            )
+        call_command("import_social", self.path, stdout=io.StringIO())
+        existing = Post.objects.get(post_content="hello world")
+        self.assertEqual(
+            [entry.post_id for entry in timeline.get_feed(bob)],
+            [existing.id, 500],
+        )
+
+    def test_dangling_references_are_skipped(self):
+        with open(self.path, "w") as handle:
+            handle.write(
+                '{"type": "follow", "follower": "alice", "following": "x"}\n'
+                '{"type": "like", "post": 999, "user": "alice"}\n'
+            )
+        output = io.StringIO()
+        call_command("import_social", self.path, stdout=output)
+        self.assertIn("Imported 0 records and skipped 2", output.getvalue())
+
+
+class DatasetTests(TestCase):
+    def test_popularity_is_skewed(self):
+        records = list(
+            dataset.generate(
+                profiles=50, posts=200, follows=10, likes=10, comments=2
+            )
+        )
+        followers = {}
+        for record in records:
+            if record["type"] == "follow":
+                followers[record["following"]] = (
+                    followers.get(record["following"], 0) + 1
+                )
+        counts = sorted(followers.values(), reverse=True)
+        # The top fifth of the profiles gets most of the followers.
+        self.assertGreater(sum(counts[:10]), sum(counts) / 2)
+
+        again = list(
+            dataset.generate(
+                profiles=50, posts=200, follows=10, likes=10, comments=2
+            )
+        )
+
+        # Times are relative to now; everything else is seeded.
+        def without_times(rows):
+            return [
+                {k: v for k, v in row.items() if not k.endswith("_at")}
+                for row in rows
+            ]
+
+        self.assertEqual(without_times(again), without_times(records))
+
+    def test_generate_dataset_command(self):
+        create_profile("existing")
+        Post.objects.create(
+            author=Profile.objects.get(), post_content="content"
+        )
+        counters.reconcile_profiles(Profile.objects.all())
+        output = io.StringIO()
+        call_command(
+            "generate_dataset",
+            "--profiles",
+            "20",
+            "--posts",
+            "50",
+            "--follows",
+            "5",
+            "--likes",
+            "5",
+            "--comments",
+            "3",
+            "--batch-size",
+            "40",
+            stdout=output,
+        )
+        self.assertIn("Inserted", output.getvalue())
+        self.assertEqual(Profile.objects.count(), 21)
+        self.assertEqual(Post.objects.count(), 51)
+        self.assertTrue(Comment.objects.filter(parent__isnull=False).exists())
+        self.assertEqual(counters.reconcile_posts(Post.objects.all()), 0)
+        self.assertEqual(counters.reconcile_profiles(Profile.objects.all()), 0)
+
+
+class SerializerBenchmarkTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.history = os.path.join(directory, "history.jsonl")
+
+    def benchmark(self, *args, size=3):
+        output = io.StringIO()
+        call_command(
+            "benchmark_serializers",
+            "--size",
+            str(size),
+            "--repeat",
+            "1",
+            "--min-time",
+            "0.001",
+            "--history",
+            self.history,
+            *args,
+            stdout=output,
+        )
+        return output.getvalue()
+
+    def test_fixtures_need_no_queries(self):
+        fixtures = benchmarks.Fixtures(3)
+        with self.assertNumQueries(0):
+            for function, _ in benchmarks.cases(fixtures).values():
+                function()
+
+    def test_history_is_the_baseline(self):
+        self.assertNotIn("Baseline", self.benchmark())
+        self.assertIn("Baseline", self.benchmark())
+        with open(self.history) as handle:
+            entries = [json.loads(line) for line in handle]
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(
+            set(entries[0]["results"]),
+            set(benchmarks.cases(benchmarks.Fixtures(1))),
+        )
+
+        # Runs on other fixture sizes are not compared.
+        self.assertNotIn("Baseline", self.benchmark(size=4))
+
+    def test_regression_fails(self):
+        self.benchmark()
+        with open(self.history) as handle:
+            entry = json.loads(handle.readline())
+        for result in entry["results"].values():
+            result["min_us"] /= 100
+        with open(self.history, "a") as handle:
+            handle.write(json.dumps(entry) + "\n")
+
+        with self.assertRaisesMessage(
+            CommandError, "Slower than the baseline by more than 50%"
+        ):
+            self.benchmark("--max-regression", "50")
+
+
+class SchemaTests(TestCase):
+    def test_schema_generates(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "schema.yml")
+        stderr = io.StringIO()
+        call_command("spectacular", "--file", path, stderr=stderr)
+        with open(path) as handle:
+            self.assertIn("/platform/posts/", handle.read())
+        self.assertNotIn("could not resolve authenticator", stderr.getvalue())
+
+        response = self.client.get(reverse("schema"), {"format": "json"})
+        self.assertEqual(response.status_code, 200)
+        schema = json.loads(response.content)
+        self.assertEqual(
+            schema["components"]["securitySchemes"]["jwtAuth"]["scheme"],
+            "bearer",
+        )
+        operation = schema["paths"]["/platform/posts/"]["get"]
+        self.assertIn({"jwtAuth": []}, operation["security"])
+
+
+@override_settings(
+    METRICS_BACKEND="social_media.metrics.MemoryStore",
+    METRICS_OPTIONS={},
+    METRICS_TOKEN=None,
+)
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.profile = create_profile("viewer")
+        Post.objects.create(author=self.profile, post_content="content")
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+        self.addCleanup(metrics.reset_store, setting="METRICS_BACKEND")
+
+    def scrape(self, **headers):
+        response = self.client.get(reverse("metrics"), **headers)
+        return response, response.content.decode()
+
+    def test_requests_are_labelled_by_viewset_action(self):
+        self.client.get(reverse("social_media:post-list"))
+        self.client.get(reverse("social_media:post-list"))
+        self.client.post(reverse("social_media:post-list"), {})
+
+        response, text = self.scrape()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        labels = 'route="/platform/posts/",view="PostViewSet.list"'
+        self.assertIn(
+            f'http_requests_total{{{labels},method="GET",status="200"}} 2',
+            text,
+        )
+        self.assertIn(
+            'view="PostViewSet.create",method="POST",status="400"} 1', text
+        )
+        self.assertIn(
+            f'http_request_duration_seconds_bucket{{{labels},method="GET",'
+            'le="+Inf"} 2',
+            text,
+        )
+        self.assertIn(
+            f'db_queries_per_request_count{{{labels},method="GET"}} 2', text
+        )
+        self.assertIn("# TYPE http_response_size_bytes histogram", text)
+        # Scrapes are not recorded.
+        self.assertNotIn('route="/metrics"', self.scrape()[1])
+
+    def test_async_requests(self):
+        token = AccessToken.for_user(self.profile.user)
+        with CaptureQueriesContext(connection) as context:
+            response = async_to_sync(self.async_client.get)(
+                reverse("social_media:post-list"),
+                headers={"Authorization": f"Bearer {token}"},
+            )
+        self.assertEqual(response.status_code, 200)
+
+        # Queries of async views run on another thread's connection.
+        values = metrics.get_store().collect()
+        labels = (
+            'route="/platform/posts/",view="PostViewSet.list",method="GET"'
+        )
+        self.assertEqual(
+            values[("db_queries_per_request", labels, "sum")],
+            len(context.captured_queries),
+        )
+        self.assertGreater(len(context.captured_queries), 0)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.scrape()[0].status_code, 403)
+        response, _ = self.scrape(HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+
+    def test_file_store_sums_processes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        key = ("http_requests_total", 'view="a"', "")
+        first = metrics.FileStore(directory)
+        first.add([(key, 1)] * 3)
+        with mock.patch("os.getpid", return_value=os.getpid() + 1):
+            second = metrics.FileStore(directory)
+            # More keys than fit in the initial size of the file.
+            second.add(
+                [(key, 2)]
+                + [(("x", f'n="{n}"', "sum"), 0.5) for n in range(3000)]
+            )
+
+        values = metrics.FileStore(directory).collect()
+        self.assertEqual(values[key], 5)
+        self.assertEqual(values[("x", 'n="2999"', "sum")], 0.5)
+        self.assertEqual(len(values), 3001)
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import pathlib
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from PIL import Image, ImageOps
+
+from social_media import images
+
+# Share of THUMBNAIL_CACHE_MAX_SIZE kept after an eviction, so that
+# evictions do not run on every write once the cache is full.
+EVICT_TO = 0.9
+# Temporary files older than this are leftovers of interrupted writes.
+STALE_TEMPORARY_SECONDS = 600
+
+_lock = threading.Lock()
+# cache path -> [lock, number of requests waiting for it]
+_in_flight = {}
+# Bytes in the cache as last seen by this process; None until scanned.
+_size = None
+
+
+@receiver(setting_changed)
+def reset_size(setting, **kwargs):
+    global _size
+    if setting.startswith("THUMBNAIL_CACHE"):
+        _size = None
+
+
+def cache_path(source: str, width: int, image_format: str) -> pathlib.Path:
+    """
+    Return where the thumbnail of source is cached. Sources are content
+    addressed, so a cached thumbnail never goes stale.
+    """
+    key = hashlib.sha256(f"{source}:{width}:{image_format}".encode())
+    digest = key.hexdigest()
+    extension = images.EXTENSIONS.get(image_format, image_format.lower())
+    return (
+        pathlib.Path(settings.THUMBNAIL_CACHE_DIR)
+        / digest[:2]
+        / f"{digest}.{extension}"
+    )
+
+
+def open_thumbnail(image_file, variants: dict, width: int, image_format):
+    """
+    Return an open file holding image_file resized to width (never
+    upscaled) in image_format, rendering it on a cache miss.
+
+    Concurrent requests for the same thumbnail wait for a single render
+    instead of each resizing the image.
+    """
+    path = cache_path(image_file.name, width, image_format)
+    handle = _open(path)
+    if handle is not None:
+        return handle
+
+    with _lock:
+        entry = _in_flight.setdefault(path, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            handle = _open(path)
+            if handle is None:
+                data = render(image_file, variants, width, image_format)
+                _store(path, data)
+                handle = _open(path)
+    finally:
+        with _lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _in_flight[path]
+    return handle
+
+
+def _open(path: pathlib.Path):
+    try:
+        handle = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    # The modification time orders entries for eviction.
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return handle
+
+
+def render(image_file, variants: dict, width: int, image_format) -> bytes:
+    """
+    Resize from the smallest processed variant that is wide enough, so
+    that large originals are decoded only when nothing smaller will do.
+    """
+    name = image_file.name
+    if (
+        variants.get("status") == "ready"
+        and variants.get("source") == image_file.name
+    ):
+        wide_enough = [
+            variant
+            for variant in variants["variants"].values()
+            if variant["width"] >= width
+        ]
+        if wide_enough:
+            name = min(wide_enough, key=lambda v: v["width"])["name"]
+
+    with image_file.storage.open(name, "rb") as handle:
+        image = Image.open(handle)
+        # Let JPEG decode at a reduced scale still covering width in
+        # either orientation.
+        image.draft("RGB", (width, width))
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image = image.resize(
+                (width, max(1, round(image.height * width / image.width))),
+                Image.Resampling.LANCZOS,
+            )
+        return images.encode(
+            image, image_format, settings.IMAGE_VARIANT_QUALITY
+        )
+
+
+def _store(path: pathlib.Path, data: bytes) -> None:
+    global _size
+    path.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, suffix=".part")
+    try:
+        with os.fdopen(descriptor, "wb") as handle:
+            handle.write(data)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+    with _lock:
+        if _size is not None:
+            _size += len(data)
+        if _size is None or _size > settings.THUMBNAIL_CACHE_MAX_SIZE:
+            _size = evict()
+
+
+def evict() -> int:
+    """
+    Delete the least recently used thumbnails until the cache is below
+    EVICT_TO of its maximum size. Returns the resulting size.
+
+    The directory is scanned, so that files written by other processes
+    are accounted for.
+    """
+    entries = []
+    now = time.time()
+    for path in pathlib.Path(settings.THUMBNAIL_CACHE_DIR).glob("*/*"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        if path.suffix == ".part":
+            if now - stat.st_mtime > STALE_TEMPORARY_SECONDS:
+                path.unlink(missing_ok=True)
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    size = sum(entry[1] for entry in entries)
+    if size <= settings.THUMBNAIL_CACHE_MAX_SIZE:
+        return size
+
+    target = settings.THUMBNAIL_CACHE_MAX_SIZE * EVICT_TO
+    for _, file_size, path in sorted(entries):
+        if size <= target:
+            break
+        path.unlink(missing_ok=True)
+        size -= file_size
+    return size
@@ -0,0 +1,224 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import F, Max, Window
+from django.db.models.functions import RowNumber
+
+from social_media.models import Follow, Post, Profile, TimelineEntry
+
+
+def _entry(owner_id: int, post: Post) -> TimelineEntry:
+    return TimelineEntry(
+        owner_id=owner_id,
+        post_id=post.id,
+        author_id=post.author_id,
+        created_at=post.created_at,
+    )
+
+
+def fan_out_post(post: Post) -> None:
+    """
+    Push a freshly created post into the timelines of its author's
+    followers.
+
+    Authors with more than TIMELINE_FANOUT_MAX_FOLLOWERS followers are
+    skipped; their posts are pulled in by pull_high_follower_posts
+    when a follower reads the feed. The follower count is read from the
+    database, as post.author may be a cached, stale profile.
+    """
+    followers_count = Profile.objects.values_list(
+        "followers_count", flat=True
+    ).get(pk=post.author_id)
+    if followers_count > settings.TIMELINE_FANOUT_MAX_FOLLOWERS:
+        return
+
+    follower_ids = Follow.objects.filter(
+        following_id=post.author_id
+    ).values_list("follower_id", flat=True)
+
+    TimelineEntry.objects.bulk_create(
+        [_entry(follower_id, post) for follower_id in follower_ids],
+        ignore_conflicts=True,
+    )
+
+
+def backfill(follower: Profile, following: Profile) -> None:
+    """
+    Copy the most recent posts of a newly followed profile
+    into the follower's timeline.
+    """
+    posts = Post.objects.filter(author=following).order_by(
+        "-created_at", "-id"
+    )[: settings.TIMELINE_BACKFILL_SIZE]
+    TimelineEntry.objects.bulk_create(
+        [_entry(follower.id, post) for post in posts],
+        ignore_conflicts=True,
+    )
+
+
+def _recent_posts(author_ids):
+    """
+    The latest TIMELINE_BACKFILL_SIZE posts of each author, ranked in
+    one query.
+    """
+    return (
+        Post.objects.filter(author_id__in=author_ids)
+        .only("id", "author_id", "created_at")
+        .annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=F("author_id"),
+                order_by=(F("created_at").desc(), F("id").desc()),
+            )
+        )
+        .filter(rank__lte=settings.TIMELINE_BACKFILL_SIZE)
+    )
+
+
+def backfill_many(follower: Profile, following_ids) -> None:
+    """
+    Like backfill, for several newly followed profiles at once.
+    """
+    backfill_follows((follower.id, pk) for pk in following_ids)
+
+
+def backfill_follows(pairs) -> None:
+    """
+    Like backfill, for many (follower_id, following_id) pairs; the posts
+    of each followed profile are read once however many follow it.
+    """
+    pairs = list(pairs)
+    posts = defaultdict(list)
+    for post in _recent_posts({following_id for _, following_id in pairs}):
+        posts[post.author_id].append(post)
+    TimelineEntry.objects.bulk_create(
+        [
+            _entry(follower_id, post)
+            for follower_id, following_id in pairs
+            for post in posts[following_id]
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def backfill_followers(author_ids) -> None:
+    """
+    Like backfill, for every follower of the given authors, e.g. after
+    their posts were inserted in bulk without fan-out. Authors with more
+    than TIMELINE_FANOUT_MAX_FOLLOWERS followers are skipped, as
+    pull_high_follower_posts covers them.
+    """
+    backfill_follows(
+        Follow.objects.filter(
+            following_id__in=author_ids,
+            following__followers_count__lte=(
+                settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+            ),
+        ).values_list("follower_id", "following_id")
+    )
+
+
+def remove(follower: Profile, following: Profile) -> None:
+    """
+    Drop the posts of an unfollowed profile from the follower's timeline.
+    """
+    TimelineEntry.objects.filter(owner=follower, author=following).delete()
+
+
+def remove_many(follower: Profile, following_ids) -> None:
+    TimelineEntry.objects.filter(
+        owner=follower, author_id__in=following_ids
+    ).delete()
+
+
+def high_follower_followings(profile: Profile):
+    """
+    Return ids of the profiles followed by the given profile
+    whose posts are not fanned out on write.
+    """
+    return Profile.objects.filter(
+        followers__follower=profile,
+        followers_count__gt=settings.TIMELINE_FANOUT_MAX_FOLLOWERS,
+    ).values_list("id", flat=True)
+
+
+def _latest_entries(profile: Profile, author_ids):
+    return (
+        TimelineEntry.objects.filter(owner=profile, author_id__in=author_ids)
+        .values("author")
+        .annotate(latest=Max("created_at"))
+    )
+
+
+def _posts_to_pull(author_ids, latest):
+    posts = Post.objects.filter(author_id__in=author_ids)
+    if len(latest) == len(author_ids):
+        since = min(row["latest"] for row in latest)
+        posts = posts.filter(created_at__gte=since)
+
+    return posts.order_by("-created_at", "-id")[
+        : settings.TIMELINE_BACKFILL_SIZE
+    ]
+
+
+def pull_high_follower_posts(profile: Profile) -> None:
+    """
+    Fan-out-on-read for high-follower authors.
+
+    Posts newer than the oldest "latest entry" among those authors are
+    copied into the timeline; rows that are already there are ignored.
+    """
+    author_ids = list(high_follower_followings(profile))
+    if not author_ids:
+        return
+
+    latest = list(_latest_entries(profile, author_ids))
+    posts = _posts_to_pull(author_ids, latest)
+    TimelineEntry.objects.bulk_create(
+        [_entry(profile.id, post) for post in posts],
+        ignore_conflicts=True,
+    )
+
+
+async def apull_high_follower_posts(profile: Profile) -> None:
+    """
+    Async counterpart of pull_high_follower_posts.
+    """
+    author_ids = [pk async for pk in high_follower_followings(profile)]
+    if not author_ids:
+        return
+
+    latest = [row async for row in _latest_entries(profile, author_ids)]
+    posts = _posts_to_pull(author_ids, latest)
+    await TimelineEntry.objects.abulk_create(
+        [_entry(profile.id, post) async for post in posts],
+        ignore_conflicts=True,
+    )
+
+
+def _feed(profile: Profile):
+    return (
+        TimelineEntry.objects.filter(owner=profile)
+        .select_related("post__author")
+        .order_by("-created_at", "-post_id")
+    )
+
+
+def get_feed(profile: Profile):
+    """
+    Return the home timeline of the given profile, newest first.
+
+    The result is a TimelineEntry queryset served by a single range scan
+    over the (owner, created_at, post) index with the post joined in.
+    """
+    pull_high_follower_posts(profile)
+    return _feed(profile)
+
+
+async def aget_feed(profile: Profile):
+    """
+    Async counterpart of get_feed; the returned queryset is lazy and
+    can be evaluated with the async ORM.
+    """
+    await apull_high_follower_posts(profile)
+    return _feed(profile)
@@ -0,0 +1,496 @@
+"""
+Streaming export and import of the social graph as JSON Lines.
+
+One record per line, in dependency order:
+
+    {"type": "profile", "username": ..., "email": ..., ...}
+    {"type": "post", "id": ..., "author": <username>, "tags": [...], ...}
+    {"type": "follow", "follower": <username>, "following": <username>}
+    {"type": "like", "post": <post id>, "user": <username>}
+    {"type": "comment", "id": ..., "post": ..., "author": ..., "parent": ...}
+
+Profiles are referred to by username and users by email; posts and
+comments keep their ids, which comment paths are built from. Imports
+only insert and ignore rows that already exist, so a batch can be
+applied twice, which is what makes resuming from a checkpoint safe. A
+post or comment id already taken by a different row is refused rather
+than remapped, as records in later batches refer to it.
+"""
+
+import datetime
+import functools
+import json
+import operator
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Case, Q, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from social_media import comments, counters, search, timeline
+from social_media.models import Comment, Follow, Like, Post, Profile, Tag
+
+# Records are applied in this order within a batch, so that a batch may
+# refer to rows created by itself.
+RECORD_TYPES = ("profile", "post", "follow", "like", "comment")
+
+USER_FIELDS = ("email", "password", "is_active", "date_joined")
+PROFILE_FIELDS = (
+    "username",
+    "first_name",
+    "last_name",
+    "birth_date",
+    "bio",
+    "profile_picture",
+    "profile_picture_variants",
+)
+POST_FIELDS = ("id", "post_content", "created_at", "media", "media_variants")
+# Rows whose creation time is written back by one UPDATE.
+TIMESTAMP_CHUNK_SIZE = 500
+
+
+def _encode(value):
+    # Unlike DjangoJSONEncoder, keeps microseconds.
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _dumps(record: dict) -> str:
+    return json.dumps(record, default=_encode, ensure_ascii=False)
+
+
+def _datetime(value):
+    return parse_datetime(value) if value else timezone.now()
+
+
+def _keyset(queryset, batch_size: int):
+    """
+    Yield lists of rows in primary key order, one query per list, so
+    that no query result grows with the table.
+    """
+    last_pk = 0
+    while True:
+        batch = list(
+            queryset.filter(pk__gt=last_pk).order_by("pk")[:batch_size]
+        )
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1].pk
+
+
+def export(batch_size: int = 1000):
+    """
+    Yield the JSON Lines of every profile, post, follow, like and comment.
+    """
+    for profiles in _keyset(
+        Profile.objects.select_related("user"), batch_size
+    ):
+        for profile in profiles:
+            record = {"type": "profile"}
+            record.update(
+                (field, getattr(profile.user, field)) for field in USER_FIELDS
+            )
+            record.update(
+                (field, getattr(profile, field)) for field in PROFILE_FIELDS
+            )
+            record["profile_picture"] = profile.profile_picture.name or ""
+            yield _dumps(record)
+
+    for posts in _keyset(Post.objects.select_related("author"), batch_size):
+        tags = defaultdict(list)
+        for post_id, name in Post.tags.through.objects.filter(
+            post__in=posts
+        ).values_list("post_id", "tag__name"):
+            tags[post_id].append(name)
+        for post in posts:
+            record = {"type": "post", "author": post.author.username}
+            record.update(
+                (field, getattr(post, field)) for field in POST_FIELDS
+            )
+            record["media"] = post.media.name or ""
+            record["tags"] = sorted(tags[post.id])
+            yield _dumps(record)
+
+    for follows in _keyset(
+        Follow.objects.select_related("follower", "following"), batch_size
+    ):
+        for follow in follows:
+            yield _dumps(
+                {
+                    "type": "follow",
+                    "follower": follow.follower.username,
+                    "following": follow.following.username,
+                    "followed_at": follow.followed_at,
+                }
+            )
+
+    for likes in _keyset(Like.objects.select_related("user"), batch_size):
+        for like in likes:
+            yield _dumps(
+                {
+                    "type": "like",
+                    "post": like.post_id,
+                    "user": like.user.username,
+                }
+            )
+
+    # Ids grow with time, so parents come before their replies.
+    for batch in _keyset(Comment.objects.select_related("author"), batch_size):
+        for comment in batch:
+            yield _dumps(
+                {
+                    "type": "comment",
+                    "id": comment.id,
+                    "post": comment.post_id,
+                    "author": comment.author.username,
+                    "parent": comment.parent_id,
+                    "content": comment.content,
+                    "created_at": comment.created_at,
+                }
+            )
+
+
+def restore_timestamps(model, field_name: str, rows) -> None:
+    """
+    Write back the creation times of freshly inserted rows, which
+    bulk_create replaces with the current time on auto_now_add fields.
+
+    rows is a list of (lookups, time) pairs, e.g. ({"id": 1}, time).
+    """
+    field = model._meta.get_field(field_name)
+    for start in range(0, len(rows), TIMESTAMP_CHUNK_SIZE):
+        chunk = rows[start:start + TIMESTAMP_CHUNK_SIZE]
+        matches = functools.reduce(
+            operator.or_, (Q(**lookups) for lookups, _ in chunk)
+        )
+        model.objects.filter(matches).update(
+            **{
+                field_name: Case(
+                    *(
+                        When(**lookups, then=Value(moment, field))
+                        for lookups, moment in chunk
+                    ),
+                    output_field=field,
+                )
+            }
+        )
+
+
+def _new_ids(model, records, fields) -> set:
+    """
+    Return the ids of the records that are not in the database yet.
+
+    An id already holding the same fields is left out, as the batch is
+    being applied again; one holding a different row raises ValueError.
+    """
+    existing = {
+        row[0]: row[1:]
+        for row in model.objects.filter(
+            id__in=[record["id"] for record in records]
+        ).values_list("id", *fields)
+    }
+    taken = sorted(
+        record["id"]
+        for record in records
+        if record["id"] in existing
+        and existing[record["id"]] != tuple(record[f] for f in fields)
+    )
+    if taken:
+        name = model._meta.verbose_name_plural
+        raise ValueError(f"Ids of other {name} in the database: {taken}")
+    return {record["id"] for record in records} - set(existing)
+
+
+class Importer:
+    """
+    Inserts batches of records with one bulk_create per model, resolving
+    usernames, post ids and tag names with one query per batch.
+
+    Counters, search indexes and timelines of the touched rows are
+    brought up to date in the same transaction. Records referring to
+    profiles or posts that do not exist are counted as skipped.
+    """
+
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.has_media = False
+
+    def apply(self, records: list) -> None:
+        by_type = defaultdict(list)
+        for record in records:
+            by_type[record.get("type")].append(record)
+        unknown = set(by_type) - set(RECORD_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown record types: {sorted(unknown)}")
+
+        with transaction.atomic():
+            self.profile_ids = {}
+            self.post_ids = set()
+            self.touched_profiles = set()
+            self.touched_posts = set()
+            for record_type in RECORD_TYPES:
+                if by_type[record_type]:
+                    getattr(self, f"import_{record_type}s")(
+                        by_type[record_type]
+                    )
+            counters.reconcile_profiles(
+                Profile.objects.filter(id__in=self.touched_profiles)
+            )
+            counters.reconcile_posts(
+                Post.objects.filter(id__in=self.touched_posts)
+            )
+
+    def resolve_profiles(self, usernames) -> dict:
+        missing = set(usernames) - set(self.profile_ids)
+        if missing:
+            self.profile_ids.update(
+                Profile.objects.filter(username__in=missing).values_list(
+                    "username", "id"
+                )
+            )
+        return self.profile_ids
+
+    def resolve_posts(self, ids) -> set:
+        missing = set(ids) - self.post_ids
+        if missing:
+            self.post_ids.update(
+                Post.objects.filter(id__in=missing).values_list(
+                    "id", flat=True
+                )
+            )
+        return self.post_ids
+
+    def keep(self, records, valid) -> list:
+        kept = [record for record in records if valid(record)]
+        self.skipped += len(records) - len(kept)
+        self.imported += len(kept)
+        return kept
+
+    def import_profiles(self, records):
+        user_model = get_user_model()
+        user_model.objects.bulk_create(
+            [
+                user_model(
+                    **{
+                        field: record[field]
+                        for field in USER_FIELDS
+                        if field in record
+                    }
+                )
+                for record in records
+            ],
+            ignore_conflicts=True,
+        )
+        user_ids = dict(
+            user_model.objects.filter(
+                email__in=[record["email"] for record in records]
+            ).values_list("email", "id")
+        )
+        profiles = []
+        for record in records:
+            fields = {
+                field: record[field]
+                for field in PROFILE_FIELDS
+                if record.get(field) is not None
+            }
+            self.has_media |= bool(fields.get("profile_picture"))
+            profiles.append(
+                Profile(user_id=user_ids[record["email"]], **fields)
+            )
+        Profile.objects.bulk_create(profiles, ignore_conflicts=True)
+
+        # A user that already has a profile under another name keeps it.
+        ids = self.resolve_profiles(record["username"] for record in records)
+        records = self.keep(records, lambda r: r["username"] in ids)
+        search.index_profiles([ids[record["username"]] for record in records])
+
+    def import_posts(self, records):
+        authors = self.resolve_profiles(record["author"] for record in records)
+        records = self.keep(records, lambda r: r["author"] in authors)
+        new = _new_ids(
+            Post,
+            [
+                {**record, "author_id": authors[record["author"]]}
+                for record in records
+            ],
+            ("author_id", "post_content"),
+        )
+        posts = []
+        created = []
+        for record in records:
+            if record["id"] not in new:
+                continue
+            fields = {
+                field: record[field]
+                for field in POST_FIELDS
+                if record.get(field) is not None
+            }
+            fields["created_at"] = _datetime(record.get("created_at"))
+            created.append(({"id": record["id"]}, fields["created_at"]))
+            self.has_media |= bool(fields.get("media"))
+            posts.append(Post(author_id=authors[record["author"]], **fields))
+        Post.objects.bulk_create(posts)
+        restore_timestamps(Post, "created_at", created)
+        # Followers already in the database; follows of this import are
+        # backfilled by import_follows.
+        timeline.backfill_followers({post.author_id for post in posts})
+
+        tags = {
+            tag.name: tag.id
+            for tag in Tag.objects.resolve(
+                name for record in records for name in record.get("tags", ())
+            )
+        }
+        Post.tags.through.objects.bulk_create(
+            [
+                Post.tags.through(
+                    post_id=record["id"], tag_id=tags[Tag.normalize(name)]
+                )
+                for record in records
+                for name in record.get("tags", ())
+                if Tag.normalize(name) in tags
+            ],
+            ignore_conflicts=True,
+        )
+
+        post_ids = [record["id"] for record in records]
+        self.post_ids.update(post_ids)
+        self.touched_profiles.update(authors[r["author"]] for r in records)
+        search.index_posts(post_ids)
+
+    def import_follows(self, records):
+        ids = self.resolve_profiles(
+            name
+            for record in records
+            for name in (record["follower"], record["following"])
+        )
+        records = self.keep(
+            records,
+            lambda r: r["follower"] in ids
+            and r["following"] in ids
+            and r["follower"] != r["following"],
+        )
+        follows = [
+            Follow(
+                follower_id=ids[record["follower"]],
+                following_id=ids[record["following"]],
+                followed_at=_datetime(record.get("followed_at")),
+            )
+            for record in records
+        ]
+        # Follows that are already there keep their time.
+        existing = set(
+            Follow.objects.filter(
+                follower_id__in={follow.follower_id for follow in follows},
+                following_id__in={follow.following_id for follow in follows},
+            ).values_list("follower_id", "following_id")
+        )
+        created = [
+            (
+                {
+                    "follower_id": follow.follower_id,
+                    "following_id": follow.following_id,
+                },
+                follow.followed_at,
+            )
+            for follow in follows
+            if (follow.follower_id, follow.following_id) not in existing
+        ]
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        restore_timestamps(Follow, "followed_at", created)
+
+        for follow in follows:
+            self.touched_profiles.update(
+                (follow.follower_id, follow.following_id)
+            )
+        timeline.backfill_follows(
+            (follow.follower_id, follow.following_id) for follow in follows
+        )
+
+    def import_likes(self, records):
+        users = self.resolve_profiles(record["user"] for record in records)
+        posts = self.resolve_posts(record["post"] for record in records)
+        records = self.keep(
+            records, lambda r: r["user"] in users and r["post"] in posts
+        )
+        Like.objects.bulk_create(
+            [
+                Like(post_id=record["post"], user_id=users[record["user"]])
+                for record in records
+            ],
+            ignore_conflicts=True,
+        )
+        self.touched_posts.update(record["post"] for record in records)
+
+    def import_comments(self, records):
+        authors = self.resolve_profiles(record["author"] for record in records)
+        posts = self.resolve_posts(record["post"] for record in records)
+        new = _new_ids(
+            Comment,
+            [
+                {
+                    **record,
+                    "post_id": record["post"],
+                    "author_id": authors.get(record["author"]),
+                }
+                for record in records
+            ],
+            ("post_id", "author_id", "content"),
+        )
+        paths = dict(
+            Comment.objects.filter(
+                id__in={record.get("parent") for record in records} - {None}
+            ).values_list("id", "path")
+        )
+
+        rows = []
+        created = []
+        for record in sorted(records, key=lambda r: r["id"]):
+            parent = record.get("parent")
+            if (
+                record["author"] not in authors
+                or record["post"] not in posts
+                or (parent is not None and parent not in paths)
+            ):
+                self.skipped += 1
+                continue
+            prefix = ""
+            if parent is not None:
+                prefix, parent = comments.reply_to(paths[parent])
+            paths[record["id"]] = prefix + comments.segment(record["id"])
+            rows.append(
+                Comment(
+                    id=record["id"],
+                    post_id=record["post"],
+                    author_id=authors[record["author"]],
+                    parent_id=parent,
+                    path=paths[record["id"]],
+                    content=record["content"],
+                    created_at=_datetime(record.get("created_at")),
+                )
+            )
+            if record["id"] in new:
+                created.append(({"id": record["id"]}, rows[-1].created_at))
+        Comment.objects.bulk_create([row for row in rows if row.id in new])
+        restore_timestamps(Comment, "created_at", created)
+        self.imported += len(rows)
+        self.touched_posts.update(row.post_id for row in rows)
+
+    @staticmethod
+    def reset_sequences() -> None:
+        """
+        Move id sequences past the imported ids, on databases that have
+        them.
+        """
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [Post, Comment]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,107 @@
+import math
+from collections import defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from social_media.models import Tag, TagUsage
+
+# Number of tags kept per window; requests can ask for fewer.
+MAX_RESULTS = 50
+CACHE_KEY = "trending_tags:{window}"
+
+
+def bucket_for(moment: datetime) -> datetime:
+    """
+    Return the start of the usage bucket containing moment.
+    """
+    size = settings.TRENDING_BUCKET_SIZE.total_seconds()
+    timestamp = moment.timestamp()
+    return datetime.fromtimestamp(
+        timestamp - timestamp % size, tz=moment.tzinfo
+    )
+
+
+def record(tag_ids, moment: datetime) -> None:
+    """
+    Count one use of each tag in the bucket containing moment.
+
+    Missing bucket rows are created with ignore_conflicts and all of
+    them are incremented with a single UPDATE.
+    """
+    tag_ids = list(tag_ids)
+    if not tag_ids:
+        return
+
+    bucket = bucket_for(moment)
+    TagUsage.objects.bulk_create(
+        [TagUsage(tag_id=tag_id, bucket=bucket) for tag_id in tag_ids],
+        ignore_conflicts=True,
+    )
+    TagUsage.objects.filter(tag_id__in=tag_ids, bucket=bucket).update(
+        count=F("count") + 1
+    )
+
+
+def rank(window: str, now: datetime = None) -> list:
+    """
+    Rank tags by decay-weighted usage over the given window.
+
+    Each bucket's count is weighted by 2 ** (-age / half_life), so recent
+    usage dominates. The cost depends on the number of tags used within
+    the window, not on the number of posts.
+    """
+    length, half_life = settings.TRENDING_WINDOWS[window]
+    now = now or timezone.now()
+
+    scores = defaultdict(float)
+    uses = defaultdict(int)
+    rows = TagUsage.objects.filter(bucket__gt=now - length).values_list(
+        "tag_id", "bucket", "count"
+    )
+    for tag_id, bucket, count in rows:
+        age = max((now - bucket).total_seconds(), 0)
+        scores[tag_id] += count * math.pow(
+            2, -age / half_life.total_seconds()
+        )
+        uses[tag_id] += count
+
+    top = sorted(scores, key=lambda tag_id: (-scores[tag_id], tag_id))[
+        :MAX_RESULTS
+    ]
+    names = dict(Tag.objects.filter(id__in=top).values_list("id", "name"))
+    return [
+        {
+            "name": f"#{names[tag_id]}",
+            "score": round(scores[tag_id], 4),
+            "uses": uses[tag_id],
+        }
+        for tag_id in top
+        if tag_id in names
+    ]
+
+
+def trending(window: str) -> list:
+    """
+    Return the cached ranking for the window, computing it when stale.
+    """
+    key = CACHE_KEY.format(window=window)
+    result = cache.get(key)
+    if result is None:
+        result = rank(window)
+        cache.set(key, result, settings.TRENDING_CACHE_TIMEOUT)
+    return result
+
+
+def prune(now: datetime = None) -> int:
+    """
+    Delete buckets older than the longest window.
+    Returns the number of deleted rows.
+    """
+    now = now or timezone.now()
+    longest = max(length for length, _ in settings.TRENDING_WINDOWS.values())
+    deleted, _ = TagUsage.objects.filter(bucket__lte=now - longest).delete()
+    return deleted
@@ -1,7 +1,7 @@
 from rest_framework import routers
 from django.urls import include, path
 
-from social_media import views
+from social_media import async_views, views
 
 
 router = routers.DefaultRouter()
@@ -9,7 +9,38 @@ router = routers.DefaultRouter()
 router.register(r"posts", views.PostViewSet, basename="post")
 router.register(r"profiles", views.ProfileViewSet, basename="profile")
 
-urlpatterns = [
+# Read-heavy routes served by async views; they take precedence over the
+# router and hand other methods back to the viewsets.
+async_urlpatterns = [
+    path("posts/", async_views.PostListView.as_view(), name="post-list"),
+    path(
+        "posts/following_posts/",
+        async_views.FollowingPostsView.as_view(),
+        name="post-following-posts",
+    ),
+    path(
+        "posts/<int:pk>/",
+        async_views.PostDetailView.as_view(),
+        name="post-detail",
+    ),
+    path(
+        "profiles/",
+        async_views.ProfileListView.as_view(),
+        name="profile-list",
+    ),
+    path(
+        "profiles/<int:pk>/",
+        async_views.ProfileDetailView.as_view(),
+        name="profile-detail",
+    ),
+]
+
+urlpatterns = async_urlpatterns + [
+    path(
+        "tags/trending/",
+        views.TrendingTagsView.as_view(),
+        name="tag-trending",
+    ),
     path("", include(router.urls)),
 ]
 
@@ -1,33 +1,136 @@
+import pathlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.http import HttpResponseRedirect
 from django.urls import reverse
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import (
+    AllowAny,
+    IsAuthenticated,
+    IsAuthenticatedOrReadOnly,
+)
+from rest_framework.views import APIView
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
-
+from PIL import Image
+from rest_framework.exceptions import NotFound
+
+from social_media import (
+    comments,
+    counters,
+    follow_graph,
+    follows,
+    images,
+    media,
+    reaction_buffer,
+    search,
+    thumbnails,
+    timeline,
+    trending,
+)
 from social_media.models import Comment, Follow, Like, Post, Profile, Tag
+from social_media.negotiation import IgnoreClientContentNegotiation
+from social_media.pagination import (
+    CommentPagination,
+    PostPagination,
+    ProfileIdPagination,
+    ProfilePagination,
+    SearchPagination,
+    TimelinePagination,
+)
 from social_media.permissions import ProfilePermission, PostPermission
 from social_media.serializers import (
+    BulkFollowResultSerializer,
+    BulkFollowSerializer,
+    BulkLikeResultSerializer,
+    BulkLikeSerializer,
     CommentPostSerializer,
     CommentSerializer,
     FollowSerializer,
     LikeRetrieveSerializer,
     PostListSerializer,
     PostRetrieveSerializer,
+    PostSearchSerializer,
     PostSerializer,
     ProfileListSerializer,
     ProfileSerializer,
+    ProfileSuggestionSerializer,
+    ProfileTypeaheadSerializer,
     TagSerializer,
+    ThreadCommentSerializer,
+    ThumbnailSerializer,
+    TrendingTagSerializer,
 )
 
 
 # Create your views here.
-class ProfileViewSet(viewsets.ModelViewSet):
+class ThumbnailMixin:
+    """
+    Adds a thumbnail action serving the image of an object resized to
+    any width, rendered on first request and cached on disk.
+    """
+
+    # Key of images.IMAGE_FIELDS
+    image_kind = None
+
+    @extend_schema(
+        parameters=[ThumbnailSerializer],
+        responses={(200, "image/*"): OpenApiTypes.BINARY},
+    )
+    @action(
+        methods=["GET"],
+        detail=True,
+        content_negotiation_class=IgnoreClientContentNegotiation,
+    )
+    def thumbnail(self, request, *args, **kwargs):
+        """
+        Retrieve the image resized to the given width, in webp (default),
+        jpeg or png. Images are never upscaled.
+        """
+        model, field, variants_field = images.IMAGE_FIELDS[self.image_kind]
+        instance = get_object_or_404(
+            model.objects.only(field, variants_field), pk=kwargs["pk"]
+        )
+        self.check_object_permissions(request, instance)
+
+        image_file = getattr(instance, field)
+        if not image_file:
+            raise NotFound("There is no image.")
+        serializer = ThumbnailSerializer(data=request.GET)
+        serializer.is_valid(raise_exception=True)
+        image_format = settings.THUMBNAIL_FORMATS[
+            serializer.validated_data["format"]
+        ]
+
+        try:
+            handle = thumbnails.open_thumbnail(
+                image_file,
+                getattr(instance, variants_field),
+                serializer.validated_data["width"],
+                image_format,
+            )
+        except (OSError, Image.DecompressionBombError):
+            raise NotFound("The image could not be read.")
+        return media.serve_file(
+            request,
+            handle,
+            content_type=Image.MIME[image_format],
+            etag=pathlib.Path(handle.name).stem,
+        )
+
+
+class ProfileViewSet(ThumbnailMixin, viewsets.ModelViewSet):
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
     permission_classes = (ProfilePermission,)
+    pagination_class = ProfilePagination
+    image_kind = "profile"
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -35,31 +138,16 @@ class ProfileViewSet(viewsets.ModelViewSet):
         return super().get_serializer_class()
 
     def get_queryset(self):
-        email = self.request.GET.get("email")
-        username = self.request.GET.get("username")
-        first_name = self.request.GET.get("first_name")
-        last_name = self.request.GET.get("last_name")
-        bio = self.request.GET.get("bio")
-        if email:
-            self.queryset = self.queryset.filter(user__email__icontains=email)
-
-        if username:
-            self.queryset = self.queryset.filter(username__icontains=username)
-
-        if first_name:
-            self.queryset = self.queryset.filter(
-                first_name__icontains=first_name
-            )
-
-        if last_name:
-            self.queryset = self.queryset.filter(
-                last_name__icontains=last_name
-            )
-
-        if bio:
-            self.queryset = self.queryset.filter(bio__icontains=bio)
+        self.queryset = search.filter_profiles(
+            self.queryset,
+            email=self.request.GET.get("email"),
+            username=self.request.GET.get("username"),
+            first_name=self.request.GET.get("first_name"),
+            last_name=self.request.GET.get("last_name"),
+            bio=self.request.GET.get("bio"),
+        )
 
-        return self.queryset
+        return self.get_serializer_class().setup_eager_loading(self.queryset)
 
     @action(
         methods=["GET"],
@@ -81,6 +169,46 @@ class ProfileViewSet(viewsets.ModelViewSet):
             reverse("social_media:profile-detail", args=[profile.id])
         )
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="q",
+                description="Beginning of a username, first or last name",
+                required=True,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="limit",
+                description="Maximum number of suggestions (default 10)",
+                required=False,
+                type=int,
+            ),
+        ],
+        responses=ProfileTypeaheadSerializer(many=True),
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+    )
+    def typeahead(self, request, *args, **kwargs):
+        """
+        Suggest profiles while a name is being typed.
+
+        This action handles GET requests to return a short, unpaginated
+        list of profiles whose username, first or last name starts with
+        the words in 'q', topped up with fuzzy matches when there are
+        not enough of them.
+        """
+        try:
+            limit = min(int(request.GET.get("limit", 10)), 25)
+        except ValueError:
+            limit = 10
+        profiles = search.typeahead_profiles(
+            request.GET.get("q", ""), max(limit, 1)
+        )
+        serializer = ProfileTypeaheadSerializer(profiles, many=True)
+        return Response(serializer.data)
+
     @action(
         methods=["GET"],
         detail=False,
@@ -123,6 +251,96 @@ class ProfileViewSet(viewsets.ModelViewSet):
         )
         return super().list(request, *args, **kwargs)
 
+    def list_profile_ids(self, ids):
+        paginator = ProfileIdPagination()
+        page = paginator.paginate_ids(
+            ids,
+            ProfileListSerializer.setup_eager_loading(Profile.objects.all()),
+            self.request,
+            view=self,
+        )
+        serializer = ProfileListSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @extend_schema(responses=ProfileListSerializer(many=True))
+    @action(
+        methods=["GET"],
+        detail=True,
+        permission_classes=(IsAuthenticated,),
+    )
+    def mutual_followers(self, request, *args, **kwargs):
+        """
+        Retrieve the profiles the current user follows that also follow
+        this profile.
+        """
+        profile = get_object_or_404(
+            Profile.objects.only("id"), pk=kwargs["pk"]
+        )
+        ids = follow_graph.get_graph().mutual_followers(
+            request.user.profile.id, profile.id
+        )
+        return self.list_profile_ids(ids)
+
+    @extend_schema(responses=ProfileListSerializer(many=True))
+    @action(
+        methods=["GET"],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+    )
+    def follows_you_back(self, request, *args, **kwargs):
+        """
+        Retrieve the profiles the current user follows that follow the
+        current user back.
+        """
+        ids = follow_graph.get_graph().follows_back(request.user.profile.id)
+        return self.list_profile_ids(ids)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="limit",
+                description="Number of suggestions (default 10, at most 50)",
+                required=False,
+                type=int,
+            ),
+        ],
+        responses=ProfileSuggestionSerializer(many=True),
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+    )
+    def suggestions(self, request, *args, **kwargs):
+        """
+        Suggest profiles to follow: profiles followed by the profiles
+        the current user follows, ranked by how many of them (overlap)
+        follow each one.
+        """
+        try:
+            limit = min(max(int(request.GET.get("limit", 10)), 1), 50)
+        except ValueError:
+            limit = 10
+
+        ranked = follow_graph.get_graph().suggestions(
+            request.user.profile.id, limit
+        )
+        profiles = ProfileSuggestionSerializer.setup_eager_loading(
+            Profile.objects.all()
+        ).in_bulk([profile_id for profile_id, _ in ranked])
+        suggested = []
+        for profile_id, overlap in ranked:
+            if profile_id in profiles:
+                profiles[profile_id].overlap = overlap
+                suggested.append(profiles[profile_id])
+
+        serializer = ProfileSuggestionSerializer(
+            suggested, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
     @action(
         methods=["GET"],
         detail=True,
@@ -145,24 +363,38 @@ class ProfileViewSet(viewsets.ModelViewSet):
         profile = self.get_object()
         user = request.user.profile
 
-        follow_data = {
-            "follower": user.id,
-            "following": profile.id,
-        }
-
-        serializer = FollowSerializer(data=follow_data)
-        serializer.is_valid(raise_exception=True)
-
-        relation = Follow.objects.filter(follower=user, following=profile)
-
-        if not relation.exists():
-            Follow.objects.create(follower=user, following=profile)
-        else:
-            relation.delete()
+        FollowSerializer().validate({"follower": user, "following": profile})
+        follows.toggle(user, profile)
         return HttpResponseRedirect(
             reverse("social_media:profile-detail", args=[profile.id])
         )
 
+    @extend_schema(
+        request=BulkFollowSerializer, responses=BulkFollowResultSerializer
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="follow/bulk",
+        permission_classes=(IsAuthenticated,),
+    )
+    def bulk_follow(self, request, *args, **kwargs):
+        """
+        Follow and unfollow many profiles at once.
+
+        The body holds lists of profile ids such as
+        {"follow": [1, 2], "unfollow": [3]}. Following a profile that is
+        already followed, or unfollowing one that is not, changes
+        nothing. Profiles that do not exist are returned under 'missing'.
+        """
+        profile = request.user.profile
+        serializer = BulkFollowSerializer(
+            data=request.data, context={"profile": profile}
+        )
+        serializer.is_valid(raise_exception=True)
+        result = follows.apply(profile, **serializer.validated_data)
+        return Response(BulkFollowResultSerializer(result).data)
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
@@ -268,6 +500,27 @@ class ProfileViewSet(viewsets.ModelViewSet):
         """
         return super().partial_update(request, *args, **kwargs)
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            profiles = list(
+                Profile.objects.filter(
+                    Q(followers__follower=instance)
+                    | Q(following__following=instance)
+                ).values_list("id", flat=True)
+            )
+            posts = list(
+                Post.objects.filter(
+                    Q(likes__user=instance) | Q(comments__author=instance)
+                )
+                .exclude(author=instance)
+                .values_list("id", flat=True)
+            )
+            instance.delete()
+            counters.reconcile_profiles(
+                Profile.objects.filter(id__in=profiles)
+            )
+            counters.reconcile_posts(Post.objects.filter(id__in=posts))
+
     @extend_schema()
     def destroy(self, request, *args, **kwargs):
         """
@@ -286,10 +539,59 @@ class TagViewSet(viewsets.ModelViewSet):
     serializer_class = TagSerializer
 
 
-class PostViewSet(viewsets.ModelViewSet):
+class TrendingTagsView(APIView):
+    permission_classes = (AllowAny,)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="window",
+                description="Time window: 1h, 24h (default) or 7d",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="limit",
+                description="Number of tags to return (default 10)",
+                required=False,
+                type=int,
+            ),
+        ],
+        responses=TrendingTagSerializer(many=True),
+    )
+    def get(self, request, *args, **kwargs):
+        """
+        Retrieve the currently trending tags.
+
+        Tags are ranked by how often they were used in new posts within
+        the window, recent usage weighing more than older usage.
+        The ranking is cached for a short time.
+        """
+        window = request.GET.get("window", "24h")
+        if window not in settings.TRENDING_WINDOWS:
+            return Response(
+                {
+                    "window": "Must be one of "
+                    + ", ".join(settings.TRENDING_WINDOWS)
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limit = int(request.GET.get("limit", 10))
+        except ValueError:
+            limit = 10
+
+        tags = trending.trending(window)[: max(limit, 1)]
+        serializer = TrendingTagSerializer(tags, many=True)
+        return Response(serializer.data)
+
+
+class PostViewSet(ThumbnailMixin, viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = (PostPermission,)
+    pagination_class = PostPagination
+    image_kind = "post"
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -299,6 +601,10 @@ class PostViewSet(viewsets.ModelViewSet):
             return PostRetrieveSerializer
         if self.action == "comment":
             return CommentPostSerializer
+        if self.action == "search":
+            return PostSearchSerializer
+        if self.action == "comments":
+            return ThreadCommentSerializer
 
         return PostSerializer
 
@@ -308,7 +614,7 @@ class PostViewSet(viewsets.ModelViewSet):
         author = self.request.GET.get("author")
 
         if content:
-            self.queryset = self.queryset.filter(content__icontains=content)
+            self.queryset = search.filter_posts(self.queryset, content)
 
         if author:
             self.queryset = self.queryset.filter(
@@ -316,10 +622,10 @@ class PostViewSet(viewsets.ModelViewSet):
             )
 
         if tag_data:
-            tags = [tag for tag in tag_data.split(",")]
+            tags = [Tag.normalize(tag) for tag in tag_data.split(",")]
             self.queryset = self.queryset.filter(tags__name__in=tags)
 
-        return self.queryset
+        return self.get_serializer_class().setup_eager_loading(self.queryset)
 
     @action(
         methods=["POST", "GET"],
@@ -355,17 +661,21 @@ class PostViewSet(viewsets.ModelViewSet):
         This action handles GET and POST
         requests to fetch posts authored by users
         whom the current user is following.
-        The posts are filtered based on the
-        follow relationships of the current user's profile.
+        The posts are read from the materialized home timeline
+        of the current user's profile, newest first.
         """
         if not request.user.is_authenticated:
             return HttpResponseRedirect(reverse("user:create_user"))
 
-        followings = Follow.objects.filter(follower=request.user.profile)
-        self.queryset = self.queryset.filter(
-            author__user__in=followings.values("following")
+        entries = self.get_serializer_class().setup_eager_loading(
+            timeline.get_feed(request.user.profile), prefix="post__"
         )
-        return super().list(request, *args, **kwargs)
+        paginator = TimelinePagination()
+        page = paginator.paginate_queryset(entries, request, view=self)
+        serializer = self.get_serializer(
+            [entry.post for entry in page], many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
 
     @action(
         methods=["GET", "POST"],
@@ -382,9 +692,45 @@ class PostViewSet(viewsets.ModelViewSet):
         if not request.user.is_authenticated:
             return HttpResponseRedirect(reverse("user:create_user"))
 
-        likes_data = self.queryset.filter(likes__user__user=request.user)
-        serializer = PostRetrieveSerializer(likes_data, many=True)
-        return Response(serializer.data)
+        likes_data = PostRetrieveSerializer.setup_eager_loading(
+            self.queryset.filter(likes__user__user=request.user)
+        )
+        page = self.paginate_queryset(likes_data)
+        serializer = PostRetrieveSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="q",
+                description="Words to search for in post content and tags",
+                required=True,
+                type=str,
+            ),
+        ]
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        pagination_class=SearchPagination,
+    )
+    def search(self, request, *args, **kwargs):
+        """
+        Full-text search over post content and tag names.
+
+        This action handles GET requests to find posts matching every word
+        of the 'q' query parameter, the last word being matched as a prefix.
+        Results are ranked by BM25 relevance and each one carries a
+        highlighted snippet of the matching content.
+        """
+        queryset = PostSearchSerializer.setup_eager_loading(
+            search.search_posts(request.GET.get("q", ""))
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(
         detail=True,
@@ -402,24 +748,72 @@ class PostViewSet(viewsets.ModelViewSet):
             return HttpResponseRedirect(reverse("user:create_user"))
 
         post = self.get_object()
-        if post.likes.filter(user=request.user.profile).exists():
-            post.likes.filter(user=request.user.profile).delete()
-            return HttpResponseRedirect(
-                reverse("social_media:post-detail", args=[post.id])
-            )
+        reaction_buffer.record(post.id, request.user.profile, None)
+        return HttpResponseRedirect(
+            reverse("social_media:post-detail", args=[post.id])
+        )
 
-        else:
-            post.likes.create(user=request.user.profile)
-            return HttpResponseRedirect(
-                reverse("social_media:post-detail", args=[post.id])
-            )
+    @extend_schema(request=None, responses=None)
+    @action(
+        methods=["PUT", "DELETE"],
+        detail=True,
+        permission_classes=(IsAuthenticated,),
+    )
+    def like(self, request, *args, **kwargs):
+        """
+        Like or unlike a post.
+
+        PUT likes the post and DELETE removes the like. Both are
+        idempotent: repeating a request leaves the post unchanged.
+        Returns whether the post is liked and its like count, including
+        likes that are still waiting to be written.
+        """
+        post = self.get_object()
+        liked = reaction_buffer.record(
+            post.id, request.user.profile, request.method == "PUT"
+        )
+        post.refresh_from_db(fields=["likes_count"])
+        pending = reaction_buffer.pending_counts([post.id]).get(post.id, 0)
+        return Response(
+            {"liked": liked, "likes": max(post.likes_count + pending, 0)}
+        )
+
+    @extend_schema(
+        request=BulkLikeSerializer, responses=BulkLikeResultSerializer
+    )
+    @action(
+        methods=["POST"],
+        detail=False,
+        url_path="likes/bulk",
+        permission_classes=(IsAuthenticated,),
+    )
+    def bulk_likes(self, request, *args, **kwargs):
+        """
+        Apply many like and unlike operations at once.
+
+        The body holds a list of operations such as
+        {"post": 1, "liked": true}. They are applied in one transaction,
+        the last operation for a post winning. Posts that do not exist
+        are returned under 'missing'.
+        """
+        serializer = BulkLikeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = reaction_buffer.apply(
+            request.user.profile,
+            [
+                (operation["post"], operation["liked"])
+                for operation in serializer.validated_data["operations"]
+            ],
+        )
+        return Response(BulkLikeResultSerializer(result).data)
 
     @action(methods=["GET", "POST"], detail=True)
     def comment(self, request, *args, **kwargs):
         """
         Get or create a comment on a post.
 
-        GET requests retrieve the comments on the post.
+        GET requests retrieve the post with its latest comments; all
+        comments are listed by the comments action.
         POST requests create a new comment on the post.
 
         The request should contain the content of the comment in the body.
@@ -448,9 +842,65 @@ class PostViewSet(viewsets.ModelViewSet):
                 serializer.errors, status=status.HTTP_400_BAD_REQUEST
             )
 
-        post_serializer = PostRetrieveSerializer(post)
+        post = PostRetrieveSerializer.setup_eager_loading(
+            Post.objects.all()
+        ).get(pk=post.pk)
+        post_serializer = PostRetrieveSerializer(
+            post, context=self.get_serializer_context()
+        )
         return Response(post_serializer.data, status=status.HTTP_200_OK)
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="root",
+                description="Only return this comment and its replies",
+                required=False,
+                type=int,
+            ),
+        ],
+    )
+    @action(
+        methods=["GET", "POST"],
+        detail=True,
+        permission_classes=(IsAuthenticatedOrReadOnly,),
+        pagination_class=CommentPagination,
+    )
+    def comments(self, request, *args, **kwargs):
+        """
+        List or add comments on a post.
+
+        GET returns the comments in thread order: every comment is
+        followed by its replies, depth first. Pass root to get a single
+        comment with all its replies. POST adds a comment, or a reply
+        when parent is given.
+        """
+        post = get_object_or_404(Post.objects.only("id"), pk=kwargs["pk"])
+        context = {**self.get_serializer_context(), "post": post}
+
+        if request.method == "POST":
+            serializer = ThreadCommentSerializer(
+                data=request.data, context=context
+            )
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        queryset = ThreadCommentSerializer.setup_eager_loading(
+            post.comments.all()
+        )
+        root = request.GET.get("root")
+        if root:
+            root = get_object_or_404(
+                post.comments.only("post_id", "path"),
+                pk=root if root.isdigit() else None,
+            )
+            queryset = comments.subtree(queryset, root)
+
+        page = self.paginate_queryset(queryset)
+        serializer = ThreadCommentSerializer(page, many=True, context=context)
+        return self.get_paginated_response(serializer.data)
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
@@ -542,6 +992,11 @@ class PostViewSet(viewsets.ModelViewSet):
         """
         return super().partial_update(request, *args, **kwargs)
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            counters.adjust(Profile, instance.author_id, posts_count=-1)
+
     @extend_schema()
     def destroy(self, request, *args, **kwargs):
         """
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "social_media_api.settings")
 
 application = get_asgi_application()
+
+# Load the follow graph now rather than on the first request using it.
+from social_media import follow_graph  # noqa: E402
+
+follow_graph.warm()
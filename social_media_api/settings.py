@@ -60,6 +60,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "social_media.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -149,12 +150,14 @@ AUTH_USER_MODEL = "user.User"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "user.authentication.AsyncJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_PAGINATION_CLASS": "social_media.pagination.KeysetPagination",
+    "PAGE_SIZE": 20,
 }
 
 SIMPLE_JWT = {
@@ -163,11 +166,126 @@ SIMPLE_JWT = {
     "ROTATE_REFRESH_TOKENS": False,
     "BLACKLIST_AFTER_ROTATION": False,
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "user.serializers.TokenRefreshSerializer",
+    "TOKEN_VERIFY_SERIALIZER": "user.serializers.TokenVerifySerializer",
 }
 
+# Blacklisted tokens are looked up through a Bloom filter in each process.
+# Newly blacklisted tokens are added to it as they are blacklisted (other
+# processes notice this through the cache, so use a shared CACHES backend
+# with several processes; a warning is logged otherwise unless DEBUG is
+# on) and it is rebuilt every TOKEN_BLACKLIST_FILTER_MAX_AGE seconds.
+TOKEN_BLACKLIST_FILTER_MAX_AGE = 60
+
+# Authenticated users and their profiles are cached in each process for
+# AUTH_USER_CACHE_TIMEOUT seconds (0 disables the cache), keeping at most
+# AUTH_USER_CACHE_MAX_SIZE of them. Saving or deleting a user or profile
+# drops its entry in the process that made the change.
+AUTH_USER_CACHE_TIMEOUT = 30
+AUTH_USER_CACHE_MAX_SIZE = 10_000
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "Social Media API",
     "DESCRIPTION": "Social Media description",
     "VERSION": "1.0.0",
     "SERVE_INCLUDE_SCHEMA": False,
 }
+
+# Home timeline: posts are pushed to followers on write unless the author
+# has more followers than TIMELINE_FANOUT_MAX_FOLLOWERS, in which case
+# their posts are pulled into timelines when the feed is read.
+TIMELINE_FANOUT_MAX_FOLLOWERS = 1000
+TIMELINE_BACKFILL_SIZE = 200
+
+# Trending tags: usage is counted per TRENDING_BUCKET_SIZE and ranked with
+# an exponential decay over each window, given as (length, half-life).
+TRENDING_BUCKET_SIZE = timedelta(minutes=10)
+TRENDING_WINDOWS = {
+    "1h": (timedelta(hours=1), timedelta(minutes=15)),
+    "24h": (timedelta(hours=24), timedelta(hours=6)),
+    "7d": (timedelta(days=7), timedelta(days=2)),
+}
+TRENDING_CACHE_TIMEOUT = 60
+
+# Reaction buffer: like/unlike intents are collected in the backend and
+# written in batches every REACTION_BUFFER_FLUSH_INTERVAL seconds, or as
+# soon as REACTION_BUFFER_MAX_PENDING intents are waiting. Buffering is
+# on only with REACTION_BUFFER_REDIS_URL, which lets every process see
+# and flush the buffer (including the flush_reactions command); without
+# it every reaction is written directly. The in-process
+# "social_media.reaction_buffer.MemoryStore" loses intents when a worker
+# dies before flushing and is meant for a single process and tests.
+REACTION_BUFFER_REDIS_URL = os.getenv("REACTION_BUFFER_REDIS_URL")
+if REACTION_BUFFER_REDIS_URL:
+    REACTION_BUFFER_BACKEND = "social_media.reaction_buffer.RedisStore"
+    REACTION_BUFFER_OPTIONS = {"url": REACTION_BUFFER_REDIS_URL}
+else:
+    REACTION_BUFFER_BACKEND = None
+    REACTION_BUFFER_OPTIONS = {}
+REACTION_BUFFER_FLUSH_INTERVAL = 1.0
+REACTION_BUFFER_MAX_PENDING = 5000
+
+# Celery: without CELERY_BROKER_URL tasks run eagerly in the calling
+# process, which is what tests and local development use.
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
+CELERY_TASK_ALWAYS_EAGER = CELERY_BROKER_URL is None
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_IGNORE_RESULT = True
+# Periodic tasks, run by `celery -A social_media_api beat`.
+CELERY_BEAT_SCHEDULE = {
+    "purge-tokens": {
+        "task": "user.tasks.purge_tokens",
+        "schedule": timedelta(hours=1),
+    },
+    "prune-trending-tags": {
+        "task": "social_media.tasks.prune_trending_tags",
+        "schedule": timedelta(hours=1),
+    },
+}
+
+# Uploaded images: EXIF data is stripped from the original and it is
+# re-encoded into variants fitting square boxes of the given size.
+IMAGE_VARIANTS = {
+    "post": {"small": 320, "medium": 800, "large": 1600},
+    "profile": {"small": 64, "medium": 256},
+}
+IMAGE_VARIANT_FORMAT = "WEBP"
+IMAGE_VARIANT_QUALITY = 80
+
+# Thumbnails of any width rendered on request, kept in a disk cache
+# from which the least recently used ones are evicted beyond max size.
+THUMBNAIL_CACHE_DIR = MEDIA_ROOT / "thumbnails"
+THUMBNAIL_CACHE_MAX_SIZE = 512 * 1024 * 1024
+THUMBNAIL_MAX_WIDTH = 2048
+THUMBNAIL_FORMATS = {"webp": "WEBP", "jpeg": "JPEG", "png": "PNG"}
+
+# Media serving: files are sent by Django with ETags, conditional and
+# range requests. Set MEDIA_SENDFILE to "x-accel-redirect" (nginx, with
+# an internal location at MEDIA_SENDFILE_PREFIX aliased to MEDIA_ROOT)
+# or "x-sendfile" (Apache, lighttpd) to let the web server send them.
+MEDIA_SENDFILE = os.getenv("MEDIA_SENDFILE") or None
+MEDIA_SENDFILE_PREFIX = "/protected-media/"
+# Cache lifetime of files that may change; content-addressed files are
+# cached for a year.
+MEDIA_CACHE_MAX_AGE = 3600
+
+# Follow graph kept in memory for mutual follower and suggestion queries.
+# Each process reloads it after FOLLOW_GRAPH_MAX_AGE seconds to pick up
+# changes made by other processes; its own changes apply immediately.
+FOLLOW_GRAPH_MAX_AGE = 300
+# Neighbour lists walked per hop when ranking suggestions.
+FOLLOW_GRAPH_SUGGESTION_FANOUT = 1000
+
+# Request metrics, served at /metrics in the Prometheus text format to
+# requests bearing METRICS_TOKEN, or to INTERNAL_IPS if it is unset. Set
+# METRICS_DIR to a directory shared by the workers of a server to report
+# their sums; otherwise each process reports its own. None as backend
+# turns recording off.
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_BACKEND = (
+    "social_media.metrics.FileStore"
+    if METRICS_DIR
+    else "social_media.metrics.MemoryStore"
+)
+METRICS_OPTIONS = {"directory": METRICS_DIR} if METRICS_DIR else {}
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
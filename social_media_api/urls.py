@@ -18,13 +18,13 @@ Including another URLconf
 from debug_toolbar.toolbar import debug_toolbar_urls
 from django.contrib import admin
 from django.urls import include, path
-from django.conf.urls.static import static
 from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularRedocView,
     SpectacularSwaggerView,
 )
 
+from social_media import media, metrics
 from social_media_api import settings
 
 
@@ -33,6 +33,7 @@ urlpatterns = (
         path("admin/", admin.site.urls),
         path("platform/", include("social_media.urls")),
         path("user/", include("user.urls")),
+        path("metrics", metrics.export, name="metrics"),
         path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
         path(
             "api/schema/swagger-ui/",
@@ -46,5 +47,11 @@ urlpatterns = (
         ),
     ]
     + debug_toolbar_urls()
-    + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    + [
+        path(
+            settings.MEDIA_URL.lstrip("/") + "<path:path>",
+            media.serve,
+            name="media",
+        )
+    ]
 )
@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (
+    AuthenticationFailed,
+    InvalidToken,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from user import tokens
+
+
+class UserCache:
+    """
+    Size-bounded LRU cache of users and their profiles, whose entries
+    expire after AUTH_USER_CACHE_TIMEOUT seconds.
+
+    Field values are cached rather than model instances, so every
+    request gets instances of its own. Entries are keyed by the
+    USER_ID_FIELD of the token.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation, so that a user read before it
+        # is not cached after it.
+        self.version = 0
+
+    def get(self, user_id):
+        timeout = settings.AUTH_USER_CACHE_TIMEOUT
+        if not timeout:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > timeout:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        return _restore(entry[1])
+
+    def set(self, user_id, user, version: int) -> None:
+        if not settings.AUTH_USER_CACHE_TIMEOUT:
+            return
+        snapshot = _snapshot(user)
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[user_id] = (time.monotonic(), snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > settings.AUTH_USER_CACHE_MAX_SIZE:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id) -> None:
+        with self._lock:
+            self.version += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+def _values(instance) -> tuple:
+    return instance._state.db, [
+        getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+    ]
+
+
+def _from_values(model, values):
+    db, row = values
+    return model.from_db(
+        db, [field.attname for field in model._meta.concrete_fields], row
+    )
+
+
+def _snapshot(user) -> tuple:
+    try:
+        profile = user.profile
+    except ObjectDoesNotExist:
+        return _values(user), None
+    return _values(user), _values(profile)
+
+
+def _restore(snapshot):
+    user_values, profile_values = snapshot
+    user = _from_values(get_user_model(), user_values)
+    relation = user._meta.get_field("profile")
+    profile = None
+    if profile_values is not None:
+        profile = _from_values(relation.related_model, profile_values)
+        relation.field.set_cached_value(profile, user)
+    # A cached None makes user.profile raise DoesNotExist without a query.
+    relation.set_cached_value(user, profile)
+    return user
+
+
+def _user_id(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(
+            _("Token contained no recognizable user identification")
+        )
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication loading the user together with their profile and
+    keeping both in an in-process cache for a short while.
+
+    Entries are dropped when the user or profile is saved or deleted in
+    this process; changes made by other processes, or by bulk updates
+    that send no signals, show after at most AUTH_USER_CACHE_TIMEOUT
+    seconds.
+    """
+
+    def get_user(self, validated_token):
+        user_id = _user_id(validated_token)
+        user = user_cache.get(user_id)
+        if user is None:
+            version = user_cache.version
+            try:
+                user = self.user_model.objects.select_related("profile").get(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(
+                    _("User not found"), code="user_not_found"
+                )
+            user_cache.set(user_id, user, version)
+        return self.check_user(user, validated_token)
+
+    def check_user(self, user, validated_token):
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(
+                _("User is inactive"), code="user_inactive"
+            )
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."),
+                    code="password_changed",
+                )
+
+        if tokens.is_revoked(validated_token, user):
+            raise AuthenticationFailed(
+                _("Token has been revoked."), code="token_revoked"
+            )
+
+        return user
+
+
+class AsyncJWTAuthentication(CachedJWTAuthentication):
+    """
+    JWTAuthentication for async views.
+
+    Token parsing and validation are CPU-only and reused as they are;
+    the user is loaded with the async ORM together with their profile.
+    """
+
+    async def aauthenticate(self, request):
+        """
+        Return (user, validated token) like authenticate(), or None if
+        the request carries no token. Raises AuthenticationFailed for
+        invalid tokens.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = _user_id(validated_token)
+        user = user_cache.get(user_id)
+        if user is None:
+            version = user_cache.version
+            try:
+                user = await self.user_model.objects.select_related(
+                    "profile"
+                ).aget(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(
+                    _("User not found"), code="user_not_found"
+                )
+            user_cache.set(user_id, user, version)
+        return self.check_user(user, validated_token)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from user import tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete outstanding and blacklisted tokens that expired or were "
+        "revoked by a logout from all devices."
+    )
+
+    def handle(self, *args, **options):
+        outstanding, blacklisted = tokens.purge()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {outstanding} outstanding and {blacklisted} "
+                "blacklisted tokens."
+            )
+        )
@@ -38,6 +38,10 @@ class UserManager(BaseUserManager):
 class User(AbstractUser):
     username = None
     email = models.EmailField(unique=True)
+    # Tokens issued before this moment are revoked; see user.tokens.
+    tokens_valid_after = models.DateTimeField(
+        null=True, blank=True, editable=False
+    )
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
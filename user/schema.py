@@ -0,0 +1,16 @@
+"""
+OpenAPI extensions for the authentication classes of this app.
+"""
+
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    """
+    Describe CachedJWTAuthentication and its subclasses as the same
+    `jwtAuth` bearer scheme as simplejwt's JWTAuthentication, which
+    drf-spectacular only recognises by its exact class.
+    """
+
+    target_class = "user.authentication.CachedJWTAuthentication"
+    match_subclasses = True
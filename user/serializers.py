@@ -1,7 +1,14 @@
 from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
 
 from django.contrib.auth import get_user_model
 
+from user import tokens
+from user.authentication import CachedJWTAuthentication
+
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -37,3 +44,50 @@ class UserSerializer(serializers.ModelSerializer):
             user.save()
 
         return user
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    """
+    Refresh with the blacklist checked through the in-memory filter and
+    the user taken from the authentication cache.
+    """
+
+    token_class = tokens.RefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        try:
+            CachedJWTAuthentication().get_user(refresh)
+        except AuthenticationFailed:
+            raise AuthenticationFailed(
+                self.error_messages["no_active_account"],
+                "no_active_account",
+            )
+
+        data = {"access": str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+
+            data["refresh"] = str(refresh)
+
+        return data
+
+
+class TokenVerifySerializer(jwt_serializers.TokenVerifySerializer):
+    """
+    Verify that a token is neither blacklisted nor revoked by a logout
+    from all devices.
+    """
+
+    def validate(self, attrs):
+        token = UntypedToken(attrs["token"])
+        if tokens.is_blacklisted(token.get(api_settings.JTI_CLAIM, "")):
+            raise serializers.ValidationError("Token is blacklisted")
+        CachedJWTAuthentication().get_user(token)
+        return {}
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from user import tokens
+from user.authentication import user_cache
+
+
+def forget_user(user_id) -> None:
+    """
+    Drop a cached user now and again on commit, so that a request
+    reading the row before the commit does not keep the old values.
+    """
+    user_cache.invalidate(user_id)
+    transaction.on_commit(lambda: user_cache.invalidate(user_id))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_saved_user(sender, instance, **kwargs):
+    forget_user(getattr(instance, api_settings.USER_ID_FIELD))
+
+
+@receiver(post_save, sender="social_media.Profile")
+@receiver(post_delete, sender="social_media.Profile")
+def forget_user_of_profile(sender, instance, **kwargs):
+    if api_settings.USER_ID_FIELD in ("id", "pk"):
+        forget_user(instance.user_id)
+    else:
+        user_cache.clear()
+
+
+@receiver(setting_changed)
+def clear_user_cache(setting, **kwargs):
+    if setting.startswith("AUTH_USER_CACHE"):
+        user_cache.clear()
+    elif setting.startswith("TOKEN_BLACKLIST_FILTER") or setting == "CACHES":
+        tokens.reset()
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def reload_blacklist_filters(sender, created, **kwargs):
+    if created:
+        transaction.on_commit(tokens.blacklist_changed)
@@ -0,0 +1,11 @@
+from celery import shared_task
+
+from user import tokens
+
+
+@shared_task
+def purge_tokens() -> tuple:
+    """
+    Delete expired and revoked tokens; scheduled by CELERY_BEAT_SCHEDULE.
+    """
+    return tokens.purge()
@@ -1,3 +1,246 @@
-from django.test import TestCase
+import datetime
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from social_media.models import Profile
+from social_media_api.celery import app
+from user import tasks, tokens
+from user.authentication import user_cache
+from user.models import User
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.addCleanup(user_cache.clear)
+        user_cache.clear()
+        self.user = User.objects.create_user(
+            email="user@example.com", password="password123"
+        )
+        self.profile = Profile.objects.create(
+            user=self.user,
+            username="user",
+            first_name="first",
+            last_name="last",
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.url = reverse("user:manage_user")
+
+    def get(self, url=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url or self.url)
+        return response, len(queries)
+
+    def test_user_and_profile_are_cached(self):
+        first, cold = self.get()
+        second, warm = self.get()
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(cold - warm, 1)
+
+        url = reverse("social_media:profile-my-profile")
+        response, queries = self.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(queries, 0)
+
+    def test_update_invalidates(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                self.url, {"email": "new@example.com"}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get()[0].data["email"], "new@example.com")
+
+        self.profile.username = "renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.save()
+        user = user_cache.get(self.user.id)
+        self.assertIsNone(user)
+        self.get()
+        self.assertEqual(
+            user_cache.get(self.user.id).profile.username, "renamed"
+        )
+
+    def test_deactivated_user_is_rejected(self):
+        self.get()
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.get()[0].status_code, 401)
+
+    def test_password_change_reaches_the_cache(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.url, {"password": "changed12345"})
+        self.get()
+        self.assertTrue(
+            user_cache.get(self.user.id).check_password("changed12345")
+        )
+
+    @override_settings(AUTH_USER_CACHE_MAX_SIZE=1)
+    def test_least_recently_used_are_evicted(self):
+        other = User.objects.create_user(email="other@example.com")
+        user_cache.set(self.user.id, self.user, user_cache.version)
+        user_cache.set(other.id, other, user_cache.version)
+        self.assertIsNone(user_cache.get(self.user.id))
+        self.assertEqual(user_cache.get(other.id).email, "other@example.com")
+
+    @override_settings(AUTH_USER_CACHE_TIMEOUT=0)
+    def test_cache_can_be_disabled(self):
+        self.get()
+        self.assertIsNone(user_cache.get(self.user.id))
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        self.addCleanup(user_cache.clear)
+        user_cache.clear()
+        self.addCleanup(tokens.reset)
+        tokens.reset()
+        self.user = User.objects.create_user(email="user@example.com")
+        self.refresh = RefreshToken.for_user(self.user)
+        self.client = APIClient()
+
+    def refresh_token(self, token):
+        return self.client.post(
+            reverse("user:token_refresh"), {"refresh": str(token)}
+        )
+
+    def test_logout_revokes_every_token(self):
+        earlier = self.refresh.access_token
+        earlier.set_iat(
+            at_time=datetime.datetime.now(datetime.timezone.utc)
+            - datetime.timedelta(minutes=1)
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {earlier}")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("user:logout"))
+        self.assertEqual(response.status_code, 302)
+        self.user.refresh_from_db()
+
+        response = self.client.get(reverse("user:manage_user"))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data["code"], "token_revoked")
+        response = self.client.post(
+            reverse("user:token_verify"), {"token": str(earlier)}
+        )
+        self.assertEqual(response.status_code, 401)
+
+        # Tokens carry whole seconds; move the logout away from the
+        # second in which the next token is issued.
+        self.user.tokens_valid_after -= datetime.timedelta(seconds=30)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        later = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {later}")
+        response = self.client.get(reverse("user:manage_user"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_refresh_tokens_of_the_logout_second_are_blacklisted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tokens.revoke_all(self.user)
+        self.assertTrue(
+            BlacklistedToken.objects.filter(token__jti=self.refresh["jti"])
+        )
+        self.assertTrue(tokens.is_blacklisted(self.refresh["jti"]))
+        self.assertEqual(self.refresh_token(self.refresh).status_code, 401)
+        response = self.client.post(
+            reverse("user:token_verify"), {"token": str(self.refresh)}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_blacklist_filter(self):
+        other = RefreshToken.for_user(self.user)
+        self.assertFalse(tokens.is_blacklisted(self.refresh["jti"]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.refresh.blacklist()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(tokens.is_blacklisted(other["jti"]))
+            self.assertFalse(tokens.is_blacklisted(other["jti"]))
+        # One query adds the new row, then the filter answers on its own.
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(tokens.is_blacklisted(self.refresh["jti"]))
+        self.assertEqual(self.refresh_token(self.refresh).status_code, 401)
+        self.assertEqual(self.refresh_token(other).status_code, 200)
+
+    def test_blacklisted_tokens_are_added_in_place(self):
+        other = RefreshToken.for_user(self.user)
+        bloom = tokens._blacklist_filter()
+        with mock.patch.object(
+            tokens, "_rebuild", side_effect=AssertionError
+        ), self.captureOnCommitCallbacks(execute=True):
+            other.blacklist()
+        with mock.patch.object(tokens, "_rebuild", side_effect=AssertionError):
+            self.assertTrue(tokens.is_blacklisted(other["jti"]))
+            self.assertFalse(tokens.is_blacklisted(self.refresh["jti"]))
+        self.assertIs(tokens._blacklist_filter(), bloom)
+
+    @override_settings(TOKEN_BLACKLIST_FILTER_MAX_AGE=0)
+    def test_rebuild_runs_in_one_thread(self):
+        bloom = tokens._blacklist_filter()
+        with tokens._rebuild_lock:
+            # Another thread is rebuilding: keep using the current filter.
+            self.assertIs(tokens._blacklist_filter(), bloom)
+        self.assertIsNot(tokens._blacklist_filter(), bloom)
+
+    def test_process_local_cache_is_reported(self):
+        with override_settings(DEBUG=False), self.assertLogs(
+            "user.tokens", "WARNING"
+        ):
+            tokens.check_cache()
+        with override_settings(DEBUG=True), self.assertNoLogs("user.tokens"):
+            tokens.check_cache()
+
+    def test_purge(self):
+        expired = OutstandingToken.objects.get(jti=self.refresh["jti"])
+        expired.expires_at = expired.created_at
+        expired.save()
+        self.refresh.blacklist()
+        kept = RefreshToken.for_user(self.user)
+
+        self.assertEqual(tokens.purge(), (1, 1))
+        self.assertQuerySetEqual(
+            OutstandingToken.objects.values_list("jti", flat=True),
+            [kept["jti"]],
+        )
+
+        self.user.tokens_valid_after = datetime.datetime.now(
+            datetime.timezone.utc
+        ) + datetime.timedelta(seconds=1)
+        self.user.save()
+        self.assertEqual(tokens.purge(), (1, 0))
+
+    def test_purge_is_scheduled(self):
+        entry = settings.CELERY_BEAT_SCHEDULE["purge-tokens"]
+        self.assertEqual(entry["task"], tasks.purge_tokens.name)
+        self.assertIn(entry["task"], app.tasks)
+
+        self.refresh.blacklist()
+        self.user.tokens_valid_after = datetime.datetime.now(
+            datetime.timezone.utc
+        ) + datetime.timedelta(seconds=1)
+        self.user.save()
+        self.assertEqual(tasks.purge_tokens.delay().get(), (1, 1))
+
+    def test_bloom_filter(self):
+        bloom = tokens.BloomFilter(1000)
+        keys = [f"key{i}" for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(f"other{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
@@ -0,0 +1,251 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+
+logger = logging.getLogger(__name__)
+
+# Shared cache key bumped whenever tokens are blacklisted, telling every
+# process to add the new rows to its filter.
+VERSION_KEY = "token_blacklist_version"
+FALSE_POSITIVE_RATE = 0.01
+
+
+class BloomFilter:
+    """
+    Set membership with no false negatives and FALSE_POSITIVE_RATE false
+    positives for up to capacity keys.
+    """
+
+    def __init__(self, capacity: int, error_rate=FALSE_POSITIVE_RATE):
+        self.capacity = max(capacity, 1024)
+        self.count = 0
+        self.size = math.ceil(
+            -self.capacity * math.log(error_rate) / math.log(2) ** 2
+        )
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        # Double hashing: k positions from two 64-bit halves of one digest.
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for index in range(self.hashes):
+            yield (first + index * second) % self.size
+
+    def add(self, key: str) -> None:
+        self.count += 1
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class _Loaded:
+    """
+    A filter with the blacklist version and the last BlacklistedToken row
+    it reflects.
+    """
+
+    def __init__(self, bloom: BloomFilter, version, last_id: int):
+        self.bloom = bloom
+        self.version = version
+        self.last_id = last_id
+        self.loaded_at = time.monotonic()
+
+
+# Serialises additions to the loaded filter; held only for the query of
+# the rows blacklisted since the last one.
+_lock = threading.Lock()
+# Held by the one thread rebuilding the filter.
+_rebuild_lock = threading.Lock()
+_loaded = None
+
+
+def _add(loaded: _Loaded, rows) -> None:
+    for pk, jti in rows:
+        loaded.bloom.add(jti)
+        loaded.last_id = max(loaded.last_id, pk)
+
+
+def _rebuild(version) -> _Loaded:
+    rows = list(
+        BlacklistedToken.objects.filter(
+            token__expires_at__gt=timezone.now()
+        ).values_list("id", "token__jti")
+    )
+    loaded = _Loaded(BloomFilter(len(rows) * 2), version, 0)
+    _add(loaded, rows)
+    return loaded
+
+
+def _add_new(loaded: _Loaded, version) -> None:
+    _add(
+        loaded,
+        BlacklistedToken.objects.filter(id__gt=loaded.last_id).values_list(
+            "id", "token__jti"
+        ),
+    )
+    loaded.version = version
+
+
+def _blacklist_filter() -> BloomFilter:
+    """
+    Return a filter of the blacklisted tokens that have not expired.
+
+    When tokens were blacklisted, the rows added since the last load are
+    read and added to the filter in place. Every
+    TOKEN_BLACKLIST_FILTER_MAX_AGE seconds, or once it holds more keys
+    than it was sized for, one thread rebuilds the filter from scratch,
+    dropping expired tokens and picking up rows committed out of id
+    order, while the others keep using the current one.
+    """
+    global _loaded
+    version = cache.get(VERSION_KEY, 0)
+    loaded = _loaded
+    if loaded is None:
+        with _rebuild_lock:
+            if _loaded is None:
+                _loaded = _rebuild(version)
+            loaded = _loaded
+
+    if (
+        time.monotonic() - loaded.loaded_at
+        > settings.TOKEN_BLACKLIST_FILTER_MAX_AGE
+        or loaded.bloom.count > loaded.bloom.capacity
+    ) and _rebuild_lock.acquire(blocking=False):
+        try:
+            _loaded = loaded = _rebuild(version)
+        finally:
+            _rebuild_lock.release()
+
+    if loaded.version != version:
+        with _lock:
+            if loaded.version != version:
+                _add_new(loaded, version)
+    return loaded.bloom
+
+
+def reset() -> None:
+    """
+    Drop the loaded filter, e.g. between tests.
+    """
+    global _loaded
+    _loaded = None
+
+
+def check_cache() -> None:
+    """
+    Warn when the filters of other processes cannot learn about new
+    blacklisted tokens, because the default cache is process-local.
+    """
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if not settings.DEBUG and isinstance(backend, (LocMemCache, DummyCache)):
+        logger.warning(
+            "The default cache, %s, is not shared between processes: "
+            "tokens blacklisted by one process are accepted by the others "
+            "for up to TOKEN_BLACKLIST_FILTER_MAX_AGE seconds. Configure "
+            "a shared CACHES backend such as Redis or Memcached.",
+            type(backend).__name__,
+        )
+
+
+def is_blacklisted(jti: str) -> bool:
+    """
+    Check the blacklist, querying it only for the few tokens the filter
+    cannot rule out.
+    """
+    if jti not in _blacklist_filter():
+        return False
+    return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+def blacklist_changed() -> None:
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def is_revoked(validated_token, user) -> bool:
+    """
+    Whether the token was issued before the user's last logout from
+    all devices.
+    """
+    if user.tokens_valid_after is None:
+        return False
+    issued_at = validated_token.get("iat", 0)
+    return issued_at < user.tokens_valid_after.timestamp()
+
+
+def revoke_all(user) -> None:
+    """
+    Revoke every token issued to user so far with a single UPDATE.
+
+    Tokens carry their issue time in whole seconds, so the watermark is
+    the start of the current second; refresh tokens issued earlier in
+    that second are blacklisted with one INSERT instead. Access tokens
+    issued in that second stay valid until they expire.
+    """
+    watermark = timezone.now().replace(microsecond=0)
+    with transaction.atomic():
+        user.tokens_valid_after = watermark
+        user.save(update_fields=["tokens_valid_after"])
+        BlacklistedToken.objects.bulk_create(
+            [
+                BlacklistedToken(token_id=token_id)
+                for token_id in OutstandingToken.objects.filter(
+                    user=user, created_at__gte=watermark
+                ).values_list("id", flat=True)
+            ],
+            ignore_conflicts=True,
+        )
+        transaction.on_commit(blacklist_changed)
+
+
+def purge() -> tuple:
+    """
+    Delete outstanding tokens that expired or were revoked by a logout
+    from all devices, with their blacklist entries.
+
+    Returns the numbers of deleted outstanding and blacklisted tokens.
+    """
+    stale = OutstandingToken.objects.filter(
+        Q(expires_at__lte=timezone.now())
+        | Q(user__tokens_valid_after__gt=F("created_at"))
+    )
+    blacklisted, _ = BlacklistedToken.objects.filter(token__in=stale).delete()
+    outstanding, _ = stale.delete()
+    return outstanding, blacklisted
+
+
+class RefreshToken(tokens.RefreshToken):
+    """
+    Refresh token checking the blacklist through the in-memory filter.
+    """
+
+    def check_blacklist(self) -> None:
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
@@ -5,10 +5,7 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.request import Request
-from rest_framework_simplejwt.token_blacklist.models import (
-    OutstandingToken,
-    BlacklistedToken,
-)
+from user import tokens
 from user.serializers import UserSerializer
 
 
@@ -30,8 +27,9 @@ class ResetTokenAPIView(APIView):
     permission_classes = (IsAuthenticated,)
 
     def post(self, request: Request) -> Response:
-        tokens = OutstandingToken.objects.filter(user_id=request.user.id)
-        for token in tokens:
-            BlacklistedToken.objects.get_or_create(token=token)
+        """
+        Log out from all devices by revoking every token issued so far.
+        """
+        tokens.revoke_all(request.user)
 
         return HttpResponseRedirect(reverse("user:token_obtain_pair"))